@@ -0,0 +1,805 @@
+import re
+import time
+import argparse
+from fractions import Fraction
+from music21 import abcFormat, meter
+from bar_notes import Bar, to_ticks
+from extract_notes import REMOVE_GRACE_NOTES, arrange_tune_notes
+
+# Native reader for the common subset of ABC used by our corpus. It follows the music21 ABC tokenizer, measure
+# splitting and repeat expansion step by step, so that read_tune_notes returns exactly what extract_tune_notes returns
+# for the parsed and repeat-expanded score, without building music21 streams. Anything outside that subset (chords,
+# inline or mid-tune fields, voices, clef transpositions, meter changes, overfull bars, incoherent repeats) is
+# reported by returning None, and the caller falls back to converter.parse.
+
+ABC_BARS = [':|1', ':|2', '|]', '||', '[|', '[1', '[2', '|1', '|2', ':|', '|:', '::', '|', ':']
+SPLIT_BARS = {'::': [':|', '|:'], '|1': ['|', '[1'], '|2': ['|', '[2'], ':|1': [':|', '[1'], ':|2': [':|', '[2']}
+REGULAR_BARS = {'|', '[1', '[2'}
+REPEAT_BRACKETS = {'[1': 1, '[2': 2}
+DECORATIONS = '.~^=_HLMOPSTuv'
+SINGLE_CHAR_TOKENS = {'.': 'staccato', 'u': 'upbow', '{': 'grace_start', '}': 'grace_stop', 'v': 'downbow',
+                      'K': 'accent', 'k': 'strongaccent', 'M': 'tenuto'}
+DROPPED_TOKENS = {'w', 'u', 'v', 'v.', 'h', 'H', 'vk', 'uk', 'U', '~', '.', '=', 'V', 'S', 's', 'i', 'I', 'ui', 'u.',
+                  'Q', 'Hy', 'Hx', 'r', 'm', 'M', 'n', 'N', 'o', 'O', 'P', 'l', 'L', 'R', 'y', 'T', 't', 'x', 'Z'}
+EXCLAMATION_TOKENS = {'!crescendo(!': 'cresc', '!crescendo)!': 'paren_stop', '!diminuendo(!': 'dim',
+                      '!diminuendo)!': 'paren_stop'}
+BROKEN_RHYTHMS = {'>': (1.5, 0.5), '<': (0.5, 1.5), '>>': (1.75, 0.25), '<<': (0.25, 1.75), '>>>': (1.875, 0.125),
+                  '<<<': (0.125, 1.875)}
+TUPLET_RATIOS = {'(1': (1, 1), '(2': (2, 3), '(3': (3, 2), '(4': (4, 3), '(5': (5, None), '(6': (6, 2),
+                 '(7': (7, None), '(8': (8, 3), '(9': (9, None)}
+STEPS = 'CDEFGAB'
+CHORD_SYMBOL = re.compile('"[^"]*"')
+PITCH_NAME = re.compile('[a-gA-Gz]')
+MAX_EXPANSIONS = 100
+
+time_signatures = {}
+accent_weights = {}
+
+
+# Raised for anything the native reader does not handle exactly as music21 does.
+class UnsupportedABC(Exception):
+    pass
+
+
+# A token of the ABC body. Note tokens (notes, rests and grace notes) also carry their default length, broken rhythm,
+# tuplet ratio and grace status, which are filled in once the whole tune has been tokenized.
+class Token:
+    __slots__ = ('kind', 'src', 'defaultLength', 'brokenRhythm', 'tuplet', 'grace')
+
+    def __init__(self, kind, src):
+        self.kind = kind
+        self.src = src
+        self.defaultLength = None
+        self.brokenRhythm = None
+        self.tuplet = None
+        self.grace = False
+
+
+# The tokens between two bar lines, with the bar lines on either side.
+class Handler:
+    __slots__ = ('tokens', 'leftBar', 'rightBar')
+
+    def __init__(self, tokens, leftBar=None, rightBar=None):
+        self.tokens = tokens
+        self.leftBar = leftBar
+        self.rightBar = rightBar
+
+    def has_notes(self):
+        return any(token.kind == 'note' for token in self.tokens)
+
+    # Function to join two handlers the way music21 does, keeping the bar lines of the second where both have one.
+    def __add__(self, other):
+        return Handler(self.tokens + other.tokens,
+                       other.leftBar if other.leftBar is not None else self.leftBar,
+                       other.rightBar if other.rightBar is not None else self.rightBar)
+
+
+# A measure as (offset, diatonic note number or None for a rest, quarter length) triples, with its number, padding
+# and repeat bar lines. Copies made during repeat expansion are distinct objects, as brackets refer to measures by
+# identity.
+class Measure:
+    __slots__ = ('number', 'notes', 'duration', 'paddingLeft', 'startRepeat', 'endRepeat', 'hasTimeSignature')
+
+    def __init__(self):
+        self.number = 0
+        self.notes = []
+        self.duration = 0
+        self.paddingLeft = 0
+        self.startRepeat = False
+        self.endRepeat = False
+        self.hasTimeSignature = False
+
+    def copy(self):
+        measure = Measure()
+        measure.number = self.number
+        measure.notes = self.notes
+        measure.duration = self.duration
+        measure.paddingLeft = self.paddingLeft
+        measure.startRepeat = self.startRepeat
+        measure.endRepeat = self.endRepeat
+        measure.hasTimeSignature = self.hasTimeSignature
+        return measure
+
+    def strip_repeats(self):
+        self.startRepeat = False
+        self.endRepeat = False
+
+
+# A first or second ending, spanning the measures added to it while the tune was being read.
+class RepeatBracket:
+    __slots__ = ('number', 'measures', 'complete')
+
+    def __init__(self, number, measure):
+        self.number = number
+        self.measures = [measure]
+        self.complete = False
+
+    def add(self, measure):
+        if not any(m is measure for m in self.measures):
+            self.measures.append(measure)
+
+    def spans(self, measure):
+        return any(m is measure for m in self.measures)
+
+
+# Function to split the ABC text into tokens, following the music21 tokenizer.
+def tokenize(abc):
+    tokens = []
+    length = len(abc)
+    chord_symbol = ''
+    pos = 0
+    while pos < length:
+        c = abc[pos]
+        c_next = abc[pos + 1] if pos + 1 < length else None
+        c_next_next = abc[pos + 2] if pos + 2 < length else None
+        if c == '%':
+            if abc.startswith('%abc-', pos):
+                # A version comment turns on accidental propagation, which changes how music21 reads pitches.
+                raise UnsupportedABC('ABC version comment')
+            end = abc.find('\n', pos + 1)
+            pos = length if end < 0 else end + 1
+            continue
+        if c_next == ':' and c_next_next is not None and c_next_next != '|' and (c == 'w' or (c.isalpha() and c.isupper())):
+            end = abc.find('\n', pos + 1)
+            end = length if end < 0 else end
+            tokens.append(Token('meta', abc[pos:end].strip()))
+            pos = end + 1
+            continue
+        if not c.isspace() and not c.isalnum() and c not in '~(':
+            bar = None
+            for archetype in ABC_BARS:
+                if abc.startswith(archetype, pos):
+                    bar = archetype
+                    break
+            if bar is not None:
+                for src in SPLIT_BARS.get(bar, [bar]):
+                    tokens.append(Token('bar', src))
+                pos += len(bar)
+                continue
+        if c == '(' and c_next is not None and c_next.isdigit():
+            end = pos + 2
+            if end >= length:
+                raise UnsupportedABC('tuplet at the end of the tune')
+            q = abc[end + 1] if end + 1 < length else None
+            if abc[end] == ':':
+                end += 1
+                if q is not None and q.isdigit():
+                    end += 1
+                if end >= length:
+                    raise UnsupportedABC('tuplet at the end of the tune')
+                r = abc[end + 1] if end + 1 < length else None
+                if abc[end] == ':':
+                    end += 1
+                    if r is not None and r.isdigit():
+                        end += 1
+            tokens.append(Token('tuplet', abc[pos:end]))
+            pos = end
+            continue
+        if c in '<>':
+            end = pos + 1
+            while end < length - 1 and abc[end] in '<>':
+                end += 1
+            tokens.append(Token('broken', abc[pos:end]))
+            pos = end
+            continue
+        if c == '!':
+            end = pos + 1
+            while end < pos + 20 and end < length:
+                if abc[end] == '!':
+                    kind = EXCLAMATION_TOKENS.get(abc[pos:end + 1])
+                    if kind is not None:
+                        tokens.append(Token(kind, abc[pos:end + 1]))
+                    pos = end
+                    break
+                end += 1
+            pos += 1
+            continue
+        if c == '(' and c_next is not None:
+            tokens.append(Token('slur', c))
+            pos += 1
+            continue
+        if c == ')':
+            tokens.append(Token('paren_stop', c))
+            pos += 1
+            continue
+        if c == '-':
+            tokens.append(Token('tie', c))
+            pos += 1
+            continue
+        if c == '"':
+            end = pos + 1
+            while end < length - 1 and abc[end] != '"':
+                end += 1
+            chord_symbol += abc[pos:end + 1]
+            pos = end + 1
+            continue
+        if c == '[':
+            raise UnsupportedABC('chord or inline field')
+        if c in SINGLE_CHAR_TOKENS:
+            tokens.append(Token(SINGLE_CHAR_TOKENS[c], c))
+            pos += 1
+            continue
+        if c.isalpha() or c in '~^=_':
+            found_pitch = c.isalpha() and c not in DECORATIONS
+            end = pos + 1
+            while end < length:
+                d = abc[end]
+                if not found_pitch and d in DECORATIONS:
+                    end += 1
+                    if end >= length:
+                        raise UnsupportedABC('decoration at the end of the tune')
+                elif not found_pitch and d.isalpha() and d not in '~wuvhHLTSN':
+                    found_pitch = True
+                    end += 1
+                elif d.isdigit() or d in ",/'":
+                    end += 1
+                else:
+                    break
+            src = chord_symbol + abc[pos:end]
+            chord_symbol = ''
+            pos = end
+            if (src in DROPPED_TOKENS
+                    or (src.startswith('"') and (src[-1] in 'uvkKQ.yTwhx' or src.endswith('v.')))
+                    or src[0] in 'xHZ'
+                    or (len(src) > 1 and src[0] == '=' and src[1].isdigit())):
+                continue
+            tokens.append(Token('note', src))
+            continue
+        pos += 1
+    return tokens
+
+
+# Function to get a cached time signature, which gives the bar duration and beat strengths of a meter.
+def get_time_signature(ratio):
+    time_signature = time_signatures.get(ratio)
+    if time_signature is None:
+        time_signature = meter.TimeSignature(ratio)
+        time_signatures[ratio] = time_signature
+    return time_signature
+
+
+# Function to read the header fields with music21's own field parsing, returning the time signature, and to set the
+# default length, broken rhythm, tuplet ratio and grace status of every note token.
+def process_tokens(tokens):
+    time_signature = None
+    default_length = None
+    tuplet = None
+    grace = False
+    in_body = False
+    for i, token in enumerate(tokens):
+        kind = token.kind
+        if kind == 'meta':
+            if in_body:
+                raise UnsupportedABC('field in the tune body')
+            field = abcFormat.ABCMetadata(token.src)
+            field.preParse()
+            try:
+                if field.tag == 'V':
+                    raise UnsupportedABC('voices')
+                if field.isMeter():
+                    if time_signature is not None:
+                        raise UnsupportedABC('more than one meter')
+                    if field.getTimeSignatureObject() is None:
+                        raise UnsupportedABC('free meter')
+                    numerator, denominator, symbol = field.getTimeSignatureParameters()
+                    time_signature = get_time_signature(f'{numerator}/{denominator}')
+                if field.isDefaultNoteLength() or (field.isMeter() and default_length is None):
+                    default_length = Fraction(field.getDefaultQuarterLength()).limit_denominator(65535)
+                elif field.isKey():
+                    field.getKeySignatureParameters()
+                    field.getKeySignatureObject()
+                    if field.getClefObject()[0] is not None:
+                        raise UnsupportedABC('transposing clef')
+                if field.isTempo():
+                    field.getMetronomeMarkObject()
+            except UnsupportedABC:
+                raise
+            except Exception as e:
+                raise UnsupportedABC(f'header field {token.src!r}: {e}')
+            continue
+        in_body = True
+        if kind == 'broken':
+            if 0 < i < len(tokens) - 1 and tokens[i - 1].kind == 'note' and tokens[i + 1].kind == 'note':
+                tokens[i - 1].brokenRhythm = (token.src, 0)
+                tokens[i + 1].brokenRhythm = (token.src, 1)
+        elif kind == 'tuplet':
+            parts = token.src.split(':')
+            if parts[0] not in TUPLET_RATIOS:
+                raise UnsupportedABC(f'tuplet {token.src!r}')
+            actual, normal = TUPLET_RATIOS[parts[0]]
+            if normal is None:
+                normal = 3 if time_signature is not None and time_signature.beatDivisionCount == 3 else 2
+            if len(parts) >= 2 and parts[1] != '':
+                normal = int(parts[1])
+            count = int(parts[2]) if len(parts) >= 3 and parts[2] != '' else actual
+            tuplet = [actual, normal, count]
+        elif kind == 'grace_start':
+            grace = True
+        elif kind == 'grace_stop':
+            grace = False
+        elif kind == 'note':
+            if default_length is None:
+                raise UnsupportedABC('no default note length')
+            token.defaultLength = default_length
+            token.grace = grace
+            if tuplet is None:
+                pass
+            elif tuplet[2] == 0:
+                tuplet = None
+            else:
+                tuplet[2] -= 1
+                token.tuplet = (tuplet[0], tuplet[1])
+    if time_signature is None:
+        raise UnsupportedABC('no meter')
+    return time_signature
+
+
+# Function to check that a duration is a plain or dotted note value, to which music21 can apply a tuplet.
+def is_simple_length(length):
+    for dots in [Fraction(1), Fraction(3, 2), Fraction(7, 4)]:
+        base = length / dots
+        if base.numerator & (base.numerator - 1) == 0 and base.denominator & (base.denominator - 1) == 0:
+            return True
+    return False
+
+
+# Function to get the diatonic note number (None for a rest) and quarter length of a note token, or None if the note
+# is dropped because its annotation starts with '>'.
+def read_note(token):
+    src = token.src
+    if '"' in src:
+        chord_symbols = list(CHORD_SYMBOL.finditer(src))
+        if not chord_symbols:
+            raise UnsupportedABC('unterminated annotation')
+        src = src[chord_symbols[-1].end():]
+        name = re.sub('[()]', '', chord_symbols[0].group().replace('"', '').strip())
+        if name.startswith('>'):
+            return None
+    names = PITCH_NAME.findall(src)
+    if not names:
+        raise UnsupportedABC(f'note without a pitch {token.src!r}')
+    name = names[0]
+    if name == 'z':
+        value = None
+    else:
+        octave = (5 if name.islower() else 4) - src.count(',') + src.count("'")
+        value = octave * 7 + STEPS.index(name.upper()) + 1
+    length_string = ''.join(c for c in src if c.isdigit() or c == '/')
+    default_length = token.defaultLength
+    try:
+        if length_string == '':
+            length = default_length
+        elif length_string == '/':
+            length = default_length / 2
+        elif length_string == '//':
+            length = default_length / 4
+        elif length_string == '///':
+            length = default_length / 8
+        elif length_string.startswith('/'):
+            length = default_length / int(length_string.split('/')[1])
+        elif length_string.endswith('/'):
+            length = default_length * int(length_string.split('/', maxsplit=1)[0]) / 2
+        elif length_string.count('/') == 2:
+            length = Fraction(1)
+        elif '/' in length_string:
+            numerator, denominator = length_string.split('/')
+            length = default_length * int(numerator) / int(denominator)
+        else:
+            length = default_length * int(length_string)
+    except (ValueError, ZeroDivisionError):
+        raise UnsupportedABC(f'note length {token.src!r}')
+    if token.brokenRhythm is not None:
+        symbol, side = token.brokenRhythm
+        length *= Fraction(BROKEN_RHYTHMS.get(symbol, (1, 1))[side])
+    if token.tuplet is not None:
+        if length <= 0 or not is_simple_length(length):
+            raise UnsupportedABC(f'tuplet note length {token.src!r}')
+        actual, normal = token.tuplet
+        length = length * normal / actual
+    if token.grace:
+        length = Fraction(0)
+    return value, length
+
+
+# Function to split the tokens into handlers at bar lines and at the last field before the first note, following
+# music21's ABCHandler.splitByMeasure.
+def split_by_measure(tokens):
+    bar_indices = [i for i, token in enumerate(tokens)
+                   if token.kind == 'bar' or (token.kind == 'meta' and i + 1 < len(tokens) and tokens[i + 1].kind == 'note')]
+    last = len(tokens) - 1
+    pairs = [(0, bar_indices[0])]
+    start = bar_indices[0]
+    for end in bar_indices[1:]:
+        if end != start + 1:
+            pairs.append((start, end))
+        start = end
+    if start != last:
+        pairs.append((start, last))
+    handlers = []
+    for x, y in pairs:
+        handler = Handler([])
+        x_clip = x
+        y_clip = y
+        if tokens[x].kind == 'bar':
+            if tokens[x].src != ':|':
+                handler.leftBar = tokens[x].src
+            x_clip = x + 1
+        elif x != 0 and tokens[x].kind == 'meta':
+            x_clip = x + 1
+        if tokens[y].kind == 'bar':
+            if tokens[y].src != '|:':
+                handler.rightBar = tokens[y].src
+            y_clip = y - 1
+        elif tokens[y].kind == 'meta':
+            pass
+        elif not (tokens[y].kind == 'note' and y == last):
+            y_clip = y - 1
+        handler.tokens = tokens[x_clip:y_clip + 1]
+        if handler.tokens:
+            handlers.append(handler)
+    return handlers
+
+
+# Function to merge handlers without notes into the handler that follows them, following music21's
+# mergeLeadingMetaData.
+def merge_leading_metadata(handlers):
+    if sum(handler.has_notes() for handler in handlers) <= 1:
+        raise UnsupportedABC('fewer than two measures')
+    merged = []
+    i = 0
+    while i < len(handlers):
+        if not handlers[i].has_notes() and i != len(handlers) - 1:
+            merged.append(handlers[i] + handlers[i + 1])
+            i += 2
+        else:
+            merged.append(handlers[i])
+            i += 1
+    return merged
+
+
+# Function to build the measures of a tune from its handlers, numbering them, padding a pickup measure and collecting
+# the repeat brackets, following music21's abcToStreamPart.
+def build_measures(handlers, time_signature):
+    bar_duration = Fraction(time_signature.barDuration.quarterLength)
+    measures = []
+    brackets = []
+    measure_number = 1
+    for handler in handlers:
+        if not handler.has_notes():
+            continue
+        measure = Measure()
+        if handler.leftBar is not None:
+            measure.startRepeat = handler.leftBar == '|:'
+            bracket_number = REPEAT_BRACKETS.get(handler.leftBar)
+            if bracket_number:
+                open_brackets = [bracket for bracket in brackets if not bracket.complete]
+                if not open_brackets:
+                    bracket = RepeatBracket(bracket_number, measure)
+                    brackets.append(bracket)
+                else:
+                    bracket = open_brackets[0]
+                    bracket.add(measure)
+                    bracket.complete = True
+                if bracket_number == 2:
+                    bracket.complete = True
+        if handler.rightBar == ':|':
+            measure.endRepeat = True
+            open_brackets = [bracket for bracket in brackets if not bracket.complete]
+            if open_brackets:
+                open_brackets[0].add(measure)
+                open_brackets[0].complete = True
+        offset = Fraction(0)
+        for token in handler.tokens:
+            if token.kind == 'meta' and token.src[0] == 'M':
+                measure.hasTimeSignature = True
+            elif token.kind == 'note':
+                note = read_note(token)
+                if note is not None:
+                    value, length = note
+                    measure.notes.append((offset, value, length))
+                    offset += length
+        measure.duration = offset
+        if not measures:
+            if not measure.hasTimeSignature:
+                raise UnsupportedABC('meter not in the first measure')
+            if offset < bar_duration:
+                measure.paddingLeft = bar_duration - offset
+        else:
+            measure.number = measure_number
+            measure_number += 1
+        if offset > bar_duration:
+            # music21 would split the measure in two and change the meter.
+            raise UnsupportedABC('overfull measure')
+        measures.append(measure)
+    return measures, [bracket for bracket in brackets if bracket.complete]
+
+
+# Function to check that start and end repeats are paired, following music21's Expander.repeatBarsAreCoherent.
+def repeat_bars_are_coherent(measures):
+    start_count = 0
+    end_count = 0
+    balance = 0
+    for measure in measures:
+        if measure.startRepeat:
+            start_count += 1
+            balance += 1
+        if measure.endRepeat:
+            if balance == 0:
+                start_count += 1
+                balance += 1
+            end_count += 1
+            balance -= 1
+    return balance in (0, 1) and start_count in (end_count, end_count - 1)
+
+
+# Function to group the repeat brackets of the measures into first/second ending groups.
+def group_repeat_brackets(measures, brackets):
+    groups = []
+    group = []
+    found_numbers = []
+    for measure in measures:
+        for bracket in brackets:
+            if bracket.measures[0] is measure:
+                if bracket.number in found_numbers:
+                    groups.append(group)
+                    found_numbers = []
+                    group = []
+                found_numbers.append(bracket.number)
+                group.append(bracket)
+    groups.append(group)
+    return groups
+
+
+# Function to check that the repeat brackets are numbered consecutively, do not overlap and end in repeat bars
+# where needed, following music21's Expander._repeatBracketsAreCoherent.
+def repeat_brackets_are_coherent(measures, brackets):
+    for group in group_repeat_brackets(measures, brackets):
+        if not group:
+            return True
+        if len(group) > 1:
+            numbers = [bracket.number for bracket in group]
+            if list(range(1, max(numbers) + 1)) != numbers:
+                return False
+        spanned = []
+        for count, bracket in enumerate(group):
+            for measure in bracket.measures:
+                if any(m is measure for m in spanned):
+                    return False
+                spanned.append(measure)
+            if not bracket.measures[-1].endRepeat and (len(group) == 1 or count < len(group) - 1):
+                return False
+    return True
+
+
+# Function to find the indices of the innermost repeated measures.
+def innermost_repeat_indices(measures):
+    starts = []
+    for i, measure in enumerate(measures):
+        if measure.startRepeat:
+            starts.append(i)
+        if measure.endRepeat:
+            return list(range(starts[-1] if starts else 0, i + 1))
+    return []
+
+
+# Function to repeat the passed measures, or the innermost repeat if none are passed, following music21's
+# Expander.processInnermostRepeatBars.
+def expand_innermost_repeat(measures, repeat_indices=None, repeat_times=None, expansion_only=False):
+    forced = repeat_indices is not None
+    if not forced:
+        repeat_indices = innermost_repeat_indices(measures)
+    expanded = []
+    strip_next = False
+    i = 0
+    while i < len(measures) and repeat_indices:
+        if i == repeat_indices[0]:
+            last_measure = end_measure = None
+            last_index = repeat_indices[-1]
+            if measures[last_index].endRepeat:
+                last_measure = end_measure = measures[last_index]
+                times = 2
+            elif not forced:
+                raise UnsupportedABC('repeat without an end bar')
+            else:
+                times = 0
+            if repeat_times is None:
+                repeat_times = times
+            for time in range(repeat_times):
+                for j in repeat_indices:
+                    copy = measures[j].copy()
+                    if j == repeat_indices[0] or j == last_index:
+                        copy.strip_repeats()
+                    expanded.append(copy)
+            if last_measure is not end_measure:
+                strip_next = True
+            i = last_index + 1
+        else:
+            if not expansion_only:
+                if strip_next:
+                    measures[i].strip_repeats()
+                    strip_next = False
+                expanded.append(measures[i])
+            i += 1
+    return expanded
+
+
+# Function to expand the innermost repeat, together with its first and second endings if it has them, following
+# music21's Expander._processInnermostRepeatsAndBrackets.
+def expand_innermost_repeat_and_brackets(measures, brackets, expanded_brackets):
+    innermost = innermost_repeat_indices(measures)
+    group_focus = None
+    for group in group_repeat_brackets(measures, brackets):
+        if not innermost:
+            continue
+        first = measures[innermost[0]]
+        last = measures[innermost[-1]]
+        for bracket in group:
+            if id(bracket) in expanded_brackets:
+                break
+            elif bracket.spans(first) or bracket.spans(last):
+                group_focus = group
+                break
+        if group_focus is not None:
+            break
+    if group_focus is None:
+        return expand_innermost_repeat(measures)
+    boundaries = []
+    for bracket in group_focus:
+        expanded_brackets.add(id(bracket))
+        end_index = None
+        bracket_start_index = None
+        for i, measure in enumerate(measures):
+            if measure is bracket.measures[-1]:
+                end_index = i
+            if measure is bracket.measures[0]:
+                bracket_start_index = i
+        if end_index is None or bracket_start_index is None:
+            raise UnsupportedABC('repeat bracket outside the expanded measures')
+        indices = list(range(innermost[0], end_index + 1))
+        for previous_indices in boundaries:
+            for q in previous_indices[1]:
+                if q in indices:
+                    indices.remove(q)
+        boundaries.append((indices, list(range(bracket_start_index, end_index + 1))))
+    expansions = []
+    for indices, bracket_indices in boundaries:
+        if not indices:
+            raise UnsupportedABC('empty repeat bracket')
+        expansions.append(expand_innermost_repeat(measures, indices, 1, expansion_only=True))
+        highest_index = max(indices)
+    expanded = measures[:innermost[0]]
+    for expansion in expansions:
+        for measure in expansion:
+            measure.strip_repeats()
+            expanded.append(measure)
+    return expanded + measures[highest_index + 1:]
+
+
+# Function to expand the repeats and first and second endings of a tune, following music21's Expander.
+def expand_repeats(measures, brackets):
+    if not any(measure.startRepeat or measure.endRepeat for measure in measures):
+        return measures
+    if not repeat_bars_are_coherent(measures) or not repeat_brackets_are_coherent(measures, brackets):
+        raise UnsupportedABC('incoherent repeats')
+    expanded_brackets = set()
+    for i in range(MAX_EXPANSIONS):
+        measures = expand_innermost_repeat_and_brackets(measures, brackets, expanded_brackets)
+        if not any(measure.startRepeat or measure.endRepeat for measure in measures):
+            break
+    return measures
+
+
+# Function to get the beat strength of an offset in a measure, as music21 gives it for a note at that offset.
+def beat_strength(time_signature, position):
+    key = (time_signature.ratioString, position)
+    strength = accent_weights.get(key)
+    if strength is None:
+        strength = time_signature.getAccentWeight(position, forcePositionMatch=True, permitMeterModulus=False)
+        accent_weights[key] = strength
+    return strength
+
+
+# Function to generate the notes in a measure as a Bar, as get_bar_notes does for the music21 measure.
+def measure_bar_notes(measure, time_signature, bar_duration):
+    ticks = []
+    noteValues = []
+    beatStrengths = []
+    durations = []
+    noteIndices = []
+    i = 0
+    for offset, value, length in measure.notes:
+        if value is not None and (not REMOVE_GRACE_NOTES or length > 0):
+            position = offset + measure.paddingLeft
+            if position >= bar_duration:
+                position = position % bar_duration
+            ticks.append(to_ticks(offset * 2))
+            durations.append(float(length * 2))
+            noteValues.append(value)
+            beatStrengths.append(beat_strength(time_signature, position))
+            noteIndices.append(i)
+            i += 1
+    return Bar(ticks, noteValues, beatStrengths, durations, noteIndices)
+
+
+# Function to read the notes in each bar of a cleaned ABC tune without music21, returning the same notes, part labels
+# and eighth notes per bar as extract_tune_notes, or None if the tune uses ABC the native reader does not support.
+def read_tune_notes(abc_content):
+    try:
+        tokens = tokenize(abc_content)
+        time_signature = process_tokens(tokens)
+        if sum(token.kind == 'bar' and token.src in REGULAR_BARS for token in tokens) < 2:
+            raise UnsupportedABC('no measures')
+        measures, brackets = build_measures(merge_leading_metadata(split_by_measure(tokens)), time_signature)
+        measures = expand_repeats(measures, brackets)
+        if not measures or not measures[0].hasTimeSignature:
+            raise UnsupportedABC('expanded tune does not start with the meter')
+    except UnsupportedABC:
+        return None
+    bar_duration = Fraction(time_signature.barDuration.quarterLength)
+    bars = [measure_bar_notes(measure, time_signature, bar_duration) for measure in measures]
+    num, den = time_signature.ratioString.split('/')
+    return arrange_tune_notes(bars, [measure.number for measure in measures], float(num) * 8 / float(den))
+
+
+# Function to compare the native reader with the music21 path on every tune of an ABC file, reporting how many tunes
+# agree, how many fall back to music21 and how long each path takes.
+def check(in_file, verbose=False):
+    from analyse_melodic_structures import parse_tune
+    from process_abc import iter_abc_file, clean_abc
+    matches = 0
+    fallbacks = 0
+    mismatches = 0
+    music21_errors = 0
+    native_time = 0.0
+    music21_time = 0.0
+    for abc_content in iter_abc_file(in_file):
+        start = time.perf_counter()
+        native = read_tune_notes(clean_abc(abc_content))
+        native_time += time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            reference = parse_tune(abc_content)[2:]
+        except Exception:
+            reference = None
+        music21_time += time.perf_counter() - start
+        if native is None:
+            fallbacks += 1
+        elif reference is None:
+            music21_errors += 1
+        elif tune_notes_equal(native, reference):
+            matches += 1
+        else:
+            mismatches += 1
+            if verbose:
+                print("Mismatch:", abc_content.split('\n')[0])
+    num_tunes = matches + fallbacks + mismatches + music21_errors
+    print(f"{num_tunes} tunes: {matches} match, {mismatches} mismatch, {fallbacks} fall back to music21, "
+          f"{music21_errors} read natively where music21 fails")
+    read_natively = num_tunes - fallbacks
+    if read_natively:
+        print(f"Native reader: {native_time / num_tunes * 1E3:.2f} ms/tune, music21: {music21_time / num_tunes * 1E3:.2f} ms/tune")
+    return mismatches
+
+
+# Function to compare two (tune notes, part labels, eighth notes per bar) results bar by bar.
+def tune_notes_equal(a, b):
+    notes_a, labels_a, eighth_notes_a = a
+    notes_b, labels_b, eighth_notes_b = b
+    if labels_a != labels_b or eighth_notes_a != eighth_notes_b or len(notes_a) != len(notes_b):
+        return False
+    for part_a, part_b in zip(notes_a, notes_b):
+        if len(part_a) != len(part_b):
+            return False
+        for bar_a, bar_b in zip(part_a, part_b):
+            if (bar_a.ticks, bar_a.noteValues, bar_a.beatStrengths, bar_a.durations, bar_a.noteIndices) != \
+                    (bar_b.ticks, bar_b.noteValues, bar_b.beatStrengths, bar_b.durations, bar_b.noteIndices):
+                return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the native ABC reader against music21 on an ABC file.")
+    parser.add_argument("-i", "--input", help="Input file", default='ONeills1001.abc')
+    parser.add_argument("-v", "--verbose", help="List the tunes whose notes differ", action="store_true")
+    args = parser.parse_args()
+    check(args.input, args.verbose)
@@ -1,130 +1,14 @@
-import csv
-import re
-from collections import defaultdict
 import argparse
+from evaluation import read_csv_file, f1_scores, evaluate, GroundTruth
 import matplotlib.pyplot as plt
 import numpy as np
 import matplotlib.colors as mcolors
 
 
-def read_csv_file(filename):
-    data = []
-    with open(filename, newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            data.append(row)
-    return data
-
-def extract_bar_patterns(structure_string):
-    # Use regex to split by ',', ';', and '.'
-    #bar_patterns = re.split(r'[,\.;]\s*', structure_string)
-    bar_patterns = re.findall(r'[A-Z]?[a-z][0-9]?', structure_string)
-    # Remove any empty strings that may result from splitting
-    bar_patterns = [pattern for pattern in bar_patterns if pattern]
-    return bar_patterns
-
-
-def strip_number(bar_string):
-    return re.sub(r'\d+', '', bar_string)
-
-
-def create_array(pattern):
-    array = [] * len(pattern)
-    for i in range(0, len(pattern)):
-        full_match = False
-        variant_match = False
-        full_match_element = []
-        variant_match_element = []
-        for j in range(0, i):
-            if pattern[i] == pattern[j] and not full_match:
-                full_match_element = [j, False]
-                full_match = True
-            elif strip_number(pattern[i]) == pattern[j]:
-                variant_match_element = [j , True]
-                variant_match = True
-        if full_match:
-            array.append(full_match_element)
-        elif variant_match:
-            array.append(variant_match_element)
-        else:
-            array.append([i, False])
-    return array
-
-def compare_arrays(script_array, doherty_array):
-    counts = [
-        [0, 0, 0],
-        [0, 0, 0],
-        [0, 0, 0]
-    ]
-    
-    for s, (S, D) in enumerate(zip(script_array, doherty_array)):
-        x, a = S
-        y, b = D
-        
-        if y != s: # Actual full or variant match
-            if x == y: # Actual and prediction refer to same bar.
-                if a == b == False: # Both non-variants
-                    counts[0][0] += 1  # predicted_full_match_actual_full_match
-                elif a == True and b == False:
-                    counts[0][1] += 1  # predicted_variant_match_actual_full_match
-                elif a == False and b == True:
-                    counts[1][0] += 1  # predicted_full_match_actual_variant_match
-                elif a == b == True:
-                    counts[1][1] += 1  # predicted_variant_match_actual_variant_match
-            elif x == s: # Predicted no match
-                if b == False:
-                    counts[0][2] += 1  # predicted_no_match_actual_full_match
-                elif b == True:
-                    counts[1][2] += 1  # predicted_no_match_actual_variant_match
-        else:  # Actual No_match
-            if x != y:
-                if a == False:
-                    counts[2][0] += 1  # predicted_full_match_actual_no_match
-                elif a == True:
-                    counts[2][1] += 1  # predicted_variant_match_actual_no_match
-            elif x == s:
-                counts[2][2] += 1  # predicted_no_match_actual_no_match
-    return counts
-
-
+# Function to compute the confusion matrix of actual against predicted full, variant and no matches of the bars of
+# the A parts of an output.
 def compare(file1_data, file2_data):
-    confusion_matrix = [[0, 0, 0],
-                        [0, 0, 0],
-                        [0, 0, 0]]
-    
-    for row1 in file1_data:
-        tune1 = row1['Tune']
-        part1 = row1['Part']
-        script_structure = row1['Structure']
-        
-        for row2 in file2_data:
-            tune2 = row2['Tune']
-            part2 = row2['Part']
-            doherty_structure = row2['Structure']
-            
-            # A parts only
-            if part1 =="A" and part2 == "A":
-                if tune1 == tune2 and part1 == part2:
-                    # Extract bar patterns
-                    script_patterns = extract_bar_patterns(script_structure)
-                    doherty_patterns = extract_bar_patterns(doherty_structure)
-                    
-                    script_array = create_array(script_patterns)
-                    doherty_array = create_array(doherty_patterns)
-                    
-                    # Compute confusion matrix values for current bar.
-                    result = compare_arrays(script_array, doherty_array)
-                    #if tune1 == '4':
-                    #    print(script_array, doherty_array)
-                    
-                    #n = sum([sum(x) for x in zip(*result)])
-                    #if n != 8:
-                    #    print(f"{tune1}:{row1['Title']}, {n}, {result}")
-                    
-                    # Increment the count for this number of common bar patterns
-                    confusion_matrix = [[confusion_matrix[i][j] + result[i][j] for j in range(3)] for i in range(3)]
-                    break  # break the inner loop since we found a match
-    return confusion_matrix
+    return evaluate(file1_data, GroundTruth(file2_data))['confusion_matrix']
 
 
 def visualize_confusion_matrix(confusion_matrix, method_name, ax):
@@ -210,37 +94,6 @@ def visualize_confusion_matrix(confusion_matrix, method_name, ax):
     return ax
 
 
-def f1_scores(m):
-    """
-    Calculate F1 scores for each class in a multi-class confusion matrix.
-    
-    :param confusion_matrix: 2D numpy array (NxN) representing the confusion matrix
-    :return: Dictionary with class indices as keys and F1 scores as values
-    """
-    confusion_matrix = np.array(m)
-    num_classes = confusion_matrix.shape[0]
-    f1_scores = []
-
-    support = np.sum(confusion_matrix, axis=1)  # Total instances per class
-    total_support = np.sum(support)
-    weighted_f1_sum = 0
-    
-    for i in range(num_classes):
-        tp = confusion_matrix[i, i]  # True Positives
-        fp = sum(confusion_matrix[:, i]) - tp  # False Positives
-        fn = sum(confusion_matrix[i, :]) - tp  # False Negatives
-        
-        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-        recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-        
-        f1 = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
-        f1_scores.append(f1)
-        weighted_f1_sum += f1 * support[i]
-    weighted_avg = weighted_f1_sum / total_support if total_support > 0 else 0
-    f1_scores.append(weighted_avg)
-    return f1_scores
-
-
 def compute_cm_values(file1):
     #file2 = '/home/roro/Documents/RA2/datasets/james/7fefb0fea2a4d00d74f6a3a8eaab81cf-7fb105e18fe0bf0d0c34c53e0ae36e6d53441188/Detail1.csv'
     file2 = 'Detail1.csv'
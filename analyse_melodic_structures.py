@@ -1,56 +1,248 @@
 from extract_notes import extract_tune_notes
-from structure_analysis import analyse_tune
-from process_abc import extract_abc_info, clean_abc, read_abc_file
+from abc_reader import read_tune_notes
+from structure_analysis import analyse_tune, ENGINES
+from process_abc import extract_abc_info, clean_abc, iter_abc_file
+from score_cache import ScoreCache
+from pair_memo import PairMemo, print_memo_report
+from note_store import open_note_store
+import task_pool
+from task_pool import ordered_map, merge_profiles, set_stage, TaskError, WorkerPool
+from timing_report import TimingReport, print_timing_report
+from checkpoint import Journal, JOURNAL_FILE_EXTENSION, journaled_results, params_key
 from music21 import converter
 from tqdm import tqdm
 import pprint
 import argparse
-import concurrent.futures
+import contextlib
+import csv
 import math
+import os
+import shutil
+import tempfile
+import time
 
+ERRORS_FILE_EXTENSION = '.errors.csv'
 
-def process_tune(abc_content, SCORING_METHOD, BEAT_STRENGTH_COEFF, full_match_threshold, variant_match_threshold):
+
+# Function to parse a tune's ABC representation and return its name, number and the notes in each of its bars.
+# If a score cache is passed, the repeat-expanded score is read from it instead of being parsed where possible.
+# If native is set, the tune is read without music21 where the native reader supports it. If cleaned is set, the tune
+# has already been cleaned, as iter_abc_file does when reading it with clean set.
+def parse_tune(abc_content, score_cache=None, native=False, cleaned=False):
     # Remove errors and contents that music21 cannot parse.
-    abc_content = clean_abc(abc_content)
-    # Parse the ABC content
-    abc_score = converter.parse(abc_content, format='abc')
-    # Expand repeats
-    expanded_score = abc_score.expandRepeats()
+    if not cleaned:
+        set_stage('clean')
+        abc_content = clean_abc(abc_content)
+    set_stage('parse')
+    if native:
+        native_notes = read_tune_notes(abc_content)
+        if native_notes is not None:
+            tune_name, tune_number = extract_abc_info(abc_content)
+            return (tune_name, tune_number) + native_notes
+    expanded_score = None
+    if score_cache is not None:
+        cache_key = score_cache.key(abc_content)
+        expanded_score = score_cache.load(cache_key)
+    cache_miss = expanded_score is None
+    if cache_miss:
+        # Parse the ABC content
+        abc_score = converter.parse(abc_content, format='abc')
+        # Expand repeats
+        set_stage('expand')
+        expanded_score = abc_score.expandRepeats()
     tune_name, tune_number = extract_abc_info(abc_content)
     # Generate a list of lists containing the notes in each bar.
+    set_stage('extract')
     tune_notes, part_labels, eighth_notes_per_bar = extract_tune_notes(expanded_score)
+    # Store the score only after extracting the notes, as storing it consumes the score.
+    if score_cache is not None and cache_miss:
+        score_cache.store(cache_key, expanded_score)
     #print(tune_number + ": " + tune_name)
-    #pprint.pprint([[[note['beatStrength'] for note in bar] for bar in part] for part in tune_notes])
+    #pprint.pprint([[bar.beatStrengths for bar in part] for part in tune_notes])
     #if tune_number == '9':
     #    breakpoint()
-    # Generate Doherty structure strings.
-    return analyse_tune(tune_notes, tune_name, tune_number, eighth_notes_per_bar, part_labels, SCORING_METHOD, BEAT_STRENGTH_COEFF, full_match_threshold, variant_match_threshold)
+    return tune_name, tune_number, tune_notes, part_labels, eighth_notes_per_bar
+
+
+# Function to generate the Doherty structure strings of a parsed tune with each of the passed scoring methods, sharing
+# the alignment of each pair of bars between the methods. A method that raises an error on the tune gives a TaskError
+# with the tune number in place of its rows, so that the tune is only left out of that method's output.
+def analyse_tune_methods(tune_name, tune_number, tune_notes, part_labels, eighth_notes_per_bar, SCORING_METHODS, BEAT_STRENGTH_COEFF, full_match_threshold, variant_match_threshold, engine='scalar', candidates=None, pair_memo=None):
+    set_stage('analyse')
+    # Align each pair of bars once and share the alignments between the methods.
+    alignments = {} if len(SCORING_METHODS) > 1 else None
+    results = []
+    for SCORING_METHOD in SCORING_METHODS:
+        start = time.perf_counter()
+        try:
+            results.append(analyse_tune(tune_notes, tune_name, tune_number, eighth_notes_per_bar, part_labels, SCORING_METHOD, BEAT_STRENGTH_COEFF, full_match_threshold, variant_match_threshold, alignments, engine, candidates=candidates, pair_memo=pair_memo))
+        except Exception as e:
+            results.append(TaskError(tune_number, task_pool.current_stage, type(e).__name__ + ": " + str(e), time.perf_counter() - start))
+    return results
+
+
+# Parse a tune once and generate its Doherty structure strings with each of the passed scoring methods.
+def process_tune_methods(abc_content, SCORING_METHODS, BEAT_STRENGTH_COEFF, full_match_threshold, variant_match_threshold, score_cache=None, engine='scalar', native=False, cleaned=False, candidates=None, pair_memo=None):
+    tune = parse_tune(abc_content, score_cache, native, cleaned)
+    return analyse_tune_methods(*tune, SCORING_METHODS, BEAT_STRENGTH_COEFF, full_match_threshold, variant_match_threshold, engine, candidates, pair_memo)
+
+
+# Generate the Doherty structure strings of a tune in a note store with each of the passed scoring methods.
+def process_stored_tune_methods(index, store_dir, SCORING_METHODS, BEAT_STRENGTH_COEFF, full_match_threshold, variant_match_threshold, engine='scalar', candidates=None, pair_memo=None):
+    tune = open_note_store(store_dir).tune(index)
+    return analyse_tune_methods(*tune, SCORING_METHODS, BEAT_STRENGTH_COEFF, full_match_threshold, variant_match_threshold, engine, candidates, pair_memo)
+
+
+# Function to convert a method list such as "0-9" or "0,3,6-8" into a list of scoring method numbers.
+def parse_methods(methods_string):
+    methods = []
+    for item in methods_string.split(','):
+        item = item.strip()
+        if '-' in item:
+            first, last = item.split('-')
+            methods.extend(range(int(first), int(last) + 1))
+        else:
+            methods.append(int(item))
+    return methods
+
+
+# Function to get the output file for a scoring method, either by filling in a "{method}" placeholder or by appending
+# the method number to the file name, e.g. melodic_structures.csv -> melodic_structures3.csv.
+def method_output_file(out_file, scoring_method):
+    if "{method}" in out_file:
+        return out_file.format(method=scoring_method)
+    root, ext = os.path.splitext(out_file)
+    return root + str(scoring_method) + ext
+
+
+# Errors file of a run, with a row per tune, or tune and method, that could not be analysed. The file is only created when
+# the first error is recorded, so that a run without errors leaves no errors file.
+class ErrorsFile:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.writer = None
+        # Remove the errors file of an earlier run, which no longer describes the outputs.
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, row):
+        if self.file is None:
+            self.file = open(self.path, "w", newline='')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(["Tune", "Method", "Stage", "Error", "Elapsed"])
+        self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+# Function to stream the tunes from the input file, initialise the output file, and run a loop to analyse the corpus
+# of tunes. A pool of worker processes can be passed to share it between runs, and if collect is set the rows of each
+# tune with each method are also returned, as a list per method. If memo_dir is set, the scores of pairs of bars are
+# shared across tunes, workers and runs through a pair memo in that directory. A pair memo cannot be used with a pool
+# that is passed, as its workers only write their entries and counts when the pool shuts them down, after the run.
+def main(in_file, out_file, scoring_method, beat_strength_coeff, full_match_threshold, variant_match_threshold, scoring_methods=None, cache_dir=None, cache_size=1024, store_dir=None, engine='scalar', native=False, batch_size=16, max_in_flight=None, journal_file=None, resume=False, incremental=False, timeout=300, timings_file=None, slowest=20, profile_file=None, pool=None, collect=False, candidates=None, memo_dir=None, memo_size=1 << 20):
+    if memo_dir and pool is not None:
+        raise ValueError("a pair memo cannot be used with a pool passed to main, whose workers write their entries "
+                         "and counts only when it shuts down")
+    # Each tune is parsed once and analysed with every requested method, writing one output file per method.
+    if scoring_methods is None:
+        scoring_methods = [scoring_method]
+        out_files = [out_file]
+    else:
+        out_files = [method_output_file(out_file, method) for method in scoring_methods]
+    # The journal and errors files of a run with several methods are named after the output file without its method.
+    run_file = out_file.replace("{method}", "")
+    method_results = [[] for method in scoring_methods] if collect else None
+    score_cache = ScoreCache(cache_dir, cache_size) if cache_dir else None
+    pair_memo = PairMemo(memo_dir, memo_size) if memo_dir else None
+    output_files = [open(file_name, "w") for file_name in out_files]
+    for outputfile in output_files:
+        outputfile.writelines("Tune,Title,Part,Structure" + "\n")
+    # If a journal is requested, or the run resumes or is incremental, record the rows of each finished tune in a
+    # checkpoint journal, from which a resumed or incremental run takes the rows of the tunes that are unchanged since
+    # they were recorded.
+    journal = None
+    if not store_dir and (journal_file or resume or incremental):
+        params_keys = [params_key(method, beat_strength_coeff, full_match_threshold, variant_match_threshold, candidates) for method in scoring_methods]
+        journal = Journal(journal_file or run_file + JOURNAL_FILE_EXTENSION, params_keys, resume, incremental)
 
+    # Tunes that raise an error or time out are left out of the output and recorded in an errors file, and tunes on
+    # which only some methods raise an error are left out of the output of those methods, recorded with the method.
+    errors_file = ErrorsFile(run_file + ERRORS_FILE_EXTENSION)
+    num_errors = 0
+    num_method_errors = 0
 
-# Function to extract a list of tunes from the input file, initialise the output file, and run a loop to analyse the
-# corpus of tunes.
-def main(in_file, out_file, scoring_method, beat_strength_coeff, full_match_threshold, variant_match_threshold):
-    # Open input file & read contents
-    corpus = read_abc_file(in_file)
-    outputfile = open(out_file, "w")
-    outputfile.writelines("Tune,Title,Part,Structure" + "\n")
-    outputfile.close()
+    # Record the time each tune spends in each stage, and profile the workers, if requested.
+    timing_report = TimingReport() if timings_file else None
+    timings = None
+    if timing_report is not None:
+        if store_dir:
+            timings = lambda index, stage_times: timing_report.add(open_note_store(store_dir).tunes[index]['number'], stage_times)
+        else:
+            timings = lambda abc_content, stage_times: timing_report.add(extract_abc_info(abc_content)[1], stage_times)
+    # Only the workers of a pool started for this run can be profiled, as they write their profiles when it shuts down.
+    profile_dir = tempfile.mkdtemp() if profile_file and pool is None else None
 
-    # Use ProcessPoolExecutor to parallelize the tune processing
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        # Submit tasks to the executor for parallel processing, storing the index with the future
-        futures = {executor.submit(process_tune, tune, scoring_method, beat_strength_coeff, full_match_threshold, variant_match_threshold): i for i, tune in enumerate(corpus)}
+    # Use a pool of worker processes to parallelize the tune processing. The tunes are streamed from the input file and
+    # cleaned as they are read, or read from a note store if one is given, and the results are written in corpus order
+    # as soon as they are ready.
+    # The tunes are sent to the workers in batches, with a bounded number of batches in flight.
+    with WorkerPool(profile_dir=profile_dir) if pool is None else contextlib.nullcontext(pool) as pool:
+        if store_dir:
+            results = ordered_map(pool, process_stored_tune_methods, range(len(open_note_store(store_dir))), store_dir, scoring_methods, beat_strength_coeff, full_match_threshold, variant_match_threshold, engine, candidates, pair_memo, batch_size=batch_size, max_in_flight=max_in_flight, timeout=timeout, timings=timings)
+        else:
+            results = journaled_results(journal, iter_abc_file(in_file, clean=True), lambda tunes: ordered_map(pool, process_tune_methods, tunes, scoring_methods, beat_strength_coeff, full_match_threshold, variant_match_threshold, score_cache, engine, native, True, candidates, pair_memo, batch_size=batch_size, max_in_flight=max_in_flight, timeout=timeout, timings=timings))
+        for result in tqdm(results, desc='Analysing Melodic Structures.'):
+            if isinstance(result, TaskError):
+                if store_dir:
+                    tune_number = open_note_store(store_dir).tunes[result.item]['number']
+                else:
+                    tune_number = extract_abc_info(result.item)[1]
+                errors_file.write([tune_number, "", result.stage, result.error, f"{result.elapsed:.3f}"])
+                num_errors += 1
+                continue
+            for method_num, outputfile in enumerate(output_files):
+                if isinstance(result[method_num], TaskError):
+                    method_error = result[method_num]
+                    errors_file.write([method_error.item, scoring_methods[method_num], method_error.stage, method_error.error, f"{method_error.elapsed:.3f}"])
+                    num_method_errors += 1
+                    continue
+                outputfile.write("".join(result[method_num])) # Join list elements into a single string
+                outputfile.flush()
+                if collect:
+                    method_results[method_num].append(result[method_num])
+    errors_file.close()
+    if num_errors:
+        print(f"{num_errors} tunes could not be analysed, see {run_file + ERRORS_FILE_EXTENSION}")
+    if num_method_errors:
+        print(f"{num_method_errors} analyses of a tune with one method failed, see {run_file + ERRORS_FILE_EXTENSION}")
+    for outputfile in output_files:
+        outputfile.close()
+    if journal is not None:
+        journal.close()
+        if resume or incremental:
+            print(f"{journal.hits} tunes taken from the journal, {journal.misses} analysed")
 
-        # Collect results in the correct order using the indices
-        results = [None] * len(corpus)
-        for future in tqdm(concurrent.futures.as_completed(futures), total=len(corpus), desc='Analysing Melodic Structures.'):
-            index = futures[future]
-            results[index] = future.result()
+    if timing_report is not None:
+        print_timing_report(timing_report.write(timings_file, slowest))
+    if profile_dir is not None:
+        merge_profiles(profile_dir, profile_file)
+        shutil.rmtree(profile_dir)
 
-    # Write results to output file in the correct order
-    with open(out_file, "a") as outputfile:
-        for result in results:
-            outputfile.write("".join(result)) # Join list elements into a single string
+    # Keep the score cache within its size limit.
+    if score_cache is not None:
+        score_cache.evict()
+    # Report the hit rate of the pair memo over the workers, which write their counts when the pool stops them, and
+    # keep it within its size limit.
+    if pair_memo is not None:
+        pair_memo.close()
+        print_memo_report(pair_memo.report())
+        pair_memo.evict()
+    return method_results
 
 
 if __name__ == "__main__":
@@ -59,6 +251,39 @@ if __name__ == "__main__":
     parser.add_argument("-i", "--input", help="Input file", default='ONeills1001.abc')
     parser.add_argument("-o", "--output", help="Output file", default='melodic_structures.csv')
     parser.add_argument("-m", "--method", help="Method", type=int, default=0)
+    parser.add_argument("-M", "--methods", help="Methods to run from a single parse of each tune, e.g. 0-9 or 0,3,6-8. "
+                                                "Writes one output file per method.", default=None)
+    parser.add_argument("-c", "--cache-dir", help="Directory in which to cache parsed, repeat-expanded scores", default=None)
+    parser.add_argument("--cache-size", help="Maximum size of the score cache in MB", type=float, default=1024)
+    parser.add_argument("--memo-dir", help="Directory of a memo of the scores of pairs of bars, shared across the tunes, "
+                                           "workers and runs that use it (scalar engine only)", default=None)
+    parser.add_argument("--memo-size", help="Maximum number of pair scores kept in memory by each worker", type=int, default=1 << 20)
+    parser.add_argument("-s", "--store", help="Analyse the tunes in a note store (see note_store.py extract) instead of the input file", default=None)
+    parser.add_argument("-e", "--engine", help="Bar scoring engine: 'scalar' scores one pair of bars at a time, 'matrix' "
+                                               "scores all pairs of bars of a tune at once with NumPy", choices=ENGINES, default='scalar')
+    parser.add_argument("-n", "--native", help="Read the notes of common tunes with the native ABC reader instead of music21, "
+                                               "falling back to music21 for the others", action="store_true")
+    parser.add_argument("--batch-size", help="Number of tunes sent to a worker process at a time", type=int, default=16)
+    parser.add_argument("--max-in-flight", help="Maximum number of batches submitted to the worker processes at a time "
+                                                "(default: 4 per CPU)", type=int, default=None)
+    parser.add_argument("-j", "--journal", help="Checkpoint journal in which to record the rows of each finished tune, "
+                                                "only written if given or with --resume or --incremental (default: the "
+                                                "output file with a .journal extension)", default=None)
+    parser.add_argument("-r", "--resume", help="Resume an interrupted run, taking the rows of the tunes already in the "
+                                               "journal with the same parameters from it", action="store_true")
+    parser.add_argument("--incremental", help="Re-run over a changed corpus, only analysing the tunes whose ABC or "
+                                              "parameters changed since they were recorded in the journal, and "
+                                              "compact the journal to the current corpus", action="store_true")
+    parser.add_argument("-t", "--timeout", help="Seconds after which the analysis of a tune is abandoned and recorded in "
+                                                "the errors file (0 for no limit)", type=float, default=300)
+    parser.add_argument("--timings", help="JSON file to which to write the time each tune spends in each stage, "
+                                          "summarised as percentiles with the slowest tunes, with the times of every "
+                                          "tune in a CSV file beside it", default=None)
+    parser.add_argument("--slowest", help="Number of slowest tunes to list in the timings report", type=int, default=20)
+    parser.add_argument("--profile", help="pstats file to which to write the merged profile of the worker processes", default=None)
+    parser.add_argument("-k", "--candidates", help="Compare each bar only with this many of the most similar earlier bars "
+                                                   "instead of every earlier bar, an approximation for very long tunes "
+                                                   "(see bar_candidates.py)", type=int, default=None)
     parser.add_argument("-b", "--bs_coeff", help="Beat strength coefficient", type=float, default=math.pow(10, 0.2))
     parser.add_argument("-f", "--full_match_threshold", help="Full match threshold", type=float, default=5/6)
     parser.add_argument("-v", "--variant_match_threshold", help="Variant match threshold", type=float, default=3/6)
@@ -72,5 +297,6 @@ if __name__ == "__main__":
     #BEAT_STRENGTH_COEFF = 3.1622
     FULL_MATCH_THRESHOLD = float(args.full_match_threshold)
     VARIANT_MATCH_THRESHOLD = float(args.variant_match_threshold)
+    SCORING_METHODS = parse_methods(args.methods) if args.methods else None
 
-    main(in_file, out_file, SCORING_METHOD, BEAT_STRENGTH_COEFF, FULL_MATCH_THRESHOLD, VARIANT_MATCH_THRESHOLD)
+    main(in_file, out_file, SCORING_METHOD, BEAT_STRENGTH_COEFF, FULL_MATCH_THRESHOLD, VARIANT_MATCH_THRESHOLD, SCORING_METHODS, args.cache_dir, args.cache_size, args.store, args.engine, args.native, args.batch_size, args.max_in_flight, args.journal, args.resume, args.incremental, args.timeout, args.timings, args.slowest, args.profile, candidates=args.candidates, memo_dir=args.memo_dir, memo_size=args.memo_size)
@@ -0,0 +1,122 @@
+import argparse
+import math
+import time
+import numpy as np
+from bar_notes import TICKS_PER_EIGHTH
+
+# Cells of the grid on which bars are embedded, per eighth note.
+CELLS_PER_EIGHTH = 2
+# Weight of the note onsets relative to the pitches in the embedding.
+ONSET_WEIGHT = 2.0
+
+# Counts of the pairs of bars considered by analyse_tune with candidate retrieval in this process, and of those that
+# were candidates and so were scored.
+candidate_stats = {'pairs': 0, 'candidates': 0}
+
+
+# Function to embed each bar of a tune as a transposition-invariant vector on a grid of cells: the pitch sounding in
+# each cell relative to the mean pitch of the bar, followed by the onsets of the notes. Bars that match with or without
+# transposition have nearby vectors.
+def embed_bars(bars, eighth_notes_per_bar):
+    num_cells = max(1, eighth_notes_per_bar * CELLS_PER_EIGHTH)
+    cell_ticks = TICKS_PER_EIGHTH // CELLS_PER_EIGHTH
+    pitches = np.zeros((len(bars), num_cells))
+    sounding = np.zeros((len(bars), num_cells), dtype=bool)
+    onsets = np.zeros((len(bars), num_cells))
+    for b, bar in enumerate(bars):
+        for tick, value, duration in zip(bar.ticks, bar.noteValues, bar.durations):
+            start = min(max(tick // cell_ticks, 0), num_cells - 1)
+            end = min(start + max(1, round(duration * CELLS_PER_EIGHTH)), num_cells)
+            pitches[b, start:end] = value
+            sounding[b, start:end] = True
+            onsets[b, start] = ONSET_WEIGHT
+    counts = sounding.sum(axis=1)
+    means = np.where(counts > 0, (pitches * sounding).sum(axis=1) / np.maximum(counts, 1), 0.0)
+    relative = np.where(sounding, pitches - means[:, None], 0.0)
+    return np.concatenate([relative, onsets], axis=1)
+
+
+# Function to select, for each bar of a tune, the earlier bars with which it is compared: the num_candidates nearest
+# earlier bars in the embedding, along with any as near as the farthest of them, or every earlier bar if there are no
+# more than num_candidates. Returns a set of earlier bar indices per bar.
+def candidate_bars(bars, eighth_notes_per_bar, num_candidates):
+    vectors = embed_bars(bars, eighth_notes_per_bar)
+    squared_norms = (vectors ** 2).sum(axis=1)
+    distances = squared_norms[:, None] + squared_norms[None, :] - 2 * vectors @ vectors.T
+    candidates = []
+    for k in range(len(bars)):
+        if k <= num_candidates:
+            candidates.append(set(range(k)))
+            continue
+        row = distances[k, :k]
+        # Allow for rounding error, so that bars at the same distance are all candidates.
+        cutoff = np.partition(row, num_candidates - 1)[num_candidates - 1] + 1E-9
+        candidates.append(set(np.nonzero(row <= cutoff)[0].tolist()))
+    return candidates
+
+
+# Function to compare the structures found with candidate retrieval against exhaustive search on the tunes of a note
+# store, for each number of candidates. Reports the proportion of output rows that are identical, the proportion of
+# bars that match the same earlier bar in the same way (see evaluation.create_array), which is unaffected by the
+# renaming of later letters after a missed match, the proportion of pairs of bars scored and the time per tune. If
+# medley is more than 1, consecutive tunes are joined into medleys of that many tunes, to give the long tunes the
+# retrieval is meant for.
+def compare_with_exhaustive(store_dir, candidate_counts, SCORING_METHOD, medley=1, beat_strength_coeff=math.pow(10, 0.2)):
+    import bar_candidates
+    from note_store import NoteStore
+    from structure_analysis import analyse_tune
+    from evaluation import create_array, extract_bar_patterns
+    store = NoteStore(store_dir)
+    tunes = [store.tune(index) for index in range(len(store)) if store.tunes[index]['error'] is None]
+    if medley > 1:
+        tunes = [(tunes[i][0], tunes[i][1], [part for tune in tunes[i:i + medley] for part in tune[2]],
+                  [label for tune in tunes[i:i + medley] for label in tune[3]], tunes[i][4])
+                 for i in range(0, len(tunes), medley)]
+
+    def analyse(num_candidates):
+        outputs = []
+        start = time.perf_counter()
+        for tune_name, tune_number, tune_notes, part_labels, eighth_notes_per_bar in tunes:
+            try:
+                outputs.append(analyse_tune(tune_notes, tune_name, tune_number, eighth_notes_per_bar, part_labels, SCORING_METHOD, beat_strength_coeff, 5/6, 3/6, candidates=num_candidates))
+            except (ValueError, IndexError, TypeError):
+                outputs.append(None)
+        return outputs, (time.perf_counter() - start) / len(tunes) * 1E3
+
+    exhaustive, exhaustive_time = analyse(None)
+    num_bars = sum(len(part) for tune in tunes for part in tune[2])
+    print(f"{len(tunes)} tunes of {num_bars / len(tunes):.0f} bars on average, exhaustive search {exhaustive_time:.2f} ms/tune")
+    report = {}
+    for num_candidates in candidate_counts:
+        stats = bar_candidates.candidate_stats
+        stats['pairs'] = stats['candidates'] = 0
+        outputs, candidate_time = analyse(num_candidates)
+        same_rows = total_rows = same_bars = total_bars = 0
+        for exhaustive_rows, rows in zip(exhaustive, outputs):
+            if exhaustive_rows is None or rows is None:
+                continue
+            for exhaustive_row, row in zip(exhaustive_rows, rows):
+                total_rows += 1
+                same_rows += exhaustive_row == row
+                exhaustive_array = create_array(extract_bar_patterns(exhaustive_row.rsplit(',', 1)[1]))
+                array = create_array(extract_bar_patterns(row.rsplit(',', 1)[1]))
+                total_bars += len(exhaustive_array)
+                same_bars += sum(1 for a, b in zip(exhaustive_array, array) if a == b)
+        scored = stats['candidates'] / max(stats['pairs'], 1)
+        report[num_candidates] = {'rows': same_rows / max(total_rows, 1), 'bars': same_bars / max(total_bars, 1),
+                                  'scored': scored, 'time': candidate_time}
+        print(f"{num_candidates:4d} candidates: {same_rows / max(total_rows, 1):7.2%} of rows and {same_bars / max(total_bars, 1):7.2%} "
+              f"of bars agree, {scored:7.2%} of pairs scored, {candidate_time:.2f} ms/tune")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the agreement of candidate retrieval with exhaustive search on "
+                                                 "the tunes of a note store.")
+    parser.add_argument("-s", "--store", help="Note store of the corpus (see note_store.py extract)", default='note_store')
+    parser.add_argument("-k", "--candidates", help="Comma-separated numbers of candidate bars", default='4,8,16,32')
+    parser.add_argument("-m", "--method", help="Method", type=int, default=0)
+    parser.add_argument("--medley", help="Number of consecutive tunes joined into each tune", type=int, default=1)
+    args = parser.parse_args()
+
+    compare_with_exhaustive(args.store, [int(count) for count in args.candidates.split(',')], args.method, args.medley)
@@ -1,13 +1,6 @@
 import math
 from collections import defaultdict
-
-
-# Handy class to allow dot notation access to dict keys.
-class dotdict(dict):
-    """dot.notation access to dictionary attributes"""
-    __getattr__ = dict.get
-    __setattr__ = dict.__setitem__
-    __delattr__ = dict.__delitem__
+from bar_notes import TICKS_PER_EIGHTH
 
 
 EXCLUDE_SHORT_NOTES = False
@@ -23,60 +16,240 @@ CUSTOM_BEAT_STRENGTH = 6
 HARD_CODED_BEAT_STRENGTH_LINEAR = 7
 HARD_CODED_BEAT_STRENGTH_GEOMETRIC = 8
 NEW_RULES = 9
-
-
-# Compute the match scores of a pair of bars.
-def bar_match_scores(bar, prev_notes, eighth_notes_per_bar, SCORING_METHOD, beat_strength_coeff):
-    if SCORING_METHOD == BASIC:
-        return score_basic(bar, prev_notes)
-    if SCORING_METHOD == REQUIRE_1st_NOTE:
-        return score_require_first_note(bar, prev_notes)
-    if SCORING_METHOD == REQUIRE_1st_AND_4th_NOTES:
-        return score_require_first_and_fourth_notes(bar, prev_notes)
-    if SCORING_METHOD == LCP:
-        return score_longest_common_prefix(bar, prev_notes)
-    if SCORING_METHOD == CONTIGUOUS_NOTES:
-        return score_longest_contiguous_match(bar, prev_notes)
-    if SCORING_METHOD == DIV_BY_TRSPS_AMT:
-        return score_div_by_transposition_amount(bar, prev_notes)
-    if SCORING_METHOD == CUSTOM_BEAT_STRENGTH:
-        return score_beat_strength_sum2(bar, prev_notes, beat_strength_coeff)
-    if SCORING_METHOD == HARD_CODED_BEAT_STRENGTH_LINEAR:
-        return score_beat_strength_sum3(bar, prev_notes, eighth_notes_per_bar)
-    if SCORING_METHOD == HARD_CODED_BEAT_STRENGTH_GEOMETRIC:
-        return score_beat_strength_sum4(bar, prev_notes, eighth_notes_per_bar, beat_strength_coeff)
-    if SCORING_METHOD == NEW_RULES:
-        return score_new_rules(bar, prev_notes)
-
-
-def score_basic(bar, prev_notes):
-    bar_duration = max(sum([n.duration for n in bar]), sum([n.duration for n in prev_notes]))
+# Methods whose scores depend on the beat strength coefficient.
+COEFF_METHODS = (CUSTOM_BEAT_STRENGTH, HARD_CODED_BEAT_STRENGTH_GEOMETRIC)
+
+# Beat weightings of each eighth note in a bar, by the number of eighth notes per bar. The linear weightings are used
+# as they are and the geometric weightings as powers of the beat strength coefficient.
+LINEAR_BEAT_WEIGHTINGS = {
+    1: [1],
+    2: [3, 1],
+    3: [3, 1, 1],
+    4: [4, 1, 2, 1],
+    5: [5, 1, 1, 1, 1],  # I made this one up.
+    6: [6, 1, 2, 4, 1, 2],
+    7: [6, 1, 1, 1, 1, 1, 1], # I made this one up.
+    8: [6, 1, 2, 1, 4, 1, 2, 1],
+    9: [6, 1, 2, 4, 1, 2, 4, 1, 2]
+}
+GEOMETRIC_BEAT_WEIGHTINGS = {
+    1: [1],
+    2: [0, -2],
+    3: [0, -2, -2],
+    4: [0, -3, -2, -3],
+    5: [0, -4, -4, -4, -4],  # I made this one up.
+    6: [0, -5, -4, -2, -5, -4],
+    7: [0, -5, -5, -5, -5, -5, -5], # I made this one up.
+    8: [0, -5, -4, -5, -2, -5, -4, -5],
+    9: [0, -5, -4, -2, -5, -4, -2, -5, -4]
+}
+
+
+# Compute the match scores of a pair of bars. If a dict of alignments is passed, the alignment of the pair is stored in
+# it and reused when the same pair is scored again, e.g. by another method. To score many pairs, make one scorer with
+# make_scorer and call its match_scores method, so that the features of each bar are computed only once.
+def bar_match_scores(bar, prev_notes, eighth_notes_per_bar, SCORING_METHOD, beat_strength_coeff, alignments=None):
+    return make_scorer(SCORING_METHOD, eighth_notes_per_bar, beat_strength_coeff).match_scores(bar, prev_notes, alignments)
+
+
+# Function to make the scorer of a scoring method for tunes with the passed number of eighth notes per bar.
+def make_scorer(SCORING_METHOD, eighth_notes_per_bar, beat_strength_coeff):
+    scorer_class = SCORERS.get(SCORING_METHOD)
+    if scorer_class is None:
+        raise ValueError("Unknown scoring method " + str(SCORING_METHOD))
+    return scorer_class(eighth_notes_per_bar, beat_strength_coeff)
+
+
+# Scores pairs of bars with one scoring method. Features of a single bar, such as beat strength weights, are computed by
+# compute_features the first time they are needed and reused for every other pair the bar takes part in, so a scorer
+# should be used for the bars of one tune.
+class Scorer:
+    method = None
+
+    def __init__(self, eighth_notes_per_bar, beat_strength_coeff):
+        self.eighth_notes_per_bar = eighth_notes_per_bar
+        self.beat_strength_coeff = beat_strength_coeff
+        self.bar_features = {}
+
+    # Function to return the features of a bar, computing them on first use.
+    def features(self, bar):
+        features = self.bar_features.get(bar)
+        if features is None:
+            features = self.compute_features(bar)
+            self.bar_features[bar] = features
+        return features
+
+    def compute_features(self, bar):
+        return None
+
+    # Function to compute the full match, partial match and transposition scores of a pair of bars.
+    def match_scores(self, bar, prev_notes, alignments=None):
+        if alignments is None:
+            alignment = align_bars(bar, prev_notes)
+        else:
+            alignment = alignments.get((bar, prev_notes))
+            if alignment is None:
+                alignment = align_bars(bar, prev_notes)
+                alignments[(bar, prev_notes)] = alignment
+        return self.scores(bar, prev_notes, alignment)
+
+    def scores(self, bar, prev_notes, alignment):
+        raise NotImplementedError
+
+
+# Counts of the bars and pairs of bars seen by every BarIndex in this process: bars that exactly repeat or transpose an
+# earlier bar of their tune, pairs of bars scored and pairs whose scores were taken from the index.
+bar_index_stats = {'bars': 0, 'repeats': 0, 'transpositions': 0, 'pairs': 0, 'hits': 0}
+
+
+# Function to compute the fingerprint of a bar: its rhythm, beat strengths and note indices with its note values
+# relative to the first, which exact transpositions of the bar share, and the value of its first note.
+def bar_fingerprint(bar):
+    values = bar.noteValues
+    first_value = values[0] if len(values) > 0 else 0
+    shape = (tuple(bar.ticks), tuple([value - first_value for value in values]), tuple(bar.beatStrengths),
+             tuple(bar.durations), tuple(bar.noteIndices))
+    return shape, first_value
+
+
+# Index of the bars of a tune by fingerprint, which scores each pair of bars with a scorer unless a pair of bars with
+# the same fingerprints and the same difference between their first notes has been scored before. The scores of every
+# method depend on the note values of a pair only through their differences and the equality of their first notes, so
+# such pairs have identical scores, and exact repeats and transpositions of earlier bars are scored in O(1). If a pair
+# memo is passed (see pair_memo.PairMemo), pairs not scored before in the tune are looked up in it, and added to it once
+# scored, so that bars shared by different tunes are scored once.
+class BarIndex:
+    def __init__(self, scorer, bars, pair_memo=None):
+        self.scorer = scorer
+        self.method = scorer.method
+        self.keys = {}
+        self.scores = {}
+        self.memo_table = None
+        shape_ids = {}
+        seen = set()
+        for bar in bars:
+            shape, first_value = bar_fingerprint(bar)
+            shape_id = shape_ids.setdefault(shape, len(shape_ids))
+            if (shape_id, first_value) in seen:
+                bar_index_stats['repeats'] += 1
+            elif shape_id < len(shape_ids) - 1:
+                bar_index_stats['transpositions'] += 1
+            seen.add((shape_id, first_value))
+            self.keys[bar] = (shape_id, first_value)
+        bar_index_stats['bars'] += len(bars)
+        if pair_memo is not None:
+            self.memo_table = pair_memo.table()
+            self.scorer_key = pair_memo.scorer_key(scorer)
+            self.shape_keys = [pair_memo.shape_key(shape) for shape in shape_ids]
+
+    # Function to compute the full match, partial match and transposition scores of a pair of bars of the tune.
+    def match_scores(self, bar, prev_notes, alignments=None):
+        shape_id, first_value = self.keys[bar]
+        prev_shape_id, prev_first_value = self.keys[prev_notes]
+        key = (shape_id, prev_shape_id, first_value - prev_first_value)
+        bar_index_stats['pairs'] += 1
+        scores = self.scores.get(key)
+        if scores is None:
+            if self.memo_table is None:
+                scores = self.scorer.match_scores(bar, prev_notes, alignments)
+            else:
+                memo_key = (self.scorer_key, self.shape_keys[shape_id], self.shape_keys[prev_shape_id], key[2])
+                scores = self.memo_table.get(memo_key)
+                if scores is None:
+                    scores = self.scorer.match_scores(bar, prev_notes, alignments)
+                    self.memo_table.put(memo_key, scores)
+            self.scores[key] = scores
+        else:
+            bar_index_stats['hits'] += 1
+        return scores
+
+
+# The notes of two bars which have the same offsets, as parallel lists of note value differences, shortest durations
+# and positions of the notes in the current bar, along with the larger of the two bar durations. indexed_length is the
+# number of leading pairs whose note indices in both bars equal their position in the pairs, which are the pairs used
+# by the prefix and contiguous methods.
+class Alignment:
+    __slots__ = ('diffs', 'durations', 'positions', 'indexed_length', 'bar_duration')
+
+    # Function to return the note value differences and durations of the pairs, optionally excluding pairs in which
+    # either note is shorter than an eighth note.
+    def pairs(self, exclude_short_notes=False):
+        if not exclude_short_notes:
+            return self.diffs, self.durations
+        long_pairs = [(diff, duration) for diff, duration in zip(self.diffs, self.durations) if duration >= 1]
+        return [diff for diff, duration in long_pairs], [duration for diff, duration in long_pairs]
+
+    # Function to return the note value differences and durations of the pairs with consecutive note indices.
+    def indexed_pairs(self):
+        return self.diffs[:self.indexed_length], self.durations[:self.indexed_length]
+
+    # Function to return the offsets (in ticks) of the pairs.
+    def ticks(self, bar):
+        bar_ticks = bar.ticks
+        return [bar_ticks[i] for i in self.positions]
+
+
+# Function to align the notes of two bars on their offsets.
+def align_bars(bar, prev_notes):
+    b_ticks, p_ticks = bar.ticks, prev_notes.ticks
+    b_values, p_values = bar.noteValues, prev_notes.noteValues
+    b_durations, p_durations = bar.durations, prev_notes.durations
+    b_indices, p_indices = bar.noteIndices, prev_notes.noteIndices
+    b_length, p_length = len(b_ticks), len(p_ticks)
+    diffs = []
+    durations = []
+    positions = []
+    indexed_length = -1
     i, j = 0, 0
-    pairs = []
     # Iterate over both lists in single loop. (Offsets are ordered.)
-    while i < len(bar) and j < len(prev_notes):
-        if bar[i].offset == prev_notes[j].offset:
+    while i < b_length and j < p_length:
+        if b_ticks[i] == p_ticks[j]:
+            # The pairs with consecutive note indices end at the first pair whose note indices differ from its position.
+            if indexed_length < 0 and (b_indices[i] != len(diffs) or p_indices[j] != len(diffs)):
+                indexed_length = len(diffs)
             # If the offset values match, subtract note values and store in the result
-            note_diff = bar[i].noteValue - prev_notes[j].noteValue
-            if not EXCLUDE_SHORT_NOTES or (bar[i].duration >= 1 and prev_notes[j].duration >= 1):
-                pairs.append(dotdict({'diff': note_diff, 'duration': min(bar[i].duration, prev_notes[j].duration)}))
+            diffs.append(b_values[i] - p_values[j])
+            durations.append(min(b_durations[i], p_durations[j]))
+            positions.append(i)
             i += 1
             j += 1
-        elif bar[i]['offset'] < prev_notes[j]['offset']:
+        elif b_ticks[i] < p_ticks[j]:
             # Increment i if bar has a smaller offset
             i += 1
         else:
             # Increment j if prev_notes has a smaller offset
             j += 1
-    proportion_in_common = sum([n.duration for n in pairs if n.diff == 0])/bar_duration
-    full_match_score = proportion_in_common
-    # For partial match (transposition allowed)
+    alignment = Alignment()
+    alignment.diffs = diffs
+    alignment.durations = durations
+    alignment.positions = positions
+    alignment.indexed_length = len(diffs) if indexed_length < 0 else indexed_length
+    alignment.bar_duration = max(bar.duration, prev_notes.duration)
+    return alignment
+
+
+# Function to find the note difference with the largest aggregate duration, preferring the smallest difference on ties.
+def most_prevalent_diff(diffs, durations):
     diff_durations = defaultdict(float)
     # Find aggregate duration for each diff value.
-    if len(pairs) > 0:
-        for i in pairs:
-            diff_durations[i['diff']] += i['duration']
-        most_prevalent_delta = max(diff_durations.items(), key=lambda x: (x[1], -x[0]))
+    for diff, duration in zip(diffs, durations):
+        diff_durations[diff] += duration
+    return max(diff_durations.items(), key=lambda x: (x[1], -x[0]))
+
+
+# Function to find the total duration of the pairs with the passed note difference.
+def diff_duration_sum(diffs, durations, diff_value):
+    return sum([duration for diff, duration in zip(diffs, durations) if diff == diff_value])
+
+
+def score_basic(bar, prev_notes, alignment):
+    bar_duration = alignment.bar_duration
+    diffs, durations = alignment.pairs(EXCLUDE_SHORT_NOTES)
+    proportion_in_common = diff_duration_sum(diffs, durations, 0)/bar_duration
+    full_match_score = proportion_in_common
+    # For partial match (transposition allowed)
+    if len(diffs) > 0:
+        most_prevalent_delta = most_prevalent_diff(diffs, durations)
         partial_match_score = most_prevalent_delta[1] / bar_duration
         transposition_amount = abs(most_prevalent_delta[0])
     else:
@@ -85,39 +258,20 @@ def score_basic(bar, prev_notes):
     return full_match_score, partial_match_score, transposition_amount
 
 
-def score_require_first_note(bar, prev_notes):
-    bar_duration = max(sum([n.duration for n in bar]), sum([n.duration for n in prev_notes]))
-    i, j = 0, 0
-    pairs = []
-    # Iterate over both lists in single loop. (Offsets are ordered.)
-    while i < len(bar) and j < len(prev_notes):
-        if bar[i].offset == prev_notes[j].offset:
-            # If the offset values match, subtract note values and store in the result
-            note_diff = bar[i].noteValue - prev_notes[j].noteValue
-            pairs.append(dotdict({'diff': note_diff, 'offset': bar[i].offset, 'duration': min(bar[i].duration, prev_notes[j].duration)}))
-            i += 1
-            j += 1
-        elif bar[i]['offset'] < prev_notes[j]['offset']:
-            # Increment i if bar has a smaller offset
-            i += 1
-        else:
-            # Increment j if prev_notes has a smaller offset
-            j += 1
-    proportion_in_common = sum([n.duration for n in pairs if n.diff == 0])/bar_duration
+def score_require_first_note(bar, prev_notes, alignment):
+    bar_duration = alignment.bar_duration
+    diffs, durations = alignment.pairs()
+    proportion_in_common = diff_duration_sum(diffs, durations, 0)/bar_duration
 
-    if bar[0] != prev_notes[0] or pairs[0].offset != 0:
+    if bar.note(0) != prev_notes.note(0) or bar.ticks[alignment.positions[0]] != 0:
         full_match_score = 0
     else:
         full_match_score = proportion_in_common
 
     # For partial match (transposition allowed)
-    diff_durations = defaultdict(float)
-    # Find aggregate duration for each diff value.
-    for i in pairs:
-        diff_durations[i.diff] += i.duration
-    most_prevalent_delta = max(diff_durations.items(), key=lambda x: (x[1], -x[0]))
+    most_prevalent_delta = most_prevalent_diff(diffs, durations)
 
-    if pairs[0].diff != most_prevalent_delta[0] or pairs[0].offset != 0:
+    if diffs[0] != most_prevalent_delta[0] or bar.ticks[alignment.positions[0]] != 0:
         partial_match_score = 0
         transposition_amount = 0
     else:
@@ -126,43 +280,25 @@ def score_require_first_note(bar, prev_notes):
     return full_match_score, partial_match_score, transposition_amount
 
 
-def score_require_first_and_fourth_notes(bar, prev_notes):
-    bar_duration = max(sum([n.duration for n in bar]), sum([n.duration for n in prev_notes]))
-    i, j = 0, 0
-    pairs = []
-    # Iterate over both lists in single loop. (Offsets are ordered.)
-    while i < len(bar) and j < len(prev_notes):
-        if bar[i].offset == prev_notes[j].offset:
-            # If the offset values match, subtract note values and store in the result
-            note_diff = bar[i].noteValue - prev_notes[j].noteValue
-            pairs.append(dotdict({'diff': note_diff, 'offset': bar[i].offset, 'duration': min(bar[i].duration, prev_notes[j].duration)}))
-            i += 1
-            j += 1
-        elif bar[i]['offset'] < prev_notes[j]['offset']:
-            # Increment i if bar has a smaller offset
-            i += 1
-        else:
-            # Increment j if prev_notes has a smaller offset
-            j += 1
-    proportion_in_common = sum([n.duration for n in pairs if n.diff == 0])/bar_duration
+def score_require_first_and_fourth_notes(bar, prev_notes, alignment):
+    bar_duration = alignment.bar_duration
+    diffs, durations = alignment.pairs()
+    proportion_in_common = diff_duration_sum(diffs, durations, 0)/bar_duration
 
-    middle_note_offset = int(bar_duration/2)
+    ticks = alignment.ticks(bar)
+    middle_note_tick = int(bar_duration/2) * TICKS_PER_EIGHTH
     # Find the middle note.
-    middle_diff = next((pair.diff for pair in pairs if pair.offset == middle_note_offset), None)
+    middle_diff = next((diff for diff, tick in zip(diffs, ticks) if tick == middle_note_tick), None)
 
-    if pairs[0].diff != 0 or pairs[0].offset != 0 or middle_diff != 0:
+    if diffs[0] != 0 or ticks[0] != 0 or middle_diff != 0:
         full_match_score = 0
     else:
         full_match_score = proportion_in_common
 
     # For partial match (transposition allowed)
-    diff_durations = defaultdict(float)
-    # Find aggregate duration for each diff value.
-    for i in pairs:
-        diff_durations[i.diff] += i.duration
-    most_prevalent_delta = max(diff_durations.items(), key=lambda x: (x[1], -x[0]))
+    most_prevalent_delta = most_prevalent_diff(diffs, durations)
 
-    if pairs[0].diff != most_prevalent_delta[0] or pairs[0].offset != 0 or middle_diff != most_prevalent_delta[0]:
+    if diffs[0] != most_prevalent_delta[0] or ticks[0] != 0 or middle_diff != most_prevalent_delta[0]:
         partial_match_score = 0
         transposition_amount = 0
     else:
@@ -171,38 +307,14 @@ def score_require_first_and_fourth_notes(bar, prev_notes):
     return full_match_score, partial_match_score, transposition_amount
 
 
-def score_longest_common_prefix(bar, prev_notes):
-    bar_duration = max(sum([n.duration for n in bar]), sum([n.duration for n in prev_notes]))
-    i, j = 0, 0
-    pairs = []
-    index_b = 0
-    index_p = 0
-    # Iterate over both lists in single loop. (Offsets are ordered.)
-    while i < len(bar) and j < len(prev_notes):
-        if bar[i].offset == prev_notes[j].offset:
-            if bar[i].noteIndex == index_b and prev_notes[j].noteIndex == index_p:
-                # If the offset values match, subtract note values and store in the result
-                note_diff = bar[i].noteValue - prev_notes[j].noteValue
-                pairs.append(dotdict({'diff': note_diff, 'duration': min(bar[i].duration, prev_notes[j].duration), 'beatStrength': bar[i].beatStrength, 'index': index_b}))
-                i += 1
-                j += 1
-                index_b += 1
-                index_p += 1
-            else:
-                break
-        elif bar[i].offset < prev_notes[j].offset:
-            # Increment i if bar has a smaller offset
-            i += 1
-        else:
-            # Increment j if prev_notes has a smaller offset
-            j += 1
+def score_longest_common_prefix(bar, prev_notes, alignment):
+    bar_duration = alignment.bar_duration
+    diffs, durations = alignment.indexed_pairs()
 
     duration_sum = 0
-    index = 0
-    for p in pairs:
-        if p.diff == 0 and p.index == index:
-            duration_sum += p.duration
-            index += 1
+    for diff, duration in zip(diffs, durations):
+        if diff == 0:
+            duration_sum += duration
         else:
             break
     full_match_score = duration_sum / bar_duration
@@ -210,18 +322,18 @@ def score_longest_common_prefix(bar, prev_notes):
     first_diff = None
     duration_sum = 0
     index = 0
-    for p in pairs:
-        if p.index == 0:
-            first_diff = p.diff
+    for pair_index, (diff, duration) in enumerate(zip(diffs, durations)):
+        if pair_index == 0:
+            first_diff = diff
             index += 1
-        if p.diff == first_diff and p.index == index:
-            duration_sum += p.duration
+        if diff == first_diff and pair_index == index:
+            duration_sum += duration
             index += 1
         else:
             break
-    if len(pairs) > 0:
+    if len(diffs) > 0:
         partial_match_score = duration_sum / bar_duration
-        transposition_amount = abs(pairs[0].diff)
+        transposition_amount = abs(diffs[0])
     else:
         partial_match_score = 0
         transposition_amount = 0
@@ -229,24 +341,23 @@ def score_longest_common_prefix(bar, prev_notes):
 
 
 # Function to find the duration of the longest set of contiguous notes with the same diff value.
-# Concern: Because the index attribute is based on the current bar, this type of bar matching is not necessarily
-# commutative.
-def largest_consecutive_duration_sum(pairs):
-    if not pairs:
+# Concern: Because the pairs are indexed on the current bar, this type of bar matching is not necessarily commutative.
+def largest_consecutive_duration_sum(diffs, durations):
+    if not diffs:
         return 0, float('inf')
     max_sum = 0
     max_diff = None
-    current_sum = pairs[0].duration
-    current_diff = pairs[0].diff
-    for i in range(1, len(pairs)):
-        if pairs[i].diff == current_diff and pairs[i].index == pairs[i - 1].index + 1:
-            current_sum += pairs[i].duration
+    current_sum = durations[0]
+    current_diff = diffs[0]
+    for i in range(1, len(diffs)):
+        if diffs[i] == current_diff:
+            current_sum += durations[i]
             if current_sum > max_sum:
                 max_sum = current_sum
                 max_diff = current_diff
         else:
-            current_sum = pairs[i].duration
-            current_diff = pairs[i].diff
+            current_sum = durations[i]
+            current_diff = diffs[i]
     # Check if the last sequence is the largest
     if current_sum > max_sum:
         max_sum = current_sum
@@ -255,88 +366,40 @@ def largest_consecutive_duration_sum(pairs):
 
 
 # Find the duration of the longest sequence of notes with a zero diff value.
-def largest_zero_diff_consecutive_duration_sum(pairs):
-    if not pairs:
+def largest_zero_diff_consecutive_duration_sum(diffs, durations):
+    if not diffs:
         return 0
     max_sum = 0
     current_sum = 0
-    last_index = None
-    for pair in pairs:
-        if pair.diff == 0:
-            if last_index is None or pair.index == last_index + 1:
-                current_sum += pair.duration
-                max_sum = max(max_sum, current_sum)
-            else:
-                current_sum = pair.duration
-            last_index = pair.index
+    for diff, duration in zip(diffs, durations):
+        if diff == 0:
+            current_sum += duration
+            max_sum = max(max_sum, current_sum)
         else:
             current_sum = 0
-            last_index = None
     return max_sum
 
 
-def score_longest_contiguous_match(bar, prev_notes):
-    bar_duration = max(sum([n.duration for n in bar]), sum([n.duration for n in prev_notes]))
-    i, j = 0, 0
-    pairs = []
-    index_b = 0
-    index_p = 0
-    # Iterate over both lists in single loop. (Offsets are ordered.)
-    while i < len(bar) and j < len(prev_notes):
-        if bar[i].offset == prev_notes[j].offset:
-            if bar[i].noteIndex == index_b and prev_notes[j].noteIndex == index_p:
-                # If the offset values match, subtract note values and store in the result
-                note_diff = bar[i].noteValue - prev_notes[j].noteValue
-                pairs.append(dotdict({'diff': note_diff, 'duration': min(bar[i].duration, prev_notes[j].duration), 'beatStrength': bar[i].beatStrength, 'index': index_b}))
-                i += 1
-                j += 1
-                index_b += 1
-                index_p += 1
-            else:
-                break
-        elif bar[i].offset < prev_notes[j].offset:
-            # Increment i if bar has a smaller offset
-            i += 1
-        else:
-            # Increment j if prev_notes has a smaller offset
-            j += 1
+def score_longest_contiguous_match(bar, prev_notes, alignment):
+    bar_duration = alignment.bar_duration
+    diffs, durations = alignment.indexed_pairs()
 
-    full_match_score = largest_zero_diff_consecutive_duration_sum(pairs) / bar_duration
-    transposed_match_duration, diff_value = largest_consecutive_duration_sum(pairs)
+    full_match_score = largest_zero_diff_consecutive_duration_sum(diffs, durations) / bar_duration
+    transposed_match_duration, diff_value = largest_consecutive_duration_sum(diffs, durations)
 
     partial_match_score = transposed_match_duration / bar_duration
     transposition_amount = abs(diff_value)
     return full_match_score, partial_match_score, transposition_amount
 
 
-def score_div_by_transposition_amount(bar, prev_notes):
-    bar_duration = max(sum([n.duration for n in bar]), sum([n.duration for n in prev_notes]))
-    i, j = 0, 0
-    pairs = []
-    # Iterate over both lists in single loop. (Offsets are ordered.)
-    while i < len(bar) and j < len(prev_notes):
-        if bar[i].offset == prev_notes[j].offset:
-            # If the offset values match, subtract note values and store in the result
-            note_diff = bar[i].noteValue - prev_notes[j].noteValue
-            if not EXCLUDE_SHORT_NOTES or (bar[i].duration >= 1 and prev_notes[j].duration >= 1):
-                pairs.append(dotdict({'diff': note_diff, 'duration': min(bar[i].duration, prev_notes[j].duration)}))
-            i += 1
-            j += 1
-        elif bar[i]['offset'] < prev_notes[j]['offset']:
-            # Increment i if bar has a smaller offset
-            i += 1
-        else:
-            # Increment j if prev_notes has a smaller offset
-            j += 1
-    proportion_in_common = sum([n.duration for n in pairs if n.diff == 0])/bar_duration
+def score_div_by_transposition_amount(bar, prev_notes, alignment):
+    bar_duration = alignment.bar_duration
+    diffs, durations = alignment.pairs(EXCLUDE_SHORT_NOTES)
+    proportion_in_common = diff_duration_sum(diffs, durations, 0)/bar_duration
     full_match_score = proportion_in_common
     # For partial match (transposition allowed)
-    diff_durations = defaultdict(float)
-    # Find aggregate duration for each diff value.
-    if len(pairs) > 0:
-        for i in pairs:
-            diff_durations[i['diff']] += i['duration']
-        most_prevalent_delta = max(diff_durations.items(), key=lambda x: (x[1], -x[0]))
+    if len(diffs) > 0:
+        most_prevalent_delta = most_prevalent_diff(diffs, durations)
         transposition_amount = abs(most_prevalent_delta[0])
         partial_match_score = most_prevalent_delta[1] / (bar_duration * transposition_amount + 1)
     else:
@@ -345,167 +408,91 @@ def score_div_by_transposition_amount(bar, prev_notes):
     return full_match_score, partial_match_score, transposition_amount
 
 
-def score_beat_strength_sum2(bar, prev_notes, beat_strength_coeff):
-    # Compute the total bar duration.
-    bar_duration = max(sum([n.duration for n in bar]), sum([n.duration for n in prev_notes]))
-    i, j = 0, 0
-    pairs = []
-    # Find note pairs with the same offsets.
-    # Iterate over both lists in single loop. (Offsets are ordered.)
-    while i < len(bar) and j < len(prev_notes):
-        # If the offset values match.
-        if bar[i].offset == prev_notes[j].offset:
-            # Subtract note values and store in the result.
-            note_diff = bar[i].noteValue - prev_notes[j].noteValue
-            # Compute the beat strength normalising constant.
-            bs_sum = sum([pow(beat_strength_coeff, math.log2(n.beatStrength))*n.duration for n in bar])/bar_duration
-            # Compute the beat strength value for the current note.
-            custom_beat_strength = pow(beat_strength_coeff, math.log2(bar[i].beatStrength)) / bs_sum
-            # Store the result.
-            pairs.append(dotdict({'diff': note_diff, 'duration': min(bar[i].duration, prev_notes[j].duration), 'beatStrength': custom_beat_strength}))
-            i += 1
-            j += 1
-        elif bar[i].offset < prev_notes[j].offset:
-            # Increment i if bar has a smaller offset
-            i += 1
-        else:
-            # Increment j if prev_notes has a smaller offset
-            j += 1
-    full_match_score = sum([n.duration*n.beatStrength for n in pairs if n.diff == 0])/bar_duration
+# Function to compute the full and partial match scores of pairs weighted by custom beat strengths.
+def weighted_scores(diffs, durations, custom_beat_strengths, bar_duration):
+    full_match_score = sum([duration*bs for diff, duration, bs in zip(diffs, durations, custom_beat_strengths) if diff == 0])/bar_duration
     # For partial match (transposition allowed)
-    diff_durations = defaultdict(float)
-    # Find aggregate duration for each note difference value.
-    for i in pairs:
-        diff_durations[i.diff] += i.duration
-    # Sort the diff_durations dict to find the most prevalent note difference value.
-    most_prevalent_delta = max(diff_durations.items(), key=lambda x: (x[1], -x[0]))
-    partial_match_score = sum([n.duration*n.beatStrength for n in pairs if n.diff == most_prevalent_delta[0]])/bar_duration
+    # Find the most prevalent note difference value.
+    most_prevalent_delta = most_prevalent_diff(diffs, durations)
+    partial_match_score = sum([duration*bs for diff, duration, bs in zip(diffs, durations, custom_beat_strengths) if diff == most_prevalent_delta[0]])/bar_duration
     transposition_amount = abs(most_prevalent_delta[0])
     return full_match_score, partial_match_score, transposition_amount
 
 
-def score_beat_strength_sum3(bar, prev_notes, eighth_notes_per_bar):
-    weightings_dict = {
-        1: [1],
-        2: [3, 1],
-        3: [3, 1, 1],
-        4: [4, 1, 2, 1],
-        5: [5, 1, 1, 1, 1],  # I made this one up.
-        6: [6, 1, 2, 4, 1, 2],
-        7: [6, 1, 1, 1, 1, 1, 1], # I made this one up.
-        8: [6, 1, 2, 1, 4, 1, 2, 1],
-        9: [6, 1, 2, 4, 1, 2, 4, 1, 2]
-    }
-    bar_len = eighth_notes_per_bar
-    beat_weightings = weightings_dict.get(bar_len)
+# Function to return the beat weightings of a bar with the passed number of eighth notes.
+def beat_weightings_for(weightings_dict, eighth_notes_per_bar):
+    beat_weightings = weightings_dict.get(eighth_notes_per_bar)
     if beat_weightings is None:
-        beat_weightings = [6] + [1]*(bar_len - 1)
-    bar_duration = max(sum([n.duration for n in bar]), sum([n.duration for n in prev_notes]))
-    bs_sum = sum([beat_weightings[math.floor(n.offset)] * n.duration for n in bar]) / bar_duration
-    i, j = 0, 0
-    pairs = []
-    # Iterate over both lists in single loop. (Offsets are ordered.)
-    while i < len(bar) and j < len(prev_notes):
-        if bar[i].offset == prev_notes[j].offset:
-            # If the offset values match, subtract note values and store in the result
-            note_diff = bar[i].noteValue - prev_notes[j].noteValue
-            custom_beat_strength = beat_weightings[math.floor(bar[i].offset)] / bs_sum
-            pairs.append(dotdict({'diff': note_diff, 'duration': min(bar[i].duration, prev_notes[j].duration), 'beatStrength': custom_beat_strength}))
-            i += 1
-            j += 1
-        elif bar[i].offset < prev_notes[j].offset:
-            # Increment i if bar has a smaller offset
-            i += 1
-        else:
-            # Increment j if prev_notes has a smaller offset
-            j += 1
-    full_match_score = sum([n.duration*n.beatStrength for n in pairs if n.diff == 0])/bar_duration
-    # For partial match (transposition allowed)
-    diff_durations = defaultdict(float)
-    # Find aggregate duration for each diff value.
-    for i in pairs:
-        diff_durations[i.diff] += i.duration
-    most_prevalent_delta = max(diff_durations.items(), key=lambda x: (x[1], -x[0]))
-    partial_match_score = sum([n.duration*n.beatStrength for n in pairs if n.diff == most_prevalent_delta[0]])/bar_duration
-    transposition_amount = abs(most_prevalent_delta[0])
-    return full_match_score, partial_match_score, transposition_amount
+        beat_weightings = [6] + [1]*(eighth_notes_per_bar - 1)
+    return beat_weightings
+
+
+# Scorer weighting each note by the beat strength coefficient raised to the log2 of its beat strength.
+class CustomBeatStrengthScorer(Scorer):
+    method = CUSTOM_BEAT_STRENGTH
+
+    # The weight of each note and the weighted duration of the bar.
+    def compute_features(self, bar):
+        weights = [pow(self.beat_strength_coeff, math.log2(bs)) for bs in bar.beatStrengths]
+        return weights, sum([weight*d for weight, d in zip(weights, bar.durations)])
+
+    def scores(self, bar, prev_notes, alignment):
+        # Compute the total bar duration.
+        bar_duration = alignment.bar_duration
+        diffs, durations = alignment.pairs()
+        custom_beat_strengths = []
+        if diffs:
+            weights, weighted_duration = self.features(bar)
+            # Compute the beat strength normalising constant.
+            bs_sum = weighted_duration/bar_duration
+            # Compute the beat strength value for each note.
+            custom_beat_strengths = [weights[i] / bs_sum for i in alignment.positions]
+        return weighted_scores(diffs, durations, custom_beat_strengths, bar_duration)
 
 
-def score_beat_strength_sum4(bar, prev_notes, eighth_notes_per_bar, beat_strength_coeff):
-    weightings_dict = {
-        1: [1],
-        2: [0, -2],
-        3: [0, -2, -2],
-        4: [0, -3, -2, -3],
-        5: [0, -4, -4, -4, -4],  # I made this one up.
-        6: [0, -5, -4, -2, -5, -4],
-        7: [0, -5, -5, -5, -5, -5, -5], # I made this one up.
-        8: [0, -5, -4, -5, -2, -5, -4, -5],
-        9: [0, -5, -4, -2, -5, -4, -2, -5, -4]
-    }
-    bar_len = eighth_notes_per_bar
-    beat_weightings = weightings_dict.get(bar_len)
-    if beat_weightings == None:
-        beat_weightings = [6] + [1]*(bar_len - 1)
-    bar_duration = max(sum([n.duration for n in bar]), sum([n.duration for n in prev_notes]))
-    bs_sum = sum([pow(beat_strength_coeff, beat_weightings[math.floor(n.offset)]) * n.duration for n in bar]) / bar_duration
-    i, j = 0, 0
-    pairs = []
-    # Iterate over both lists in single loop. (Offsets are ordered.)
-    while i < len(bar) and j < len(prev_notes):
-        if bar[i].offset == prev_notes[j].offset:
-            # If the offset values match, subtract note values and store in the result
-            note_diff = bar[i].noteValue - prev_notes[j].noteValue
-            custom_beat_strength = pow(beat_strength_coeff, beat_weightings[math.floor(bar[i].offset)]) / bs_sum
-            pairs.append(dotdict({'diff': note_diff, 'duration': min(bar[i].duration, prev_notes[j].duration), 'beatStrength': custom_beat_strength}))
-            i += 1
-            j += 1
-        elif bar[i].offset < prev_notes[j].offset:
-            # Increment i if bar has a smaller offset
-            i += 1
-        else:
-            # Increment j if prev_notes has a smaller offset
-            j += 1
-    full_match_score = sum([n.duration*n.beatStrength for n in pairs if n.diff == 0])/bar_duration
-    # For partial match (transposition allowed)
-    diff_durations = defaultdict(float)
-    # Find aggregate duration for each diff value.
-    for i in pairs:
-        diff_durations[i.diff] += i.duration
-    most_prevalent_delta = max(diff_durations.items(), key=lambda x: (x[1], -x[0]))
-    partial_match_score = sum([n.duration*n.beatStrength for n in pairs if n.diff == most_prevalent_delta[0]])/bar_duration
-    transposition_amount = abs(most_prevalent_delta[0])
-    return full_match_score, partial_match_score, transposition_amount
+# Scorer weighting each note by the hard-coded linear weighting of the eighth note it starts on.
+class LinearBeatStrengthScorer(Scorer):
+    method = HARD_CODED_BEAT_STRENGTH_LINEAR
 
+    def __init__(self, eighth_notes_per_bar, beat_strength_coeff):
+        super().__init__(eighth_notes_per_bar, beat_strength_coeff)
+        self.beat_weightings = beat_weightings_for(LINEAR_BEAT_WEIGHTINGS, eighth_notes_per_bar)
 
-def score_new_rules(bar, prev_notes):
-    bar_duration = max(sum([n.duration for n in bar]), sum([n.duration for n in prev_notes]))
-    i, j = 0, 0
-    pairs = []
-    index_b = 0
-    index_p = 0
-    # Iterate over both lists in single loop. (Offsets are ordered.)
-    while i < len(bar) and j < len(prev_notes):
-        if bar[i].offset == prev_notes[j].offset:
-            if bar[i].noteIndex == index_b and prev_notes[j].noteIndex == index_p:
-                # If the offset values match, subtract note values and store in the result
-                note_diff = bar[i].noteValue - prev_notes[j].noteValue
-                pairs.append(dotdict({'diff': note_diff, 'duration': min(bar[i].duration, prev_notes[j].duration),
-                                      'beatStrength': bar[i].beatStrength, 'index': index_b}))
-                i += 1
-                j += 1
-                index_b += 1
-                index_p += 1
-            else:
-                break
-        elif bar[i].offset < prev_notes[j].offset:
-            # Increment i if bar has a smaller offset
-            i += 1
-        else:
-            # Increment j if prev_notes has a smaller offset
-            j += 1
+    def note_weight(self, tick):
+        return self.beat_weightings[tick // TICKS_PER_EIGHTH]
+
+    # The weight of each note and the weighted duration of the bar.
+    def compute_features(self, bar):
+        weights = [self.note_weight(tick) for tick in bar.ticks]
+        return weights, sum([weight * d for weight, d in zip(weights, bar.durations)])
+
+    def scores(self, bar, prev_notes, alignment):
+        bar_duration = alignment.bar_duration
+        weights, weighted_duration = self.features(bar)
+        bs_sum = weighted_duration / bar_duration
+        diffs, durations = alignment.pairs()
+        custom_beat_strengths = [weights[i] / bs_sum for i in alignment.positions]
+        return weighted_scores(diffs, durations, custom_beat_strengths, bar_duration)
+
+
+# Scorer weighting each note by the beat strength coefficient raised to the hard-coded geometric weighting of the
+# eighth note it starts on.
+class GeometricBeatStrengthScorer(LinearBeatStrengthScorer):
+    method = HARD_CODED_BEAT_STRENGTH_GEOMETRIC
+
+    def __init__(self, eighth_notes_per_bar, beat_strength_coeff):
+        super().__init__(eighth_notes_per_bar, beat_strength_coeff)
+        self.beat_weightings = beat_weightings_for(GEOMETRIC_BEAT_WEIGHTINGS, eighth_notes_per_bar)
+
+    def note_weight(self, tick):
+        return pow(self.beat_strength_coeff, self.beat_weightings[tick // TICKS_PER_EIGHTH])
+
+
+def score_new_rules(bar, prev_notes, alignment):
+    bar_duration = alignment.bar_duration
+    diffs, durations = alignment.indexed_pairs()
     variant_match_type_scores = []
-    non_t_contig_score = largest_zero_diff_consecutive_duration_sum(pairs) / bar_duration
+    non_t_contig_score = largest_zero_diff_consecutive_duration_sum(diffs, durations) / bar_duration
     if non_t_contig_score > 0.5:
         full_match_score = non_t_contig_score
         non_t_contig_variant_score = 0.0
@@ -517,14 +504,14 @@ def score_new_rules(bar, prev_notes):
         non_t_contig_variant_score = 0.0
     variant_match_type_scores.append(non_t_contig_variant_score)
 
-    non_t_non_contig_score = sum([n.duration for n in pairs if n.diff == 0])/bar_duration
+    non_t_non_contig_score = diff_duration_sum(diffs, durations, 0)/bar_duration
     if non_t_non_contig_score > 0.5:
         non_t_non_contig_variant_score = non_t_non_contig_score
     else:
         non_t_non_contig_variant_score = 0.0
     variant_match_type_scores.append(non_t_non_contig_variant_score)
 
-    transposed_match_duration, diff_value = largest_consecutive_duration_sum(pairs)
+    transposed_match_duration, diff_value = largest_consecutive_duration_sum(diffs, durations)
     t_contig_score = transposed_match_duration / bar_duration
 
     if t_contig_score > 0.5:
@@ -538,3 +525,60 @@ def score_new_rules(bar, prev_notes):
     # Choose the best variant match score type.
     partial_match_score = max(enumerate(variant_match_type_scores), key=lambda x: (x[1], -x[0]))[1]
     return full_match_score, partial_match_score, transposition_amount
+
+
+class BasicScorer(Scorer):
+    method = BASIC
+
+    def scores(self, bar, prev_notes, alignment):
+        return score_basic(bar, prev_notes, alignment)
+
+
+class RequireFirstNoteScorer(Scorer):
+    method = REQUIRE_1st_NOTE
+
+    def scores(self, bar, prev_notes, alignment):
+        return score_require_first_note(bar, prev_notes, alignment)
+
+
+class RequireFirstAndFourthNotesScorer(Scorer):
+    method = REQUIRE_1st_AND_4th_NOTES
+
+    def scores(self, bar, prev_notes, alignment):
+        return score_require_first_and_fourth_notes(bar, prev_notes, alignment)
+
+
+class LongestCommonPrefixScorer(Scorer):
+    method = LCP
+
+    def scores(self, bar, prev_notes, alignment):
+        return score_longest_common_prefix(bar, prev_notes, alignment)
+
+
+class ContiguousNotesScorer(Scorer):
+    method = CONTIGUOUS_NOTES
+
+    def scores(self, bar, prev_notes, alignment):
+        return score_longest_contiguous_match(bar, prev_notes, alignment)
+
+
+class DivByTranspositionAmountScorer(Scorer):
+    method = DIV_BY_TRSPS_AMT
+
+    def scores(self, bar, prev_notes, alignment):
+        return score_div_by_transposition_amount(bar, prev_notes, alignment)
+
+
+class NewRulesScorer(Scorer):
+    method = NEW_RULES
+
+    def scores(self, bar, prev_notes, alignment):
+        return score_new_rules(bar, prev_notes, alignment)
+
+
+# Scorer class of each scoring method.
+SCORERS = {scorer_class.method: scorer_class for scorer_class in [BasicScorer, RequireFirstNoteScorer,
+                                                                  RequireFirstAndFourthNotesScorer, LongestCommonPrefixScorer,
+                                                                  ContiguousNotesScorer, DivByTranspositionAmountScorer,
+                                                                  CustomBeatStrengthScorer, LinearBeatStrengthScorer,
+                                                                  GeometricBeatStrengthScorer, NewRulesScorer]}
@@ -0,0 +1,356 @@
+import math
+import numpy as np
+import bar_matches
+from bar_matches import (BASIC, REQUIRE_1st_NOTE, REQUIRE_1st_AND_4th_NOTES, LCP, CONTIGUOUS_NOTES, DIV_BY_TRSPS_AMT,
+                         CUSTOM_BEAT_STRENGTH, HARD_CODED_BEAT_STRENGTH_LINEAR, HARD_CODED_BEAT_STRENGTH_GEOMETRIC,
+                         NEW_RULES, COEFF_METHODS)
+from bar_notes import TICKS_PER_EIGHTH
+
+MAX_GRID_CELLS = 1024 # Tunes needing a finer grid than this are scored with the scalar path.
+BLOCK_CELLS = 1 << 18 # Number of (bar pair, grid cell) elements processed at once.
+# Methods weighting the notes by beat strength.
+BEAT_STRENGTH_METHODS = (CUSTOM_BEAT_STRENGTH, HARD_CODED_BEAT_STRENGTH_LINEAR, HARD_CODED_BEAT_STRENGTH_GEOMETRIC)
+# Methods whose scalar scoring fails on bars without common offsets.
+COMMON_OFFSET_METHODS = (REQUIRE_1st_NOTE, REQUIRE_1st_AND_4th_NOTES) + BEAT_STRENGTH_METHODS
+
+
+# The bars of a tune quantized to a common grid of note onsets, with one row per bar and one column per grid cell.
+class TuneGrid:
+    __slots__ = ('step', 'onsets', 'noteValues', 'durations', 'noteIndices', 'bar_durations', 'first_notes')
+
+
+# Function to quantize the bars of a tune to a grid whose cells are the greatest common divisor of the note offsets.
+# Returns None if the offsets of a bar are not strictly increasing or the grid would be too fine.
+def build_grid(bars):
+    all_ticks = [tick for bar in bars for tick in bar.ticks]
+    if any(tick < 0 for tick in all_ticks):
+        return None
+    step = math.gcd(*all_ticks) or 1
+    num_cells = max(all_ticks, default=0) // step + 1
+    if num_cells > MAX_GRID_CELLS:
+        return None
+    grid = TuneGrid()
+    grid.step = step
+    grid.onsets = np.zeros((len(bars), num_cells), dtype=bool)
+    grid.noteValues = np.zeros((len(bars), num_cells), dtype=np.int64)
+    grid.durations = np.zeros((len(bars), num_cells), dtype=np.float64)
+    grid.noteIndices = np.zeros((len(bars), num_cells), dtype=np.int64)
+    first_note_ids = {}
+    grid.first_notes = np.full(len(bars), -1, dtype=np.int64)
+    for b, bar in enumerate(bars):
+        cells = [tick // step for tick in bar.ticks]
+        if any(cells[i] >= cells[i + 1] for i in range(len(cells) - 1)):
+            return None
+        grid.onsets[b, cells] = True
+        grid.noteValues[b, cells] = bar.noteValues
+        grid.durations[b, cells] = bar.durations
+        grid.noteIndices[b, cells] = bar.noteIndices
+        if len(bar) > 0:
+            grid.first_notes[b] = first_note_ids.setdefault(bar.note(0), len(first_note_ids))
+    grid.bar_durations = np.array([bar.duration for bar in bars], dtype=np.float64)
+    return grid
+
+
+# Function to lay out the beat strength weight of every note on the grid, along with the weighted duration of every bar,
+# from the features computed by the scorer. Returns None if the scalar methods would fail on the tune.
+def beat_strength_weights(bars, grid, scorer):
+    weights = np.zeros(grid.durations.shape, dtype=np.float64)
+    weighted_durations = np.zeros(len(bars), dtype=np.float64)
+    for b, bar in enumerate(bars):
+        try:
+            bar_weights, weighted_duration = scorer.features(bar)
+        except (ArithmeticError, ValueError, IndexError):
+            return None
+        if weighted_duration == 0 or not math.isfinite(weighted_duration):
+            return None
+        weights[b, [tick // grid.step for tick in bar.ticks]] = bar_weights
+        weighted_durations[b] = weighted_duration
+    return weights, weighted_durations
+
+
+# Function to sum the rows of an array from left to right, as the scalar methods do.
+def sequential_sum(values):
+    return np.cumsum(values, axis=-1)[..., -1]
+
+
+# Function to find, for each pair, the note difference with the largest aggregate duration (preferring the smallest
+# difference on ties) and that duration.
+def most_prevalent_diffs(pairs, diffs, durations):
+    num_pairs = pairs.shape[0]
+    best_diffs = np.zeros(num_pairs, dtype=np.int64)
+    best_durations = np.zeros(num_pairs, dtype=np.float64)
+    if not pairs.any():
+        return best_diffs, best_durations
+    diff_min = diffs[pairs].min()
+    num_diffs = diffs[pairs].max() - diff_min + 1
+    aggregate = np.zeros((num_pairs, num_diffs), dtype=np.float64)
+    present = np.zeros((num_pairs, num_diffs), dtype=bool)
+    for cell in range(pairs.shape[1]):
+        rows = np.nonzero(pairs[:, cell])[0]
+        if len(rows) > 0:
+            columns = diffs[rows, cell] - diff_min
+            aggregate[rows, columns] += durations[rows, cell]
+            present[rows, columns] = True
+    aggregate = np.where(present, aggregate, -np.inf)
+    best_columns = np.argmax(aggregate, axis=1)
+    best_diffs = best_columns + diff_min
+    best_durations = aggregate[np.arange(num_pairs), best_columns]
+    return best_diffs, best_durations
+
+
+# Function to compute the longest zero-difference run and the longest equal-difference run of consecutive pairs, as
+# largest_zero_diff_consecutive_duration_sum and largest_consecutive_duration_sum do.
+def consecutive_runs(pairs, diffs, durations):
+    num_pairs = pairs.shape[0]
+    zero_sum = np.zeros(num_pairs)
+    zero_max = np.zeros(num_pairs)
+    started = np.zeros(num_pairs, dtype=bool)
+    current_sum = np.zeros(num_pairs)
+    current_diff = np.zeros(num_pairs, dtype=np.int64)
+    max_sum = np.zeros(num_pairs)
+    max_diff = np.zeros(num_pairs, dtype=np.int64)
+    max_found = np.zeros(num_pairs, dtype=bool)
+    for cell in range(pairs.shape[1]):
+        paired = pairs[:, cell]
+        if not paired.any():
+            continue
+        diff = diffs[:, cell]
+        duration = durations[:, cell]
+        zero_sum = np.where(paired, np.where(diff == 0, zero_sum + duration, 0.0), zero_sum)
+        zero_max = np.maximum(zero_max, zero_sum)
+        extend = paired & started & (diff == current_diff)
+        restart = paired & ~extend
+        current_sum = np.where(extend, current_sum + duration, np.where(restart, duration, current_sum))
+        current_diff = np.where(restart, diff, current_diff)
+        better = extend & (current_sum > max_sum)
+        max_sum = np.where(better, current_sum, max_sum)
+        max_diff = np.where(better, current_diff, max_diff)
+        max_found |= better
+        started |= paired
+    # Check if the last sequence is the largest
+    better = started & (current_sum > max_sum)
+    max_sum = np.where(better, current_sum, max_sum)
+    max_diff = np.where(better, current_diff, max_diff)
+    max_found |= better
+    return zero_max, max_sum, max_diff, started, max_found
+
+
+# Function to compute the scores of a block of bar pairs, returning the full, partial and transposition scores, and
+# whether the scalar method would raise an error on any of the pairs. The beat strength weights may have a leading axis
+# of beat strength coefficients, in which case the full and partial scores of the beat strength methods have it too.
+def block_scores(grid, bars_a, bars_b, SCORING_METHOD, weights):
+    onsets_a, onsets_b = grid.onsets[bars_a], grid.onsets[bars_b]
+    pairs = onsets_a & onsets_b
+    diffs = grid.noteValues[bars_a] - grid.noteValues[bars_b]
+    durations = np.minimum(grid.durations[bars_a], grid.durations[bars_b])
+    bar_duration = np.maximum(grid.bar_durations[bars_a], grid.bar_durations[bars_b])
+    num_pairs = len(bars_a)
+    rows = np.arange(num_pairs)
+    has_pairs = pairs.any(axis=1)
+    failed = bar_duration == 0
+
+    if SCORING_METHOD in (BASIC, DIV_BY_TRSPS_AMT, REQUIRE_1st_NOTE, REQUIRE_1st_AND_4th_NOTES):
+        if bar_matches.EXCLUDE_SHORT_NOTES and SCORING_METHOD in (BASIC, DIV_BY_TRSPS_AMT):
+            pairs = pairs & (durations >= 1)
+            has_pairs = pairs.any(axis=1)
+        proportion_in_common = sequential_sum(np.where(pairs & (diffs == 0), durations, 0.0)) / bar_duration
+        best_diffs, best_durations = most_prevalent_diffs(pairs, diffs, durations)
+        transposition = np.where(has_pairs, np.abs(best_diffs), 0)
+        if SCORING_METHOD == BASIC:
+            full = proportion_in_common
+            partial = np.where(has_pairs, best_durations / bar_duration, 0.0)
+        elif SCORING_METHOD == DIV_BY_TRSPS_AMT:
+            full = proportion_in_common
+            partial = np.where(has_pairs, best_durations / (bar_duration * transposition + 1), 0.0)
+        else:
+            # The first and middle note methods fail on bars without common offsets.
+            failed |= ~has_pairs
+            first_cells = np.argmax(pairs, axis=1)
+            first_diffs = diffs[rows, first_cells]
+            first_offset_zero = first_cells == 0
+            if SCORING_METHOD == REQUIRE_1st_NOTE:
+                same_first_note = grid.first_notes[bars_a] == grid.first_notes[bars_b]
+                full_ok = same_first_note & first_offset_zero
+                partial_ok = (first_diffs == best_diffs) & first_offset_zero
+            else:
+                middle_ticks = (bar_duration / 2).astype(np.int64) * TICKS_PER_EIGHTH
+                middle_cells = middle_ticks // grid.step
+                on_grid = (middle_ticks % grid.step == 0) & (middle_cells < pairs.shape[1])
+                middle_cells = np.where(on_grid, middle_cells, 0)
+                has_middle = on_grid & pairs[rows, middle_cells]
+                middle_diffs = diffs[rows, middle_cells]
+                full_ok = (first_diffs == 0) & first_offset_zero & has_middle & (middle_diffs == 0)
+                partial_ok = (first_diffs == best_diffs) & first_offset_zero & has_middle & (middle_diffs == best_diffs)
+            full = np.where(full_ok, proportion_in_common, 0.0)
+            partial = np.where(partial_ok, best_durations / bar_duration, 0.0)
+            transposition = np.where(partial_ok, np.abs(best_diffs), 0)
+        return full, partial, transposition, failed
+
+    if SCORING_METHOD in BEAT_STRENGTH_METHODS:
+        note_weights, weighted_durations = weights
+        # The beat strength methods fail on bars without common offsets.
+        failed |= ~has_pairs
+        bs_sum = weighted_durations[..., bars_a] / bar_duration
+        custom_beat_strengths = note_weights[..., bars_a, :] / bs_sum[..., None]
+        weighted = durations * custom_beat_strengths
+        best_diffs, best_durations = most_prevalent_diffs(pairs, diffs, durations)
+        full = sequential_sum(np.where(pairs & (diffs == 0), weighted, 0.0)) / bar_duration
+        partial = sequential_sum(np.where(pairs & (diffs == best_diffs[:, None]), weighted, 0.0)) / bar_duration
+        transposition = np.abs(best_diffs)
+        return full, partial, transposition, failed
+
+    # The remaining methods use the leading pairs whose note indices equal their position in the pairs.
+    ranks = np.cumsum(pairs, axis=1) - 1
+    indexed = ~pairs | ((grid.noteIndices[bars_a] == ranks) & (grid.noteIndices[bars_b] == ranks))
+    pairs = pairs & np.logical_and.accumulate(indexed, axis=1)
+    has_pairs = pairs.any(axis=1)
+    if SCORING_METHOD == LCP:
+        prefix = pairs & np.logical_and.accumulate(~pairs | (diffs == 0), axis=1)
+        full = sequential_sum(np.where(prefix, durations, 0.0)) / bar_duration
+        # The scalar prefix loop always stops at the first pair, so the partial match score is always zero.
+        partial = np.zeros(num_pairs)
+        first_diffs = diffs[rows, np.argmax(pairs, axis=1)]
+        transposition = np.where(has_pairs, np.abs(first_diffs), 0)
+        return full, partial, transposition, failed
+
+    zero_max, max_sum, max_diff, started, max_found = consecutive_runs(pairs, diffs, durations)
+    if SCORING_METHOD == CONTIGUOUS_NOTES:
+        full = zero_max / bar_duration
+        partial = max_sum / bar_duration
+        transposition = np.where(started, np.abs(max_diff), np.inf)
+        # The scalar method fails when no run has a positive duration.
+        failed |= started & ~max_found
+        return full, partial, transposition, failed
+
+    if SCORING_METHOD == NEW_RULES:
+        non_t_contig_score = zero_max / bar_duration
+        # math.isclose(non_t_contig_score, 0.5) with its default relative tolerance.
+        difference = np.abs(non_t_contig_score - 0.5)
+        close = (difference <= abs(1e-09 * 0.5)) | (difference <= np.abs(1e-09 * non_t_contig_score))
+        full = np.where(non_t_contig_score > 0.5, non_t_contig_score, 0.0)
+        non_t_contig_variant_score = np.where(~(non_t_contig_score > 0.5) & close, non_t_contig_score, 0.0)
+        non_t_non_contig_score = sequential_sum(np.where(pairs & (diffs == 0), durations, 0.0)) / bar_duration
+        non_t_non_contig_variant_score = np.where(non_t_non_contig_score > 0.5, non_t_non_contig_score, 0.0)
+        t_contig_score = max_sum / bar_duration
+        t_contig_variant_score = np.where(t_contig_score > 0.5, t_contig_score, 0.0)
+        transposition = np.where(t_contig_score > 0.5, np.abs(max_diff), np.inf)
+        partial = np.maximum(np.maximum(non_t_contig_variant_score, non_t_non_contig_variant_score), t_contig_variant_score)
+        return full, partial, transposition, failed
+    raise ValueError("Unknown scoring method " + str(SCORING_METHOD))
+
+
+# Function to compute the full match, partial match and transposition scores of every bar in a tune against every
+# earlier bar with the scoring method of the passed scorer, in batched NumPy operations. Returns three lists of rows, where row k holds the scores of bar k against
+# bars 0 to k - 1, identical to those of bar_match_scores. Returns None if the tune cannot be represented exactly on a
+# grid or bar_match_scores would raise an error on one of its pairs, in which case the scalar path should be used.
+def score_matrices(bars, scorer):
+    score_rows = coefficient_score_matrices(bars, [scorer])
+    return None if score_rows is None else score_rows[0]
+
+
+# Function to compute the score rows of score_matrices for each of several scorers of one scoring method, which differ
+# only in their beat strength coefficient. The weights of every coefficient are scored together, and methods whose
+# scores do not depend on the coefficient are scored once and their rows shared.
+def coefficient_score_matrices(bars, scorers):
+    SCORING_METHOD = scorers[0].method
+    if SCORING_METHOD not in COEFF_METHODS and len(scorers) > 1:
+        score_rows = coefficient_score_matrices(bars, scorers[:1])
+        return None if score_rows is None else score_rows * len(scorers)
+    grid = build_grid(bars)
+    if grid is None:
+        return None
+    weights = None
+    if SCORING_METHOD in BEAT_STRENGTH_METHODS:
+        scorer_weights = [beat_strength_weights(bars, grid, scorer) for scorer in scorers]
+        if any(weight is None for weight in scorer_weights):
+            return None
+        weights = (np.stack([note_weights for note_weights, weighted_durations in scorer_weights]),
+                   np.stack([weighted_durations for note_weights, weighted_durations in scorer_weights]))
+    bars_a, bars_b = np.tril_indices(len(bars), -1)
+    full = np.zeros((len(scorers), len(bars_a)))
+    partial = np.zeros((len(scorers), len(bars_a)))
+    transposition = np.zeros(len(bars_a))
+    block_size = max(1, BLOCK_CELLS // (grid.onsets.shape[1] * len(scorers)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(bars_a), block_size):
+            block = slice(start, start + block_size)
+            block_full, block_partial, block_transposition, failed = block_scores(grid, bars_a[block], bars_b[block], SCORING_METHOD, weights)
+            if failed.any():
+                return None
+            full[:, block] = block_full
+            partial[:, block] = block_partial
+            transposition[block] = block_transposition
+    transposition = transposition.tolist()
+    score_rows = []
+    for scorer_full, scorer_partial in zip(full.tolist(), partial.tolist()):
+        score_rows.append([[scores[k * (k - 1) // 2:k * (k + 1) // 2] for k in range(len(bars))]
+                           for scores in (scorer_full, scorer_partial, transposition)])
+    return score_rows
+
+
+# Function to sum the passed weights of the notes of the bars of a tune into a matrix with one row per bar and one
+# column per key, along with a matrix of which bars have a note with each key.
+def keyed_sums(bar_rows, key_cols, num_bars, num_keys, weights):
+    cells = bar_rows * num_keys + key_cols
+    sums = np.bincount(cells, weights, minlength=num_bars * num_keys).reshape(num_bars, num_keys)
+    present = np.bincount(cells, minlength=num_bars * num_keys).reshape(num_bars, num_keys) > 0
+    return sums, present.astype(np.float64)
+
+
+# Function to compute cheap upper bounds on the full and partial match scores of every pair of bars of a tune with the
+# scoring method of the passed scorer, without aligning their notes, so that the scalar engine can skip pairs which
+# cannot beat the best match found so far. Only notes at common offsets are paired, and only those with the same note
+# value count towards a full match, so neither score exceeds the duration of such notes in either bar over the longer
+# bar duration, or their beat strength weighted duration over that of the current bar for the beat strength methods.
+# Returns two nested lists of bounds indexed by the current bar and then the earlier bar. Pairs on which the scalar
+# method would fail have infinite bounds, so that they are still scored.
+def bound_matrices(bars, scorer):
+    SCORING_METHOD = scorer.method
+    # Number the distinct offsets, and the distinct pairs of offset and note value, of the notes of the tune.
+    offset_ids = {}
+    value_ids = {}
+    bar_rows, offset_cols, value_cols, durations = [], [], [], []
+    for b, bar in enumerate(bars):
+        for tick, value, duration in zip(bar.ticks, bar.noteValues, bar.durations):
+            bar_rows.append(b)
+            offset_cols.append(offset_ids.setdefault(tick, len(offset_ids)))
+            value_cols.append(value_ids.setdefault((tick, value), len(value_ids)))
+            durations.append(duration)
+    bar_rows, offset_cols, value_cols = [np.array(cols, dtype=np.int64) for cols in (bar_rows, offset_cols, value_cols)]
+    offset_durations, offset_present = keyed_sums(bar_rows, offset_cols, len(bars), len(offset_ids), durations)
+    value_durations, value_present = keyed_sums(bar_rows, value_cols, len(bars), len(value_ids), durations)
+    bar_durations = np.array([bar.duration for bar in bars], dtype=np.float64)
+    longest = np.maximum.outer(bar_durations, bar_durations)
+    unbounded = longest <= 0
+    if SCORING_METHOD in COMMON_OFFSET_METHODS:
+        unbounded |= offset_present @ offset_present.T == 0
+    if SCORING_METHOD == CONTIGUOUS_NOTES:
+        # The contiguous notes method raises for a pair whose indexed notes all have zero duration, so the pairs of a
+        # bar with a note of zero duration are always scored, as without pruning.
+        zero_duration = np.array([any(duration <= 0 for duration in bar.durations) for bar in bars], dtype=bool)
+        unbounded |= zero_duration[:, None] | zero_duration[None, :]
+    if SCORING_METHOD in BEAT_STRENGTH_METHODS:
+        # The share of the weighted duration of its bar of each note.
+        shares = []
+        for b, bar in enumerate(bars):
+            try:
+                bar_weights, weighted_duration = scorer.features(bar)
+            except (ArithmeticError, ValueError, IndexError):
+                bar_weights, weighted_duration = [0] * len(bar), 0
+            if weighted_duration == 0 or not math.isfinite(weighted_duration):
+                unbounded[b] = True
+                weighted_duration = 1
+            shares.extend(weight * d / weighted_duration for weight, d in zip(bar_weights, bar.durations))
+        full = keyed_sums(bar_rows, value_cols, len(bars), len(value_ids), shares)[0] @ value_present.T
+        partial = keyed_sums(bar_rows, offset_cols, len(bars), len(offset_ids), shares)[0] @ offset_present.T
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            full = np.minimum(value_durations @ value_present.T, value_present @ value_durations.T) / longest
+            partial = np.minimum(offset_durations @ offset_present.T, offset_present @ offset_durations.T)
+            # The partial match score of the transposition method is only divided by the bar duration with a
+            # transposition, so it is bounded by the duration of the notes at common offsets alone.
+            if SCORING_METHOD != DIV_BY_TRSPS_AMT:
+                partial = partial / longest
+    full[unbounded] = np.inf
+    partial[unbounded] = np.inf
+    return full.tolist(), partial.tolist()
@@ -0,0 +1,47 @@
+TICKS_PER_EIGHTH = 20160 # Offsets are stored as integer ticks. 20160 divides evenly into 64th notes and 3, 5, 7 and 9-tuplets.
+
+
+# Function to convert an offset in eighth notes to ticks.
+def to_ticks(offset):
+    return round(offset * TICKS_PER_EIGHTH)
+
+
+# Compact representation of the notes in a bar, held as parallel sequences of note onsets (in ticks), diatonic note
+# values, beat strengths, durations (in eighth notes, as floats) and note indices, along with the total duration of the
+# bar. As the onsets are integers, the notes at the same position in two bars always align, including tuplet notes in
+# bars merged from a pickup bar (see benchmarks/triplets.py).
+class Bar:
+    __slots__ = ('ticks', 'noteValues', 'beatStrengths', 'durations', 'noteIndices', 'duration')
+
+    def __init__(self, ticks, noteValues, beatStrengths, durations, noteIndices):
+        self.ticks = ticks
+        self.noteValues = noteValues
+        self.beatStrengths = beatStrengths
+        self.durations = durations
+        self.noteIndices = noteIndices
+        self.duration = sum(durations)
+
+    def __len__(self):
+        return len(self.ticks)
+
+    # Function to return a note as an (offset, noteValue, beatStrength, duration, noteIndex) tuple.
+    def note(self, i):
+        return self.ticks[i], self.noteValues[i], self.beatStrengths[i], self.durations[i], self.noteIndices[i]
+
+    # Function to return the offsets of the notes in eighth notes.
+    def offsets(self):
+        return [tick / TICKS_PER_EIGHTH for tick in self.ticks]
+
+    # Function to return a new bar with the notes of another bar appended, shifted by the passed number of eighth notes.
+    def concatenate(self, other, shift):
+        shift_ticks = to_ticks(shift)
+        return Bar(self.ticks + [tick + shift_ticks for tick in other.ticks],
+                   self.noteValues + other.noteValues,
+                   self.beatStrengths + other.beatStrengths,
+                   self.durations + other.durations,
+                   self.noteIndices + other.noteIndices)
+
+    # Function to lengthen the final note of the bar by the passed number of eighth notes.
+    def extend_final_note(self, amount):
+        self.durations[-1] = self.durations[-1] + amount
+        self.duration = sum(self.durations)
@@ -1,33 +1,20 @@
 #!/bin/bash
 
+# Scoring method to compare the coefficients with, by default the Custom Beat Strength Weighting Method. The coefficient
+# only affects methods 6 and 8 (see bar_matches.COEFF_METHODS). Usage: beat_strength_coeff_comparison.sh [method]
+METHOD=${1:-6}
+
 # Make a directory to store the results in if it doesn't already exist.
 mkdir -p bs_comparison
-# Declare an array to store the results
-declare -a results
 
-# Iterate through values of x from 0 to 10
-#for x in {0..12}
-for x in 0.1 0.5 1.0 2.0 3.0 3.16228 4.0 5.0 7.0 10.0 20.0
-do
-    # Construct the output filename
-    output_filename="output${x}.csv"
-    
-    # Run the Python program with the current value of x and the constructed output filename
-    python3 analyse_melodic_structures.py -m 13 -b $x -o bs_comparison/$output_filename
-    
-    # Capture the output of the second Python program
-    result=$(python3 ../compare_results/compare_with_doherty.py -i bs_comparison/$output_filename)
-    
-    # Store the value pair in the results array
-    results+=("$x $result")
-done
+# Parse each tune once, score its bars with every beat strength coefficient and evaluate each coefficient against the
+# ground truth, writing a table of the agreement and F1 scores of each coefficient and a heatmap of the agreement.
+python3 sweep.py -m $METHOD -b 0.1,0.5,1.0,2.0,3.0,3.16228,4.0,5.0,7.0,10.0,20.0 \
+    -o bs_comparison/sweep.csv -p bs_comparison/sweep.png
 
-# Print the table header
+# Print the table of results
 printf "%-10s %-10s\n" "x" "Result"
-
-# Print each value pair
-for entry in "${results[@]}"
+tail -n +2 bs_comparison/sweep.csv | while IFS=, read -r x full variant agreement rest
 do
-    printf "%-10s %-10s\n" $entry
+    printf "%-10s %-10s\n" $x $agreement
 done
-
@@ -0,0 +1,42 @@
+import argparse
+import timeit
+import bar_matches
+import structure_analysis
+from bar_matches import BASIC, NEW_RULES
+from note_store import NoteStore
+from benchmarks.synthetic import analyse_tunes
+
+
+# Function to time the analysis of the tunes with and without the bar index, in milliseconds per tune, and count the
+# bars and pairs the index resolves.
+def time_bar_index(tunes, methods, repeats):
+    timings = {}
+    default_use_bar_index = structure_analysis.USE_BAR_INDEX
+    try:
+        for use_bar_index in [False, True]:
+            structure_analysis.USE_BAR_INDEX = use_bar_index
+            timings[use_bar_index] = min(timeit.repeat(lambda: analyse_tunes(tunes, methods), number=1, repeat=repeats)) / len(tunes) * 1E3
+        for key in bar_matches.bar_index_stats:
+            bar_matches.bar_index_stats[key] = 0
+        analyse_tunes(tunes, methods)
+    finally:
+        structure_analysis.USE_BAR_INDEX = default_use_bar_index
+    return timings, dict(bar_matches.bar_index_stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report how many bars and pairs of bars the bar index resolves on a "
+                                                 "corpus, and time the scalar engine with and without it.")
+    parser.add_argument("-s", "--store", help="Note store of the corpus (see note_store.py extract)", default='note_store')
+    parser.add_argument("-M", "--methods", help="Comma-separated methods", default=','.join(str(method) for method in range(BASIC, NEW_RULES + 1)))
+    parser.add_argument("-r", "--repeats", help="Number of timing repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    store = NoteStore(args.store)
+    tunes = [store.tune(index) for index in range(len(store)) if store.tunes[index]['error'] is None]
+    methods = [int(method) for method in args.methods.split(',')]
+    timings, stats = time_bar_index(tunes, methods, args.repeats)
+    print(f"{len(tunes)} tunes, {stats['bars'] // len(methods)} bars: {stats['repeats'] / stats['bars']:.1%} exact repeats and "
+          f"{stats['transpositions'] / stats['bars']:.1%} exact transpositions of an earlier bar")
+    print(f"{stats['pairs']} pairs scored, {stats['hits']} ({stats['hits'] / max(stats['pairs'], 1):.1%}) taken from the index")
+    print(f"Without index {timings[False]:8.2f} ms/tune, with index {timings[True]:8.2f} ms/tune")
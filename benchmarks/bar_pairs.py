@@ -0,0 +1,54 @@
+import argparse
+import math
+import timeit
+from bar_matches import make_scorer, BASIC, NEW_RULES
+from benchmarks.synthetic import METERS, random_bar_pairs
+
+
+# Function to time the scorer of each scoring method over random bar pairs, in microseconds per pair.
+def time_bar_pairs(num_pairs, eighth_notes_per_bar, density, repeats, beat_strength_coeff=math.pow(10, 0.2)):
+    pairs = random_bar_pairs(0, num_pairs, eighth_notes_per_bar, density)
+    timings = {}
+    for method in range(BASIC, NEW_RULES + 1):
+        def score_pairs():
+            scorer = make_scorer(method, eighth_notes_per_bar, beat_strength_coeff)
+            for bar, prev_bar in pairs:
+                try:
+                    scorer.match_scores(bar, prev_bar)
+                except (ValueError, IndexError, TypeError):
+                    # Some methods cannot score bars without any common offsets.
+                    pass
+        timings[method] = min(timeit.repeat(score_pairs, number=1, repeat=repeats)) / num_pairs * 1E6
+    return timings
+
+
+# Function to time scoring every pair with all ten methods, with or without sharing the alignment of each pair between
+# the methods, in microseconds per pair.
+def time_all_methods(num_pairs, eighth_notes_per_bar, density, repeats, shared, beat_strength_coeff=math.pow(10, 0.2)):
+    pairs = random_bar_pairs(0, num_pairs, eighth_notes_per_bar, density)
+    def score_pairs():
+        alignments = {} if shared else None
+        for method in range(BASIC, NEW_RULES + 1):
+            scorer = make_scorer(method, eighth_notes_per_bar, beat_strength_coeff)
+            for bar, prev_bar in pairs:
+                try:
+                    scorer.match_scores(bar, prev_bar, alignments)
+                except (ValueError, IndexError, TypeError):
+                    pass
+    return min(timeit.repeat(score_pairs, number=1, repeat=repeats)) / num_pairs * 1E6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the scoring of a single pair of bars with each method.")
+    parser.add_argument("-n", "--pairs", help="Number of bar pairs", type=int, default=2000)
+    parser.add_argument("-t", "--meter", help="Meter of the bars", choices=list(METERS), default='4/4')
+    parser.add_argument("-d", "--density", help="Note density", choices=['sparse', 'medium', 'dense'], default='medium')
+    parser.add_argument("-r", "--repeats", help="Number of timing repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    timings = time_bar_pairs(args.pairs, METERS[args.meter], args.density, args.repeats)
+    for method, microseconds in timings.items():
+        print(f"Method {method}: {microseconds:8.2f} us/pair")
+    for shared in [False, True]:
+        microseconds = time_all_methods(args.pairs, METERS[args.meter], args.density, args.repeats, shared)
+        print(f"All methods, {'shared' if shared else 'separate'} alignments: {microseconds:8.2f} us/pair")
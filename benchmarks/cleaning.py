@@ -0,0 +1,81 @@
+import argparse
+import os
+import re
+import tempfile
+import time
+from process_abc import iter_abc_file, remove_macros
+
+
+# The cleaner as it was before it was done in a single pass, kept for comparison: remove_macros followed by splitting
+# the tune again and running an uncompiled pattern on each line.
+def legacy_clean_abc(abc_content):
+    abc_content = remove_macros(abc_content)
+    abc_content = abc_content.replace("::", ":||:")
+    processed_lines = []
+    for line in abc_content.split('\n'):
+        if not re.search("^[A-Z]:", line):
+            line = line.replace('W', '')
+            line = line.replace('\"   ~\"', '')
+        processed_lines.append(line)
+    return '\n'.join(processed_lines)
+
+
+# Function to write a large corpus made of the passed ABC files, repeated.
+def write_corpus(file_name, in_files, repeats):
+    with open(file_name, 'w') as file:
+        for i in range(repeats):
+            for in_file in in_files:
+                with open(in_file, 'r') as abc_file:
+                    file.write(abc_file.read().rstrip('\n') + '\n\n')
+
+
+# Functions to stream the tunes of a corpus: read only, read and cleaned per tune by the legacy cleaner, and read and
+# cleaned by the reader.
+def read_only(file_name):
+    return sum(1 for tune in iter_abc_file(file_name))
+
+
+def read_legacy_clean(file_name):
+    return sum(1 for tune in iter_abc_file(file_name) if legacy_clean_abc(tune) is not None)
+
+
+def read_clean(file_name):
+    return sum(1 for tune in iter_abc_file(file_name, clean=True))
+
+
+CASES = {'read': read_only, 'read+legacy_clean': read_legacy_clean, 'read+clean': read_clean}
+
+
+# Function to time each case on the corpus, returning the best throughput of the repeats in MB/s.
+def time_cases(file_name, repeats):
+    size = os.path.getsize(file_name) / 1E6
+    timings = {}
+    for name, case in CASES.items():
+        best = float('inf')
+        for i in range(repeats):
+            start = time.perf_counter()
+            case(file_name)
+            best = min(best, time.perf_counter() - start)
+        timings[name] = size / best
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the throughput of reading and cleaning a large ABC corpus in MB/s.")
+    parser.add_argument("-i", "--input", help="ABC files concatenated into the corpus", nargs='+', default=['ONeills1001.abc'])
+    parser.add_argument("-c", "--copies", help="Number of copies of the input files in the corpus", type=int, default=20)
+    parser.add_argument("-r", "--repeats", help="Number of timing repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_name = os.path.join(temp_dir, 'corpus.abc')
+        write_corpus(file_name, args.input, args.copies)
+        print(f"Corpus of {os.path.getsize(file_name) / 1E6:.1f} MB")
+        timings = time_cases(file_name, args.repeats)
+    for name, throughput in timings.items():
+        print(f"{name:20s} {throughput:8.2f} MB/s")
+    # The cleaning throughput alone, from the time added to reading.
+    for name in ['read+legacy_clean', 'read+clean']:
+        clean_time = 1 / timings[name] - 1 / timings['read']
+        if clean_time > 0:
+            print(f"{name.split('+')[1]:20s} {1 / clean_time:8.2f} MB/s (cleaning only)")
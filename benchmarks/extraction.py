@@ -0,0 +1,57 @@
+import argparse
+import timeit
+from music21 import converter, stream, meter
+from extract_notes import arrange_tune_notes, extract_tune_notes, get_bar_notes
+from process_abc import iter_abc_file
+
+
+# The extraction as it was before it was done in a single pass, kept for comparison: get_bar_notes on each measure,
+# which looks up the time signature of every note to find its beat strength.
+def legacy_extract_tune_notes(score):
+    measures = score.parts[0].getElementsByClass(stream.Measure)
+    num, den = score.recurse().getElementsByClass(meter.TimeSignature)[0].ratioString.split('/')
+    eighth_notes_per_bar = float(num) * 8 / float(den)
+    bars = [get_bar_notes(measure) for measure in measures]
+    return arrange_tune_notes(bars, [measure.number for measure in measures], eighth_notes_per_bar)
+
+
+# Function to return the notes, part labels and eighth notes per bar extracted from a score as plain values, or the
+# error raised.
+def extraction_result(extract, score):
+    try:
+        tune_notes, part_labels, eighth_notes_per_bar = extract(score)
+    except Exception as e:
+        return type(e).__name__ + ": " + str(e)
+    return ([[(bar.ticks, bar.noteValues, bar.beatStrengths, bar.durations, bar.noteIndices, bar.duration) for bar in part]
+             for part in tune_notes], part_labels, eighth_notes_per_bar)
+
+
+# Function to parse and expand the repeats of the tunes of an ABC file, leaving out those music21 cannot parse.
+def parse_scores(in_file, limit=None):
+    scores = []
+    for abc_content in iter_abc_file(in_file, clean=True):
+        if limit is not None and len(scores) == limit:
+            break
+        try:
+            scores.append(converter.parse(abc_content, format='abc').expandRepeats())
+        except Exception:
+            continue
+    return scores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the single-pass extraction of the notes of parsed tunes with "
+                                                 "the extraction measure by measure, checking that they are identical.")
+    parser.add_argument("-i", "--input", help="ABC file", default='ONeills1001.abc')
+    parser.add_argument("-l", "--limit", help="Maximum number of tunes", type=int, default=None)
+    parser.add_argument("-r", "--repeats", help="Number of timing repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    scores = parse_scores(args.input, args.limit)
+    different = [i for i, score in enumerate(scores)
+                 if extraction_result(legacy_extract_tune_notes, score) != extraction_result(extract_tune_notes, score)]
+    print(f"{len(scores)} tunes, {len(different)} extracted differently" + (f": {different[:20]}" if different else ""))
+    # Both extractions only read the scores, so the same parsed scores can be used for every repeat.
+    for name, extract in [('measure by measure', legacy_extract_tune_notes), ('single pass', extract_tune_notes)]:
+        timing = min(timeit.repeat(lambda: [extraction_result(extract, score) for score in scores], number=1, repeat=args.repeats))
+        print(f"{name:20s} {timing / len(scores) * 1E3:8.2f} ms/tune")
@@ -0,0 +1,48 @@
+import argparse
+import timeit
+import structure_analysis
+from bar_matches import BASIC, NEW_RULES
+from note_store import NoteStore
+from benchmarks.synthetic import analyse_tunes
+
+
+# Function to time the analysis of the tunes with and without pruning for each method, in milliseconds per tune, count
+# the pairs of bars pruned and check that pruning leaves the output unchanged.
+def time_pruning(tunes, methods, repeats):
+    report = {}
+    default_use_pruning = structure_analysis.USE_PRUNING
+    try:
+        for method in methods:
+            timings = {}
+            outputs = {}
+            for use_pruning in [False, True]:
+                structure_analysis.USE_PRUNING = use_pruning
+                outputs[use_pruning] = analyse_tunes(tunes, [method])
+                timings[use_pruning] = min(timeit.repeat(lambda: analyse_tunes(tunes, [method]), number=1, repeat=repeats)) / len(tunes) * 1E3
+            structure_analysis.prune_stats.clear()
+            analyse_tunes(tunes, [method])
+            report[method] = {'timings': timings, 'same': outputs[False] == outputs[True],
+                              **structure_analysis.prune_stats[method]}
+    finally:
+        structure_analysis.USE_PRUNING = default_use_pruning
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report how many pairs of bars upper-bound pruning skips with each "
+                                                 "method on a corpus, and time the scalar engine with and without it.")
+    parser.add_argument("-s", "--store", help="Note store of the corpus (see note_store.py extract)", default='note_store')
+    parser.add_argument("-M", "--methods", help="Comma-separated methods", default=','.join(str(method) for method in range(BASIC, NEW_RULES + 1)))
+    parser.add_argument("-r", "--repeats", help="Number of timing repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    store = NoteStore(args.store)
+    tunes = [store.tune(index) for index in range(len(store)) if store.tunes[index]['error'] is None]
+    methods = [int(method) for method in args.methods.split(',')]
+    report = time_pruning(tunes, methods, args.repeats)
+    print(f"{len(tunes)} tunes")
+    for method, result in report.items():
+        timings = result['timings']
+        print(f"Method {method}: {result['pruned']} of {result['pairs']} pairs ({result['pruned'] / max(result['pairs'], 1):.1%}) pruned, "
+              f"without pruning {timings[False]:8.2f} ms/tune, with pruning {timings[True]:8.2f} ms/tune, "
+              f"output {'unchanged' if result['same'] else 'CHANGED'}")
@@ -0,0 +1,172 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+from bar_matches import SCORERS, make_scorer, align_bars, bar_match_scores, BASIC, NEW_RULES
+from structure_analysis import ENGINES
+from process_abc import read_abc_file, clean_abc
+from benchmarks.synthetic import METERS, DENSITY_DURATIONS, SCORING_ERRORS, analyse_tunes, random_bar_pairs, random_abc_tune, synthetic_tunes
+
+BEAT_STRENGTH_COEFF = math.pow(10, 0.2)
+# Number of 8-bar parts of the short and very long tunes given to analyse_tune.
+TUNE_LENGTHS = {'short': 2, 'long': 32}
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+
+# Function to time a function, returning the fastest of the repeats in seconds per operation.
+def time_function(function, num_operations, repeats):
+    return min(timeit.repeat(function, number=1, repeat=repeats)) / num_operations
+
+
+# Function to call a scoring function on each pair, ignoring the errors some methods raise for unscorable pairs.
+def score_all(score, pairs):
+    for args in pairs:
+        try:
+            score(*args)
+        except SCORING_ERRORS:
+            pass
+
+
+# Function to time the scores of each scoring method on pre-aligned pairs of bars, the alignment itself and the
+# bar_match_scores dispatch, in seconds per pair.
+def scoring_cases(meters, densities, num_pairs, repeats):
+    results = {}
+    for meter in meters:
+        eighth_notes_per_bar = METERS[meter]
+        for density in densities:
+            pairs = random_bar_pairs(0, num_pairs, eighth_notes_per_bar, density)
+            aligned_pairs = [(bar, prev_bar, align_bars(bar, prev_bar)) for bar, prev_bar in pairs]
+            suffix = f"/{meter}/{density}"
+            results['align_bars' + suffix] = time_function(lambda: score_all(align_bars, pairs), num_pairs, repeats)
+            for method in range(BASIC, NEW_RULES + 1):
+                scorer = make_scorer(method, eighth_notes_per_bar, BEAT_STRENGTH_COEFF)
+                # Compute the features of the bars outside the timing, as a scorer does once per bar of a tune.
+                score_all(scorer.scores, aligned_pairs)
+                name = f"score/{method}-{SCORERS[method].__name__}" + suffix
+                results[name] = time_function(lambda: score_all(scorer.scores, aligned_pairs), num_pairs, repeats)
+                dispatch_pairs = [(bar, prev_bar, eighth_notes_per_bar, method, BEAT_STRENGTH_COEFF) for bar, prev_bar in pairs]
+                name = f"bar_match_scores/{method}" + suffix
+                results[name] = time_function(lambda: score_all(bar_match_scores, dispatch_pairs), num_pairs, repeats)
+    return results
+
+
+# Function to time analyse_tune with each engine and scoring method on short and very long tunes, in seconds per tune.
+def analysis_cases(meters, num_tunes, repeats, methods):
+    results = {}
+    for meter in meters:
+        eighth_notes_per_bar = METERS[meter]
+        for length, num_parts in TUNE_LENGTHS.items():
+            tunes = synthetic_tunes(random.Random(0), num_tunes, eighth_notes_per_bar, num_parts)
+            for engine in ENGINES:
+                for method in methods:
+                    results[f"analyse_tune/{engine}/{method}/{length}/{meter}"] = time_function(lambda: analyse_tunes(tunes, [method], engine, BEAT_STRENGTH_COEFF), num_tunes, repeats)
+    return results
+
+
+# Function to time reading, cleaning, parsing and extracting the notes of a synthetic ABC corpus, in seconds per tune.
+def reading_cases(meters, num_tunes, num_parsed_tunes, repeats):
+    from music21 import converter
+    from extract_notes import extract_tune_notes
+    from abc_reader import read_tune_notes
+    results = {}
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for meter in meters:
+            file_name = os.path.join(temp_dir, 'synthetic.abc')
+            with open(file_name, 'w') as file:
+                for number in range(1, num_tunes + 1):
+                    file.write(random_abc_tune(rng, number, meter) + '\n\n')
+            tunes = read_abc_file(file_name)
+            results[f"read_abc_file/{meter}"] = time_function(lambda: read_abc_file(file_name), num_tunes, repeats)
+            results[f"clean_abc/{meter}"] = time_function(lambda: [clean_abc(tune) for tune in tunes], num_tunes, repeats)
+            cleaned_tunes = [clean_abc(tune) for tune in tunes[:num_parsed_tunes]]
+            results[f"read_tune_notes/{meter}"] = time_function(lambda: [read_tune_notes(tune) for tune in cleaned_tunes], len(cleaned_tunes), repeats)
+            # extract_tune_notes only reads the scores, so the same parsed scores can be used for every repeat.
+            scores = [converter.parse(tune, format='abc').expandRepeats() for tune in cleaned_tunes]
+            results[f"extract_tune_notes/{meter}"] = time_function(lambda: [extract_tune_notes(score) for score in scores], len(scores), repeats)
+    return results
+
+
+# Function to describe the commit and environment the benchmarks ran on.
+def run_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'machine': platform.machine()}
+
+
+# Function to compare results with a baseline, printing the ratio of each case and returning the cases slower than the
+# baseline by more than the threshold, as a fraction.
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        ratio = seconds / baseline[name]
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print(f"{name:60s} {baseline[name] * 1E6:12.2f} {seconds * 1E6:12.2f} us {ratio:7.2f}x{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the scoring, analysis and reading hot paths on synthetic tunes, "
+                                                 "writing the results as a JSON baseline and comparing them with an "
+                                                 "earlier one.")
+    parser.add_argument("-o", "--output", help="JSON file to which to write the results (default: "
+                                               "benchmarks/baselines/<commit>.json)", default=None)
+    parser.add_argument("-c", "--compare", help="JSON baseline with which to compare the results", default=None)
+    parser.add_argument("-t", "--threshold", help="Fraction by which a case must be slower than the baseline to count "
+                                                  "as a regression", type=float, default=0.1)
+    parser.add_argument("-g", "--groups", help="Comma-separated groups of cases to run", default='scoring,analysis,reading')
+    parser.add_argument("-m", "--meters", help="Comma-separated meters", default=','.join(METERS))
+    parser.add_argument("-d", "--densities", help="Comma-separated note densities", default=','.join(DENSITY_DURATIONS))
+    parser.add_argument("-n", "--pairs", help="Number of bar pairs per scoring case", type=int, default=500)
+    parser.add_argument("--tunes", help="Number of tunes per analysis case", type=int, default=5)
+    parser.add_argument("--abc-tunes", help="Number of tunes in the synthetic ABC corpus of the reading cases", type=int, default=2000)
+    parser.add_argument("--parsed-tunes", help="Number of tunes parsed with music21 in the reading cases", type=int, default=10)
+    parser.add_argument("-r", "--repeats", help="Number of timing repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    meters = args.meters.split(',')
+    groups = args.groups.split(',')
+    results = {}
+    if 'scoring' in groups:
+        results.update(scoring_cases(meters, args.densities.split(','), args.pairs, args.repeats))
+    if 'analysis' in groups:
+        results.update(analysis_cases(meters, args.tunes, args.repeats, [BASIC, NEW_RULES]))
+    if 'reading' in groups:
+        results.update(reading_cases(meters, args.abc_tunes, args.parsed_tunes, args.repeats))
+    info = run_info()
+    output = args.output
+    if output is None:
+        output = os.path.join(BASELINES_DIR, (info['commit'] or 'current') + '.json')
+        os.makedirs(BASELINES_DIR, exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({'info': info, 'results': results}, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        print(f"Comparing with {baseline['info'].get('commit')} ({baseline['info'].get('date')})")
+        print(f"{'Case':60s} {'baseline':>12s} {'current':>12s}")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} cases regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+    else:
+        for name, seconds in results.items():
+            print(f"{name:60s} {seconds * 1E6:12.2f} us")
@@ -0,0 +1,128 @@
+import math
+import random
+from bar_notes import Bar, to_ticks
+from structure_analysis import analyse_tune
+
+# Errors raised by some methods for bars without any common offsets.
+SCORING_ERRORS = (ValueError, IndexError, TypeError)
+# Eighth notes per bar of the meters used to generate synthetic tunes.
+METERS = {'2/4': 4, '3/4': 6, '4/4': 8, '6/8': 6, '9/8': 9, '12/8': 12}
+# Note durations (in eighth notes) to draw from at each note density.
+DENSITY_DURATIONS = {'sparse': [1, 2, 2, 3, 4],
+                     'medium': [0.5, 1, 1, 1, 2],
+                     'dense': [0.5, 0.5, 0.5, 1, 2/3]}
+
+
+# Function to approximate music21's beat strength of an offset (in eighth notes) within a bar.
+def beat_strength(offset, eighth_notes_per_bar):
+    if offset == 0:
+        return 1.0
+    if offset * 2 == eighth_notes_per_bar:
+        return 0.5
+    beat_length = 3 if eighth_notes_per_bar % 3 == 0 else 2
+    if offset % beat_length == 0:
+        return 0.25
+    if offset == int(offset):
+        return 0.125
+    return 0.0625
+
+
+# Function to generate a random bar of the passed length and note density.
+def random_bar(rng, eighth_notes_per_bar, density='medium', start_pitch=30):
+    ticks, noteValues, beatStrengths, durations, noteIndices = [], [], [], [], []
+    offset = 0
+    pitch = start_pitch
+    while offset < eighth_notes_per_bar:
+        duration = min(rng.choice(DENSITY_DURATIONS[density]), eighth_notes_per_bar - offset)
+        # Keep triplets together so that later notes stay on the eighth note grid.
+        if duration == 2/3:
+            duration = 2/3 if eighth_notes_per_bar - offset >= 2 else 1
+        ticks.append(to_ticks(offset))
+        noteValues.append(pitch)
+        beatStrengths.append(beat_strength(offset, eighth_notes_per_bar))
+        durations.append(float(duration))
+        noteIndices.append(len(noteIndices))
+        offset += duration
+        pitch += rng.choice([-2, -1, -1, 0, 1, 1, 2])
+    return Bar(ticks, noteValues, beatStrengths, durations, noteIndices)
+
+
+# Function to generate a random tune as a list of 8-bar parts, in which bars repeat, vary or transpose earlier bars as
+# they do in folk tunes.
+def random_tune(rng, eighth_notes_per_bar, num_parts=2, density='medium', repeat_probability=0.5):
+    bars = []
+    tune_notes = []
+    for part_num in range(num_parts):
+        part = []
+        for bar_num in range(8):
+            choice = rng.random()
+            if bars and choice < repeat_probability:
+                # Repeat an earlier bar, possibly transposed.
+                bar = rng.choice(bars)
+                shift = rng.choice([0, 0, 0, 1, -1, 2])
+                bar = Bar(list(bar.ticks), [value + shift for value in bar.noteValues], list(bar.beatStrengths),
+                          list(bar.durations), list(bar.noteIndices))
+            else:
+                bar = random_bar(rng, eighth_notes_per_bar, density, start_pitch=rng.randint(26, 34))
+            bars.append(bar)
+            part.append(bar)
+        tune_notes.append(part)
+    part_labels = [chr(ord('A') + part_num) for part_num in range(num_parts)]
+    return tune_notes, part_labels
+
+
+# Function to generate random pairs of bars to score.
+def random_bar_pairs(seed, count, eighth_notes_per_bar=8, density='medium'):
+    rng = random.Random(seed)
+    pairs = []
+    for i in range(count):
+        bar = random_bar(rng, eighth_notes_per_bar, density)
+        if rng.random() < 0.5:
+            prev_bar = random_bar(rng, eighth_notes_per_bar, density)
+        else:
+            # Keep the same rhythm with some changed pitches, as in a variant.
+            prev_bar = Bar(list(bar.ticks), [value + rng.choice([0, 0, 1, -1]) for value in bar.noteValues],
+                           list(bar.beatStrengths), list(bar.durations), list(bar.noteIndices))
+        pairs.append((bar, prev_bar))
+    return pairs
+
+
+# Function to generate the ABC representation of a random tune with repeated 8-bar parts, for benchmarking the corpus
+# processing pipeline.
+def random_abc_tune(rng, number, meter='6/8', num_parts=2):
+    eighth_notes_per_bar = METERS[meter]
+    pitches = 'DEFGABcdefg'
+    lines = [f"X: {number}", f"T: Synthetic tune {number}", f"M:{meter}", "L:1/8", "K:D"]
+    for part_num in range(num_parts):
+        bars = []
+        for bar_num in range(8):
+            notes = []
+            offset = 0
+            while offset < eighth_notes_per_bar:
+                duration = min(rng.choice([1, 1, 1, 2, 3]), eighth_notes_per_bar - offset)
+                notes.append(rng.choice(pitches) + (str(duration) if duration > 1 else ''))
+                offset += duration
+            bars.append(''.join(notes))
+        lines.append("|:" + "|".join(bars[:4]) + "|")
+        lines.append("|".join(bars[4:]) + ":|")
+    return '\n'.join(lines)
+
+
+# Function to analyse each tune with each method, returning the output rows of each tune with each method in turn, or
+# None where a method cannot score the tune. Each tune is a (tune_name, tune_number, tune_notes, part_labels,
+# eighth_notes_per_bar) tuple, as read from a note store (see synthetic_tunes for random tunes).
+def analyse_tunes(tunes, methods, engine='scalar', beat_strength_coeff=math.pow(10, 0.2)):
+    outputs = []
+    for tune_name, tune_number, tune_notes, part_labels, eighth_notes_per_bar in tunes:
+        for method in methods:
+            try:
+                outputs.append(analyse_tune(tune_notes, tune_name, tune_number, eighth_notes_per_bar, part_labels, method, beat_strength_coeff, 5/6, 3/6, engine=engine))
+            except SCORING_ERRORS:
+                outputs.append(None)
+    return outputs
+
+
+# Function to generate random tunes in the form analyse_tunes takes.
+def synthetic_tunes(rng, num_tunes, eighth_notes_per_bar, num_parts=2, density='medium'):
+    return [('Tune', '1') + random_tune(rng, eighth_notes_per_bar, num_parts, density) + (eighth_notes_per_bar,)
+            for i in range(num_tunes)]
@@ -0,0 +1,60 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from process_abc import extract_abc_info, iter_abc_file
+from task_pool import ordered_map, WorkerPool
+from benchmarks.synthetic import METERS, random_abc_tune
+
+
+# Function to write a synthetic ABC corpus of the passed number of tunes.
+def write_corpus(file_name, num_tunes, meter):
+    rng = random.Random(0)
+    with open(file_name, 'w') as file:
+        for number in range(1, num_tunes + 1):
+            file.write(random_abc_tune(rng, number, meter) + '\n\n')
+
+
+# Function to read only the number of a tune, so that the timing is that of the process pool driver.
+def read_number(abc_content):
+    return extract_abc_info(abc_content)[1]
+
+
+# Function to read the notes of a tune with the native ABC reader, as the analysis does before scoring its bars.
+def read_tune(abc_content):
+    from analyse_melodic_structures import parse_tune
+    return parse_tune(abc_content, native=True)[1]
+
+
+TASKS = {'info': read_number, 'read': read_tune}
+
+
+# Function to time streaming a corpus through the process pool at each batch size, in tunes per second.
+def time_batch_sizes(file_name, task, batch_sizes, max_in_flight):
+    timings = {}
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        with WorkerPool() as pool:
+            num_tunes = sum(1 for result in ordered_map(pool, task, iter_abc_file(file_name), max_in_flight=max_in_flight, batch_size=batch_size))
+        timings[batch_size] = num_tunes / (time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the throughput of the process pool driver at different batch sizes.")
+    parser.add_argument("-n", "--tunes", help="Number of tunes in the synthetic corpus", type=int, default=50000)
+    parser.add_argument("-b", "--batch-sizes", help="Comma-separated batch sizes", default='1,4,16,64,256')
+    parser.add_argument("-t", "--task", help="Work done per tune: 'info' only reads the tune number, so the timing is the "
+                                             "driver's overhead, 'read' reads the notes with the native ABC reader",
+                        choices=list(TASKS), default='info')
+    parser.add_argument("-m", "--meter", help="Meter of the tunes", choices=list(METERS), default='6/8')
+    parser.add_argument("--max-in-flight", help="Maximum number of tasks in flight", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_name = os.path.join(temp_dir, 'synthetic.abc')
+        write_corpus(file_name, args.tunes, args.meter)
+        timings = time_batch_sizes(file_name, TASKS[args.task], [int(size) for size in args.batch_sizes.split(',')], args.max_in_flight)
+    for batch_size, tunes_per_second in timings.items():
+        print(f"Batch size {batch_size:4d}: {tunes_per_second:10.1f} tunes/s")
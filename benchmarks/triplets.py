@@ -0,0 +1,48 @@
+import math
+import sys
+from music21 import converter
+from bar_matches import align_bars, bar_match_scores, BASIC
+from extract_notes import extract_tune_notes
+
+# O'Neill's 379, whose B part has the same triplet at the end of a bar merged from a pickup bar (the 8th bar) and of a
+# whole bar (the 10th bar). Before offsets were held in ticks, the offsets of the merged bar were floats and those of
+# the whole bar were Fractions, which never compare equal, so the notes of the triplets were not aligned.
+TRIPLET_TUNE = """X: 379
+T: Bright Love of My Heart
+M:C
+L:1/8
+K:D
+(F>G)|A>B (A/2G/2F/2D/2) Adcd|FGAB =c2(d/2^c/2B/2c/2)|A>BAG FDGF|D2G2 G2F>G|
+A>B (A/2G/2F/2D/2) Adcd|FGAB =c2(d/2^c/2B/2c/2)|A>BAG FDGF|D2D2 D2||
+((3ABc)|d2d>e f2ed|e2(d/2c/2A/2G/2) A2((3ABc)|d2dd e2(d/2c/2A/2B/2)|=c2d>d d3A|
+d2d2 de=cA|AGFD cdcA|A>BAG FDGF|D2D2 D2||
+"""
+# Indices of the two bars among the bars of the tune, and the scores of the later bar against the earlier with the
+# basic method: the triplets and the first note are aligned, and only the triplets match.
+BAR, PREV_BAR = 9, 7
+EXPECTED_POSITIONS = [0, 1, 5, 6, 7, 8]
+EXPECTED_BASIC_SCORES = (0.25, 0.25, 0)
+
+
+# Function to check that the notes of the triplets of the two bars are aligned and scored as matching, returning a list
+# of the failures.
+def check_triplet_alignment():
+    score = converter.parse(TRIPLET_TUNE, format='abc').expandRepeats()
+    tune_notes, part_labels, eighth_notes_per_bar = extract_tune_notes(score)
+    bars = [bar for part in tune_notes for bar in part]
+    failures = []
+    positions = align_bars(bars[BAR], bars[PREV_BAR]).positions
+    if positions != EXPECTED_POSITIONS:
+        failures.append(f"aligned positions {positions}, expected {EXPECTED_POSITIONS}")
+    scores = bar_match_scores(bars[BAR], bars[PREV_BAR], eighth_notes_per_bar, BASIC, math.pow(10, 0.2))
+    if tuple(scores) != EXPECTED_BASIC_SCORES:
+        failures.append(f"basic scores {tuple(scores)}, expected {EXPECTED_BASIC_SCORES}")
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check_triplet_alignment()
+    for failure in failures:
+        print(failure)
+    print("Triplet alignment " + ("FAILED" if failures else "ok"))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,30 @@
+import argparse
+import random
+import timeit
+from bar_matches import BASIC, NEW_RULES
+from structure_analysis import ENGINES
+from benchmarks.synthetic import METERS, analyse_tunes, synthetic_tunes
+
+
+# Function to time analyse_tune with each scoring engine over random tunes with the passed number of parts, in
+# milliseconds per tune.
+def time_engines(num_tunes, num_parts, eighth_notes_per_bar, density, repeats, methods):
+    tunes = synthetic_tunes(random.Random(0), num_tunes, eighth_notes_per_bar, num_parts, density)
+    timings = {}
+    for engine in ENGINES:
+        timings[engine] = min(timeit.repeat(lambda: analyse_tunes(tunes, methods, engine), number=1, repeat=repeats)) / num_tunes * 1E3
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the scalar and matrix scoring engines on tunes of increasing length.")
+    parser.add_argument("-n", "--tunes", help="Number of tunes per length", type=int, default=20)
+    parser.add_argument("-p", "--parts", help="Comma-separated numbers of 8-bar parts per tune", default='1,2,4,8')
+    parser.add_argument("-t", "--meter", help="Meter of the bars", choices=list(METERS), default='4/4')
+    parser.add_argument("-d", "--density", help="Note density", choices=['sparse', 'medium', 'dense'], default='medium')
+    parser.add_argument("-r", "--repeats", help="Number of timing repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    for num_parts in [int(parts) for parts in args.parts.split(',')]:
+        timings = time_engines(args.tunes, num_parts, METERS[args.meter], args.density, args.repeats, range(BASIC, NEW_RULES + 1))
+        print(f"{num_parts * 8:4d} bars: " + ", ".join(f"{engine} {milliseconds:8.2f} ms/tune" for engine, milliseconds in timings.items()))
@@ -0,0 +1,117 @@
+import collections
+import hashlib
+import json
+import os
+from task_pool import TaskError
+
+JOURNAL_FILE_EXTENSION = '.journal'
+
+
+# Function to compute the key of a tune's ABC text in the journal.
+def tune_key(abc_content):
+    return hashlib.sha256(abc_content.encode('utf-8')).hexdigest()
+
+
+# Function to compute the key of the parameters of a run with one scoring method, which with the tune key identifies
+# the rows of a tune in the journal.
+def params_key(scoring_method, beat_strength_coeff, full_match_threshold, variant_match_threshold, candidates=None):
+    key = f"{scoring_method},{beat_strength_coeff!r},{full_match_threshold!r},{variant_match_threshold!r}"
+    # Runs with candidate retrieval give approximate rows, which are kept apart from those of exhaustive runs.
+    if candidates:
+        key += f",candidates={candidates}"
+    return key
+
+
+# Checkpoint journal of a corpus run, recording the output rows of each finished tune with each scoring method as one
+# JSON line, keyed by a hash of the tune's ABC text and the run parameters. Every finished tune is flushed to the
+# journal, so an interrupted run can be resumed, and a re-run over a changed corpus only analyses the tunes whose ABC
+# or parameters changed. In incremental mode the journal is compacted at the end of the run to the entries of the
+# current corpus.
+class Journal:
+    def __init__(self, path, params_keys, resume=False, incremental=False):
+        self.path = path
+        self.params_keys = params_keys
+        self.incremental = incremental
+        self.entries = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        if (resume or incremental) and os.path.exists(path):
+            with open(path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line of an interrupted run may be incomplete.
+                        continue
+                    self.entries[entry['tune'], entry['params']] = entry['rows']
+        self.file = open(path, 'a' if resume or incremental else 'w')
+        # Start a new line after an incomplete last line.
+        if self.file.tell() > 0:
+            with open(path, 'rb') as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    self.file.write('\n')
+
+    # Function to return the rows of a tune with each scoring method if they are all in the journal, or None.
+    def lookup(self, abc_content):
+        key = tune_key(abc_content)
+        rows = [self.entries.get((key, params)) for params in self.params_keys]
+        if any(method_rows is None for method_rows in rows):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used.update((key, params) for params in self.params_keys)
+        return rows
+
+    # Function to record the rows of a finished tune with each scoring method. Methods that raised an error on the tune
+    # are not recorded, so that they are tried again.
+    def record(self, abc_content, rows):
+        key = tune_key(abc_content)
+        for params, method_rows in zip(self.params_keys, rows):
+            if isinstance(method_rows, TaskError):
+                continue
+            self.file.write(json.dumps({'tune': key, 'params': params, 'rows': method_rows}) + '\n')
+            self.entries[key, params] = method_rows
+            self.used.add((key, params))
+        self.file.flush()
+
+    # Function to close the journal, keeping only the entries used by this run in incremental mode.
+    def close(self):
+        self.file.close()
+        if self.incremental:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as file:
+                for (key, params), rows in self.entries.items():
+                    if (key, params) in self.used:
+                        file.write(json.dumps({'tune': key, 'params': params, 'rows': rows}) + '\n')
+            os.replace(temp_path, self.path)
+
+
+# Function to yield the rows of each tune with each scoring method in corpus order, taking them from the journal where
+# possible and running analyse on the stream of the other tunes, which must yield their rows in order. New rows are
+# recorded in the journal. Without a journal, every tune is analysed.
+def journaled_results(journal, tunes, analyse):
+    if journal is None:
+        yield from analyse(tunes)
+        return
+    order = collections.deque()
+
+    def unfinished_tunes():
+        for abc_content in tunes:
+            rows = journal.lookup(abc_content)
+            order.append((abc_content if rows is None else None, rows))
+            if rows is None:
+                yield abc_content
+
+    for result in analyse(unfinished_tunes()):
+        abc_content, rows = order.popleft()
+        while rows is not None:
+            yield rows
+            abc_content, rows = order.popleft()
+        # Tunes that could not be analysed are not recorded, so that they are tried again.
+        if not isinstance(result, TaskError):
+            journal.record(abc_content, result)
+        yield result
+    while order:
+        yield order.popleft()[1]
@@ -0,0 +1,194 @@
+import argparse
+import csv
+import json
+import re
+import numpy as np
+
+BAR_PATTERN = re.compile(r'[A-Z]?[a-z][0-9]?')
+DIGITS = re.compile(r'\d+')
+# Rows and columns of the confusion matrices: actual (rows) and predicted (columns) matches.
+MATCH_CLASSES = ['Full', 'Variant', 'None']
+# Parts compared with the ground truth.
+EVALUATED_PARTS = ('A',)
+# Bars counted per compared part when computing agreement.
+BARS_PER_PART = 8
+
+
+# Function to extract the bar patterns, such as 'a', 'b1' or 'Ac', from a structure string.
+def extract_bar_patterns(structure_string):
+    return BAR_PATTERN.findall(structure_string)
+
+
+def strip_number(bar_string):
+    return DIGITS.sub('', bar_string)
+
+
+# Function to encode the bar patterns of a part as, for each bar, the bar it matches and whether it is a variant of it:
+# the first earlier bar with the same pattern, or else the last earlier bar whose pattern is this one without its
+# variant number, or else the bar itself.
+def create_array(pattern):
+    array = []
+    first_index = {}
+    last_index = {}
+    for i, bar_pattern in enumerate(pattern):
+        if bar_pattern in first_index:
+            array.append((first_index[bar_pattern], False))
+        else:
+            variant_index = last_index.get(strip_number(bar_pattern))
+            array.append((i, False) if variant_index is None else (variant_index, True))
+            first_index[bar_pattern] = i
+        last_index[bar_pattern] = i
+    return array
+
+
+# Function to count the bars of a part in each cell of the confusion matrix of actual (rows) against predicted
+# (columns) full, variant and no matches.
+def compare_arrays(script_array, doherty_array):
+    counts = [[0, 0, 0],
+              [0, 0, 0],
+              [0, 0, 0]]
+    for s, ((x, a), (y, b)) in enumerate(zip(script_array, doherty_array)):
+        if y != s: # Actual full or variant match
+            if x == y: # Actual and prediction refer to same bar.
+                counts[int(b)][int(a)] += 1
+            elif x == s: # Predicted no match
+                counts[int(b)][2] += 1
+        else: # Actual no match
+            if x != y:
+                counts[2][int(a)] += 1
+            else:
+                counts[2][2] += 1
+    return counts
+
+
+# Function to calculate the F1 score of each class of a confusion matrix, followed by their average weighted by the
+# support of each class.
+def f1_scores(m):
+    confusion_matrix = np.array(m)
+    num_classes = confusion_matrix.shape[0]
+    f1_scores = []
+    support = np.sum(confusion_matrix, axis=1)
+    total_support = np.sum(support)
+    weighted_f1_sum = 0
+    for i in range(num_classes):
+        tp = confusion_matrix[i, i]
+        fp = sum(confusion_matrix[:, i]) - tp
+        fn = sum(confusion_matrix[i, :]) - tp
+        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
+        recall = tp / (tp + fn) if (tp + fn) > 0 else 0
+        f1 = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
+        f1_scores.append(f1)
+        weighted_f1_sum += f1 * support[i]
+    weighted_avg = weighted_f1_sum / total_support if total_support > 0 else 0
+    f1_scores.append(weighted_avg)
+    return f1_scores
+
+
+# Function to calculate the precision and recall of each class of a confusion matrix of actual (rows) against predicted
+# (columns) classes.
+def precision_recall(m):
+    confusion_matrix = np.array(m)
+    precisions = []
+    recalls = []
+    for i in range(confusion_matrix.shape[0]):
+        tp = confusion_matrix[i, i]
+        predicted = confusion_matrix[:, i].sum()
+        actual = confusion_matrix[i, :].sum()
+        precisions.append(float(tp / predicted) if predicted > 0 else 0.0)
+        recalls.append(float(tp / actual) if actual > 0 else 0.0)
+    return precisions, recalls
+
+
+def read_csv_file(filename):
+    with open(filename, newline='') as csvfile:
+        return list(csv.DictReader(csvfile))
+
+
+# Function to read the rows of in-memory analysis results, lists of the CSV lines written for each tune, as the rows of
+# an output file.
+def result_rows(results):
+    lines = (line for tune_rows in results for line in tune_rows)
+    return [dict(zip(['Tune', 'Title', 'Part', 'Structure'], row)) for row in csv.reader(lines)]
+
+
+# Ground truth structures (Detail1.csv), indexed by tune and part with the bar patterns of each part encoded once, so
+# that any number of outputs can be evaluated against it in time linear in their length.
+class GroundTruth:
+    def __init__(self, rows, parts=EVALUATED_PARTS):
+        self.parts = parts
+        self.arrays = {}
+        for row in rows:
+            if row['Part'] in parts:
+                # The first row of a tune and part is the one compared with.
+                key = (row['Tune'], row['Part'])
+                if key not in self.arrays:
+                    self.arrays[key] = create_array(extract_bar_patterns(row['Structure']))
+
+
+def load_ground_truth(file_name='Detail1.csv', parts=EVALUATED_PARTS):
+    return GroundTruth(read_csv_file(file_name), parts)
+
+
+# Function to count, for the rows of an output, the bars whose match agrees with the ground truth, the bars compared and
+# the confusion matrix of actual against predicted matches.
+def count_agreement(rows, ground_truth):
+    same = 0
+    total = 0
+    confusion_matrix = [[0, 0, 0],
+                        [0, 0, 0],
+                        [0, 0, 0]]
+    for row in rows:
+        if row['Part'] not in ground_truth.parts:
+            continue
+        doherty_array = ground_truth.arrays.get((row['Tune'], row['Part']))
+        if doherty_array is None:
+            continue
+        script_array = create_array(extract_bar_patterns(row['Structure']))
+        same += sum(1 for sp, dp in zip(script_array, doherty_array) if sp == dp)
+        total += BARS_PER_PART
+        counts = compare_arrays(script_array, doherty_array)
+        for i in range(3):
+            for j in range(3):
+                confusion_matrix[i][j] += counts[i][j]
+    return same, total, confusion_matrix
+
+
+# Function to summarise the counts of an evaluation as the percentage of bars whose match agrees with the ground truth,
+# the confusion matrix and the F1 scores, precision and recall of each kind of match.
+def summarise_agreement(same, total, confusion_matrix):
+    precisions, recalls = precision_recall(confusion_matrix)
+    return {'agreement': same / total * 100 if total else 0.0,
+            'same': same,
+            'total': total,
+            'confusion_matrix': confusion_matrix,
+            'f1': [float(f1) for f1 in f1_scores(confusion_matrix)],
+            'precision': precisions,
+            'recall': recalls}
+
+
+# Function to evaluate the rows of an output against the ground truth, returning the percentage of bars whose match
+# agrees with it, the confusion matrix of actual against predicted matches and the F1 scores of each kind of match.
+def evaluate(rows, ground_truth):
+    return summarise_agreement(*count_agreement(rows, ground_truth))
+
+
+# Function to evaluate each of a list of output files against the ground truth.
+def evaluate_files(file_names, ground_truth):
+    return {file_name: evaluate(read_csv_file(file_name), ground_truth) for file_name in file_names}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate output files against the ground truth structures.")
+    parser.add_argument("-i", "--input", help="Output files to evaluate", nargs='+', default=['melodic_structures.csv'])
+    parser.add_argument("-g", "--ground-truth", help="Ground truth structures", default='Detail1.csv')
+    parser.add_argument("-o", "--output", help="JSON file to which to write the evaluations", default=None)
+    args = parser.parse_args()
+
+    evaluations = evaluate_files(args.input, load_ground_truth(args.ground_truth))
+    for file_name, evaluation in evaluations.items():
+        print(f"{file_name}: agreement {evaluation['agreement']:.2f}%, F1 " +
+              ", ".join(f"{match_class} {f1:.3f}" for match_class, f1 in zip(MATCH_CLASSES + ['Weighted'], evaluation['f1'])))
+        print(f"    confusion matrix (actual x predicted): {evaluation['confusion_matrix']}")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(evaluations, file, indent=2)
@@ -1,71 +1,126 @@
 from music21 import stream, note, meter
+from music21.common.numberTools import opFrac
+from bar_notes import Bar, to_ticks
 
 REMOVE_GRACE_NOTES = True # Exclude grace notes.
 
-# Handy class to allow dot notation access to dict keys.
-class dotdict(dict):
-    """dot.notation access to dictionary attributes"""
-    __getattr__ = dict.get
-    __setattr__ = dict.__setitem__
-    __delattr__ = dict.__delitem__
 
-
-# Function: generate a list containing each note in a bar represented
-# as tuples of diatonic note pitches, offsets, beat strengths and durations.
+# Function: generate the notes in a bar as a Bar of diatonic note pitches, offsets, beat strengths and durations.
 def get_bar_notes(measure):
     notes_in_measure = measure.notes
-    notes = []
+    ticks = []
+    noteValues = []
+    beatStrengths = []
+    durations = []
+    noteIndices = []
     i = 0
     for n in notes_in_measure:
         if isinstance(n, note.Note) and (not REMOVE_GRACE_NOTES or n.duration.quarterLength > 0.0):
-            offset = n._activeSiteStoredOffset * 2 # Familiar with working in eighth notes.
-            duration = n.duration.quarterLength * 2 # Familiar with working in eighth notes.
-            noteValue = n.pitch.diatonicNoteNum
-            beatStrength = n.beatStrength
-            noteIndex = i # What about rests?
+            ticks.append(to_ticks(n._activeSiteStoredOffset * 2)) # Familiar with working in eighth notes.
+            durations.append(float(n.duration.quarterLength * 2)) # Familiar with working in eighth notes.
+            noteValues.append(n.pitch.diatonicNoteNum)
+            beatStrengths.append(n.beatStrength)
+            noteIndices.append(i) # What about rests?
             i += 1
-            notes.append(dotdict({'offset': offset, 'noteValue': noteValue, 'beatStrength': beatStrength, 'duration': duration, 'noteIndex': noteIndex}))
-    return notes
+    return Bar(ticks, noteValues, beatStrengths, durations, noteIndices)
 
 
 # Function to extract and display MIDI numbers of notes in each bar
 def extract_tune_notes(score):
-    measures = score.parts[0].getElementsByClass(stream.Measure)
     num, den = score.recurse().getElementsByClass(meter.TimeSignature)[0].ratioString.split('/')
     eighth_notes_per_bar = float(num) * 8 / float(den)
+    bars, measure_numbers = extract_part_bars(score.parts[0])
+    return arrange_tune_notes(bars, measure_numbers, eighth_notes_per_bar)
+
+
+# Function to generate the notes in each measure of a part as a Bar, as get_bar_notes does, in a single pass over the
+# elements of the measures, along with the measure numbers. Rather than looking up the time signature of every note,
+# the time signature in effect is tracked as the pass reaches each one, and the beat strength of each position in the
+# bar under it is computed once, as Music21Object.beatStrength computes it.
+def extract_part_bars(part):
+    bars = []
+    measure_numbers = []
+    time_signature = None
+    # The offset of the time signature in its measure and the length of its bar, and the beat strength of each offset.
+    ts_offset = bar_length = None
+    beat_strengths = {}
+    for measure in part.getElementsByClass(stream.Measure):
+        padding = measure.paddingLeft
+        ticks = []
+        noteValues = []
+        beatStrengths = []
+        durations = []
+        noteIndices = []
+        i = 0
+        for element in measure:
+            if isinstance(element, meter.TimeSignature):
+                time_signature = element
+                ts_offset = element._getMeasureOffset(includeMeasurePadding=False)
+                bar_length = element.barDuration.quarterLength
+                beat_strengths = {}
+            elif isinstance(element, note.Note) and (not REMOVE_GRACE_NOTES or element.duration.quarterLength > 0.0):
+                offset = element._activeSiteStoredOffset
+                ticks.append(to_ticks(offset * 2)) # Familiar with working in eighth notes.
+                durations.append(float(element.duration.quarterLength * 2)) # Familiar with working in eighth notes.
+                noteValues.append(element.pitch.diatonicNoteNum)
+                if time_signature is None:
+                    beatStrengths.append(element.beatStrength)
+                else:
+                    measure_offset = opFrac(offset + padding) if padding else offset
+                    beat_strength = beat_strengths.get(measure_offset)
+                    if beat_strength is None:
+                        beat_strength = beat_strength_at(time_signature, ts_offset, bar_length, measure_offset)
+                        beat_strengths[measure_offset] = beat_strength
+                    beatStrengths.append(beat_strength)
+                noteIndices.append(i) # What about rests?
+                i += 1
+        bars.append(Bar(ticks, noteValues, beatStrengths, durations, noteIndices))
+        measure_numbers.append(measure.number)
+    return bars, measure_numbers
+
+
+# Function to compute the beat strength of a note at the passed offset in its measure (including the measure's padding)
+# under a time signature at ts_offset in its own measure, as Music21Object.beatStrength does.
+def beat_strength_at(time_signature, ts_offset, bar_length, measure_offset):
+    if opFrac(measure_offset + ts_offset) < bar_length:
+        meter_modulus = measure_offset
+    else:
+        meter_modulus = opFrac((measure_offset - ts_offset) % bar_length)
+    return time_signature.getAccentWeight(meter_modulus, forcePositionMatch=True, permitMeterModulus=False)
+
+
+# Function to arrange the bars of the measures of a repeat-expanded tune into 8-bar parts, merging pickup bars and
+# removing loose ones, and to label the parts from their measure numbers.
+def arrange_tune_notes(measure_bars, measure_numbers, eighth_notes_per_bar):
     notes = []
     measure_nums = []
     bar_count = 0
     skip_next = False
-    for i in range(len(measures)):
+    for i in range(len(measure_bars)):
         # If pickup bar has been already concatenated onto the previous bar, skip it.
         if skip_next:
             skip_next = False
             continue
-        measure = measures[i]
-        bar_notes = get_bar_notes(measure)
-        bar_duration = sum([n.duration for n in bar_notes])
+        bar_notes = measure_bars[i]
+        bar_duration = bar_notes.duration
         # Remove loose pick-up bar if present.
         if bar_duration < 0.5*eighth_notes_per_bar:
             continue
         # Check if this bar is missing a note.
-        if bar_duration < eighth_notes_per_bar and i > 0 and i + 1 < len(measures):
+        if bar_duration < eighth_notes_per_bar and i > 0 and i + 1 < len(measure_bars):
             # Get the next bar's notes.
-            next_bar_notes = get_bar_notes(measures[i + 1])
-            # Adjust pickup bar offset values.
-            for n in next_bar_notes:
-                n.offset = n.offset + bar_duration
-            # Combine with next bar in case it's a pick-up bar.
-            combined_bar_notes = bar_notes + next_bar_notes
+            next_bar_notes = measure_bars[i + 1]
+            # Combine with next bar in case it's a pick-up bar, adjusting the pickup bar offset values.
+            combined_bar_notes = bar_notes.concatenate(next_bar_notes, bar_duration)
             # Check if new bar length is smaller or equal to a full bar length, and revert to two separate bars if not.
-            if sum([n.duration for n in combined_bar_notes]) <= eighth_notes_per_bar:
+            if combined_bar_notes.duration <= eighth_notes_per_bar:
                 full_bar_notes = combined_bar_notes
                 skip_next = True
             else:
                 full_bar_notes = bar_notes
         # Extend final note of tune if the bar is short.
-        elif bar_duration == eighth_notes_per_bar - 1 and i == len(measures) - 1:
-            bar_notes[len(bar_notes)-1].duration = bar_notes[len(bar_notes)-1].duration + 1
+        elif bar_duration == eighth_notes_per_bar - 1 and i == len(measure_bars) - 1:
+            bar_notes.extend_final_note(1)
             full_bar_notes = bar_notes
         else:
             full_bar_notes = bar_notes
@@ -74,7 +129,7 @@ def extract_tune_notes(score):
             notes.append([])
             measure_nums.append([])
         notes[part_count].append(full_bar_notes)
-        measure_nums[part_count].append(measure.number)
+        measure_nums[part_count].append(measure_numbers[i])
         bar_count += 1
 
     # Part labelling
@@ -0,0 +1,188 @@
+import os
+import json
+import shutil
+import argparse
+import numpy as np
+from tqdm import tqdm
+from bar_notes import Bar
+
+# Per-note columns of the store, the Bar attributes they hold and their types.
+NOTE_COLUMNS = {'tick': ('ticks', np.int64),
+                'noteValue': ('noteValues', np.int32),
+                'beatStrength': ('beatStrengths', np.float64),
+                'duration': ('durations', np.float64),
+                'noteIndex': ('noteIndices', np.int32)}
+# Index columns: the first note of each bar, the first bar of each part and the first part of each tune, each followed
+# by the total count so that item i spans [start[i], start[i + 1]).
+INDEX_COLUMNS = ['bar_start', 'part_start', 'tune_start']
+TUNES_FILE = 'tunes.json'
+# Number of values a column writer holds before appending them to its file.
+CHUNK_SIZE = 1 << 16
+
+
+# Columnar store of the notes extracted from a corpus of tunes. The columns are memory-mapped, so worker processes
+# reading the same store share its pages, and tunes can be analysed from it without importing music21.
+class NoteStore:
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.columns = {}
+        for column in list(NOTE_COLUMNS) + INDEX_COLUMNS + ['eighth_notes_per_bar']:
+            self.columns[column] = np.load(os.path.join(store_dir, column + '.npy'), mmap_mode='r')
+        with open(os.path.join(store_dir, TUNES_FILE), 'r') as file:
+            self.tunes = json.load(file)
+
+    def __len__(self):
+        return len(self.tunes)
+
+    # Function to return the name, number, bar notes, part labels and eighth notes per bar of a stored tune, in the
+    # same form as parse_tune.
+    def tune(self, index):
+        tune_info = self.tunes[index]
+        if tune_info['error'] is not None:
+            raise ValueError("Tune " + str(tune_info['number']) + " could not be extracted: " + tune_info['error'])
+        first_part, last_part = self.columns['tune_start'][index:index + 2].tolist()
+        part_start = self.columns['part_start'][first_part:last_part + 1].tolist()
+        bar_start = self.columns['bar_start'][part_start[0]:part_start[-1] + 1].tolist()
+        first_note, last_note = bar_start[0], bar_start[-1]
+        columns = {column: self.columns[column][first_note:last_note].tolist() for column in NOTE_COLUMNS}
+        tune_notes = []
+        for part_num in range(last_part - first_part):
+            part = []
+            for bar_num in range(part_start[part_num] - part_start[0], part_start[part_num + 1] - part_start[0]):
+                start, end = bar_start[bar_num] - first_note, bar_start[bar_num + 1] - first_note
+                part.append(Bar(*[values[start:end] for values in columns.values()]))
+            tune_notes.append(part)
+        eighth_notes_per_bar = int(self.columns['eighth_notes_per_bar'][index])
+        return tune_info['name'], tune_info['number'], tune_notes, tune_info['part_labels'], eighth_notes_per_bar
+
+
+# Opened stores, so that each worker process maps a store only once.
+open_stores = {}
+
+
+def open_note_store(store_dir):
+    if store_dir not in open_stores:
+        open_stores[store_dir] = NoteStore(store_dir)
+    return open_stores[store_dir]
+
+
+# Writer of a column of a note store, which appends its values to a temporary file in chunks as they come and writes
+# them out as a .npy file when it is closed, so that the column of a whole corpus is never held in memory.
+class ColumnWriter:
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.temp_path = path + '.tmp'
+        self.file = open(self.temp_path, 'wb')
+        self.values = []
+        self.length = 0
+
+    def append(self, value):
+        self.values.append(value)
+        if len(self.values) >= CHUNK_SIZE:
+            self.flush()
+
+    def extend(self, values):
+        self.values.extend(values)
+        if len(self.values) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        np.array(self.values, dtype=self.dtype).tofile(self.file)
+        self.length += len(self.values)
+        self.values = []
+
+    # Function to write the .npy file: the header, now that the length of the column is known, then the values.
+    def close(self):
+        self.flush()
+        self.file.close()
+        with open(self.path, 'wb') as file, open(self.temp_path, 'rb') as values:
+            np.lib.format.write_array_header_1_0(file, {'descr': np.lib.format.dtype_to_descr(self.dtype),
+                                                        'fortran_order': False, 'shape': (self.length,)})
+            shutil.copyfileobj(values, file)
+        os.remove(self.temp_path)
+
+
+# Function to write a note store from an iterable of parsed tunes, each either a (tune_name, tune_number, tune_notes,
+# part_labels, eighth_notes_per_bar) tuple or a (tune_number, error message) pair for tunes that could not be parsed.
+# The columns are written in chunks as the tunes come, so only the per-tune details are held for the whole corpus.
+def write_note_store(store_dir, parsed_tunes):
+    os.makedirs(store_dir, exist_ok=True)
+    columns = {column: ColumnWriter(os.path.join(store_dir, column + '.npy'), dtype) for column, (attribute, dtype) in NOTE_COLUMNS.items()}
+    bar_start, part_start, tune_start = [ColumnWriter(os.path.join(store_dir, column + '.npy'), np.int64) for column in INDEX_COLUMNS]
+    eighth_notes = ColumnWriter(os.path.join(store_dir, 'eighth_notes_per_bar.npy'), np.int32)
+    num_notes = num_bars = num_parts = 0
+    tunes = []
+    for parsed_tune in parsed_tunes:
+        tune_start.append(num_parts)
+        if len(parsed_tune) == 2:
+            tune_number, error = parsed_tune
+            tunes.append({'name': None, 'number': tune_number, 'part_labels': [], 'error': error})
+            eighth_notes.append(0)
+            continue
+        tune_name, tune_number, tune_notes, part_labels, eighth_notes_per_bar = parsed_tune
+        tunes.append({'name': tune_name, 'number': tune_number, 'part_labels': part_labels, 'error': None})
+        eighth_notes.append(eighth_notes_per_bar)
+        for part in tune_notes:
+            part_start.append(num_bars)
+            num_parts += 1
+            for bar in part:
+                bar_start.append(num_notes)
+                num_bars += 1
+                num_notes += len(bar)
+                for column, (attribute, dtype) in NOTE_COLUMNS.items():
+                    columns[column].extend(getattr(bar, attribute))
+    bar_start.append(num_notes)
+    part_start.append(num_bars)
+    tune_start.append(num_parts)
+    for writer in list(columns.values()) + [bar_start, part_start, tune_start, eighth_notes]:
+        writer.close()
+    with open(os.path.join(store_dir, TUNES_FILE), 'w') as file:
+        json.dump(tunes, file)
+
+
+# Function to parse a tune for the store, returning the tune number and error message if it cannot be parsed.
+# The parsing modules are imported here so that reading a store does not import music21.
+def extract_tune(abc_content, score_cache=None, native=False, cleaned=False):
+    from analyse_melodic_structures import parse_tune
+    from process_abc import extract_abc_info
+    try:
+        return parse_tune(abc_content, score_cache, native, cleaned)
+    except Exception as e:
+        return extract_abc_info(abc_content)[1], type(e).__name__ + ": " + str(e)
+
+
+# Function to parse every tune in an ABC file and write the notes to a note store.
+def extract(in_file, store_dir, cache_dir=None, cache_size=1024, native=False, batch_size=16, max_in_flight=None, timeout=300):
+    from process_abc import extract_abc_info, iter_abc_file
+    from score_cache import ScoreCache
+    from task_pool import ordered_map, TaskError, WorkerPool
+    score_cache = ScoreCache(cache_dir, cache_size) if cache_dir else None
+    with WorkerPool() as pool:
+        parsed_tunes = ordered_map(pool, extract_tune, iter_abc_file(in_file, clean=True), score_cache, native, True, batch_size=batch_size, max_in_flight=max_in_flight, timeout=timeout)
+        # Tunes that time out are stored with their error, as those that cannot be parsed are.
+        parsed_tunes = ((extract_abc_info(result.item)[1], result.error) if isinstance(result, TaskError) else result for result in parsed_tunes)
+        write_note_store(store_dir, tqdm(parsed_tunes, desc='Extracting notes.'))
+    if score_cache is not None:
+        score_cache.evict()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    extract_parser = subparsers.add_parser("extract", help="Extract the notes of every tune in an ABC file into a note store")
+    extract_parser.add_argument("-i", "--input", help="Input file", default='ONeills1001.abc')
+    extract_parser.add_argument("-o", "--output", help="Note store directory", default='note_store')
+    extract_parser.add_argument("-c", "--cache-dir", help="Directory in which to cache parsed, repeat-expanded scores", default=None)
+    extract_parser.add_argument("--cache-size", help="Maximum size of the score cache in MB", type=float, default=1024)
+    extract_parser.add_argument("-n", "--native", help="Read the notes of common tunes with the native ABC reader instead of music21",
+                                action="store_true")
+    extract_parser.add_argument("--batch-size", help="Number of tunes sent to a worker process at a time", type=int, default=16)
+    extract_parser.add_argument("--max-in-flight", help="Maximum number of batches submitted to the worker processes at a time "
+                                                        "(default: 4 per CPU)", type=int, default=None)
+    extract_parser.add_argument("-t", "--timeout", help="Seconds after which the parsing of a tune is abandoned and "
+                                                        "stored as an error (0 for no limit)", type=float, default=300)
+    args = parser.parse_args()
+
+    if args.command == "extract":
+        extract(args.input, args.output, args.cache_dir, args.cache_size, args.native, args.batch_size, args.max_in_flight, args.timeout)
@@ -0,0 +1,208 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import uuid
+from collections import OrderedDict
+import bar_matches
+import bar_notes
+from bar_matches import COEFF_METHODS
+from task_pool import at_worker_exit
+
+MEMO_FILE_EXTENSION = '.pairs'
+STATS_FILE_EXTENSION = '.stats'
+# Version of the scores in the memo's files, a digest of the source of the scoring methods and the bars they score, so
+# that the scores of a previous version of the code are never reused. The files of each version are named after it.
+MEMO_VERSION = hashlib.blake2b(''.join(inspect.getsource(module) for module in [bar_matches, bar_notes]).encode('utf-8'), digest_size=8).hexdigest()
+# Number of new entries a process collects before writing them to the memo directory for other workers and runs.
+FLUSH_ENTRIES = 1 << 14
+# Number of misses after which a process looks for entries written to the memo directory by other workers.
+SYNC_MISSES = 1 << 12
+STATS_KEYS = ['lookups', 'hits', 'loaded', 'written', 'evictions']
+
+# Table of each pair memo used in this process, by the run it was created for.
+memo_tables = {}
+
+
+# Memo of the scores of pairs of bars across the tunes of a corpus, which folk tunes share many bars with (cadences,
+# rolls, standard figures). A pair is keyed by its scorer's method, beat strength coefficient (for the methods that
+# depend on it) and eighth notes per bar, the canonical shapes of its bars, i.e. their rhythm and pitches relative to
+# their first note (see bar_matches.bar_fingerprint), and the difference between their first notes. Each process keeps
+# the most recently used max_entries pairs in a table, and the processes of a run and later runs share their entries
+# through files in memo_dir, which is kept within max_size_mb. Each process loads at most max_entries entries from the
+# files of the current version, newest first, so a process reads no more of the directory than fits in its table. The
+# memo only holds its settings, so it can be passed to worker processes, which make their own table on first use.
+class PairMemo:
+    def __init__(self, memo_dir, max_entries=1 << 20, max_size_mb=256):
+        self.memo_dir = memo_dir
+        self.max_entries = max_entries
+        self.max_size = max_size_mb * 1024 * 1024
+        self.run_id = uuid.uuid4().hex
+        os.makedirs(memo_dir, exist_ok=True)
+
+    # Function to return the table of this process, making it on first use.
+    def table(self):
+        table = memo_tables.get(self.run_id)
+        if table is None:
+            table = MemoTable(self)
+            memo_tables[self.run_id] = table
+        return table
+
+    # Function to compute the part of the key of a pair that depends on the scorer.
+    def scorer_key(self, scorer):
+        beat_strength_coeff = scorer.beat_strength_coeff if scorer.method in COEFF_METHODS else None
+        return scorer.method, beat_strength_coeff, scorer.eighth_notes_per_bar, bar_matches.EXCLUDE_SHORT_NOTES
+
+    # Function to compute the key of a bar shape, a digest that is the same in every process.
+    def shape_key(self, shape):
+        return hashlib.blake2b(repr(shape).encode('utf-8'), digest_size=12).digest()
+
+    # Function to write the entries and counts of the table of this process, if it has one.
+    def close(self):
+        table = memo_tables.pop(self.run_id, None)
+        if table is not None:
+            table.close()
+
+    # Function to return the counts of the run over all of its processes: lookups, hits, entries loaded from and
+    # written to the memo directory, and entries evicted from the tables. Worker processes write their counts when
+    # they stop, so the pool must have been shut down, and the table of this process closed.
+    def report(self):
+        stats = dict.fromkeys(STATS_KEYS, 0)
+        for entry in os.scandir(self.memo_dir):
+            if entry.name.startswith(self.run_id) and entry.name.endswith(STATS_FILE_EXTENSION):
+                try:
+                    with open(entry.path, 'r') as file:
+                        process_stats = json.load(file)
+                    os.remove(entry.path)
+                except (OSError, ValueError):
+                    continue
+                for key in STATS_KEYS:
+                    stats[key] += process_stats.get(key, 0)
+        return stats
+
+    # Function to remove the files of entries of other versions, then the oldest files of the current version, until
+    # the memo directory is within its size limit.
+    def evict(self):
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.memo_dir):
+            if entry.name.endswith(MEMO_FILE_EXTENSION):
+                stat = entry.stat()
+                entries.append((entry.name.startswith(MEMO_VERSION + '-'), stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+        entries.sort()
+        for current, mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+
+
+# Least recently used table of pair scores of one process, loaded with the entries in the memo directory. The new
+# entries of the process are written there in batches, and when the worker process stops.
+class MemoTable:
+    def __init__(self, memo):
+        self.memo = memo
+        self.entries = OrderedDict()
+        self.new_entries = {}
+        self.seen_files = set()
+        self.misses = 0
+        self.stats = dict.fromkeys(STATS_KEYS, 0)
+        self.sync()
+        at_worker_exit(self.close)
+
+    # Function to return the scores of a pair, or None if they are not in the memo.
+    def get(self, key):
+        self.stats['lookups'] += 1
+        scores = self.entries.get(key)
+        if scores is None:
+            self.misses += 1
+            if self.misses < SYNC_MISSES:
+                return None
+            self.sync()
+            scores = self.entries.get(key)
+            if scores is None:
+                return None
+        self.entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return scores
+
+    # Function to add the scores of a pair to the memo.
+    def put(self, key, scores):
+        self.insert(key, scores)
+        self.new_entries[key] = scores
+        if len(self.new_entries) >= FLUSH_ENTRIES:
+            self.flush()
+
+    def insert(self, key, scores):
+        self.entries[key] = scores
+        if len(self.entries) > self.memo.max_entries:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    # Function to load the files of entries of the current version written to the memo directory since the last time,
+    # newest first, while the table has room. The loaded entries are less recently used than those already in the
+    # table, and the files that do not fit are skipped without being read.
+    def sync(self):
+        self.misses = 0
+        files = []
+        for entry in os.scandir(self.memo.memo_dir):
+            if entry.name.startswith(MEMO_VERSION + '-') and entry.name.endswith(MEMO_FILE_EXTENSION) and entry.name not in self.seen_files:
+                try:
+                    files.append((entry.stat().st_mtime, entry.name, entry.path))
+                except OSError:
+                    continue
+        for mtime, name, path in sorted(files, reverse=True):
+            self.seen_files.add(name)
+            if len(self.entries) >= self.memo.max_entries:
+                continue
+            try:
+                with open(path, 'rb') as file:
+                    version, entries = pickle.load(file)
+            except Exception:
+                continue
+            if version != MEMO_VERSION:
+                continue
+            for key, scores in entries.items():
+                if len(self.entries) >= self.memo.max_entries:
+                    break
+                if key not in self.entries:
+                    self.entries[key] = scores
+                    self.entries.move_to_end(key, last=False)
+                    self.stats['loaded'] += 1
+
+    # Function to write the new entries of this process to the memo directory, along with its counts.
+    def flush(self):
+        if self.new_entries:
+            name = MEMO_VERSION + '-' + str(os.getpid()) + '-' + uuid.uuid4().hex + MEMO_FILE_EXTENSION
+            write_file(os.path.join(self.memo.memo_dir, name), pickle.dumps((MEMO_VERSION, self.new_entries), protocol=pickle.HIGHEST_PROTOCOL))
+            self.seen_files.add(name)
+            self.stats['written'] += len(self.new_entries)
+            self.new_entries = {}
+        stats_name = self.memo.run_id + '-' + str(os.getpid()) + STATS_FILE_EXTENSION
+        write_file(os.path.join(self.memo.memo_dir, stats_name), json.dumps(self.stats).encode('utf-8'))
+
+    def close(self):
+        try:
+            self.flush()
+        except OSError:
+            pass
+
+
+# Function to write a file through a temporary file, so that other processes never read a partially written file.
+def write_file(path, data):
+    temp_path = path + '.' + str(os.getpid()) + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+# Function to print the counts of a run of a pair memo.
+def print_memo_report(stats):
+    hit_rate = stats['hits'] / stats['lookups'] if stats['lookups'] else 0.0
+    print(f"Pair memo: {stats['hits']} of {stats['lookups']} lookups hit ({hit_rate:.1%}), {stats['loaded']} entries "
+          f"loaded and {stats['written']} written, {stats['evictions']} evicted")
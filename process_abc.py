@@ -1,4 +1,16 @@
 import re
+import argparse
+import csv
+from itertools import chain
+
+# Patterns of the cleaner: header field lines such as 'K:G', and macro definitions such as 'm: T = ~g2', whose letter is
+# removed from the tune body.
+FIELD_LINE = re.compile(r'[A-Z]:')
+MACRO_LINE = re.compile(r'm:\s*([A-Z])')
+REMOVE_W = str.maketrans('', '', 'W')
+# Changes made by the cleaner, counted per tune: macro definitions removed, macro letters removed from the body, '::'
+# repeats substituted, 'W's and '"   ~"' annotations removed.
+CLEAN_CHANGES = ['macros', 'macro_letters', 'repeats', 'w', 'annotations']
 
 # Function to extract the tune number and title from its ABC representation.
 def extract_abc_info(abc_string):
@@ -46,45 +58,141 @@ def remove_macros(abc_string):
 
 
 def clean_abc(abc_content):
-    # Remove ABC macros
-    abc_content = remove_macros(abc_content)
-    # Substitute repeat shorthand.
-    abc_content = abc_content.replace("::", ":||:")
-    # Remove strange characters.
-    lines = abc_content.split('\n')
-    # Remove all instances of W
+    return clean_tune(abc_content)[0]
+
+
+# Function to clean a tune, returning the cleaned tune and its changes. Most tunes contain nothing to clean, which four
+# substring searches establish without splitting them into lines.
+def clean_tune(abc_content):
+    if 'm:' not in abc_content and '::' not in abc_content and 'W' not in abc_content and '"   ~"' not in abc_content:
+        return abc_content, dict.fromkeys(CLEAN_CHANGES, 0)
+    return clean_tune_lines(abc_content.split('\n'))
+
+
+# Function to clean the lines of a tune in a single pass, with the same result as remove_macros followed by the
+# substitutions of the original clean_abc: macro letters are removed from the lines that are not header fields, macro
+# definitions are dropped, '::' repeats are written as ':||:', and 'W's and '"   ~"' annotations are removed from the
+# lines that are not header fields. Returns the cleaned tune and the number of changes of each kind (see CLEAN_CHANGES).
+def clean_tune_lines(lines):
+    letters = set()
+    for line in lines:
+        if line.startswith('m:'):
+            match = MACRO_LINE.search(line)
+            if match:
+                letters.add(match.group(1))
+    macro_table = str.maketrans('', '', ''.join(letters)) if letters else None
+    changes = dict.fromkeys(CLEAN_CHANGES, 0)
     processed_lines = []
     for line in lines:
-        if not re.search("^[A-Z]:", line):
-            line = line.replace('W', '')
-            line = line.replace('\"   ~\"', '')
-            #line = line.replace('M: C |', 'M:4/4')
-            processed_lines.append(line)
-        else:
-            processed_lines.append(line)
-    processed_string = '\n'.join(processed_lines)
-    return processed_string
+        if macro_table is not None and not FIELD_LINE.match(line):
+            stripped = line.translate(macro_table)
+            changes['macro_letters'] += len(line) - len(stripped)
+            line = stripped
+        if line.startswith('m:'):
+            changes['macros'] += 1
+            continue
+        # Substitute repeat shorthand.
+        if '::' in line:
+            changes['repeats'] += line.count('::')
+            line = line.replace('::', ':||:')
+        # Remove strange characters.
+        if not FIELD_LINE.match(line):
+            if 'W' in line:
+                stripped = line.translate(REMOVE_W)
+                changes['w'] += len(line) - len(stripped)
+                line = stripped
+            if '"   ~"' in line:
+                changes['annotations'] += line.count('"   ~"')
+                line = line.replace('"   ~"', '')
+        processed_lines.append(line)
+    return '\n'.join(processed_lines), changes
 
 
 # Function to read the contents of an abc file, strip any header material that does not form part of a description of a
 # tune, and return a list containing a string for each tune in the abc file.
 def read_abc_file(file_path):
-    with open(file_path, 'r') as file:
-        content = file.read()
-    # Split the content into lines
-    lines = content.split('\n')
+    return list(iter_abc_file(file_path))
+
+
+# Function to stream the tunes of an abc file one at a time, without reading the whole file into memory. Tunes are
+# separated by blank lines, and any header material before the first metadata field is skipped. If clean is set, the
+# tunes are cleaned as they are read, as clean_abc does, and report, if given, is called with each cleaned tune and the
+# changes made to it.
+def iter_abc_file(file_path, clean=False, report=None):
+    tunes = read_tunes(file_path)
+    if not clean:
+        return tunes
+    return clean_tunes(tunes, report)
+
+
+# Function to clean a stream of tunes, passing each cleaned tune and its changes to report if it is given.
+def clean_tunes(tunes, report=None):
+    for tune in tunes:
+        tune, changes = clean_tune(tune)
+        if report is not None:
+            report(tune, changes)
+        yield tune
+
+
+# Function to stream the tunes of an abc file, as iter_abc_file does without cleaning them.
+def read_tunes(file_path):
     # List of common metadata fields in .abc files
     metadata_fields = {'X:', 'T:', 'M:', 'K:', 'L:', 'Q:', 'C:', 'R:', 'N:', 'P:'}
-    # Identify the end of the header section
-    header_end_index = 0
-    for i, line in enumerate(lines):
-        if line.strip()[:2] in metadata_fields:
-            header_end_index = i
-            break
-    # The tunes start at the header end index
-    tunes_content = '\n'.join(lines[header_end_index:])
-    # Split the remaining content into tunes based on double newlines (indicating a blank line)
-    tunes = tunes_content.strip().split('\n\n')
-    # Clean up any extra newlines or leading/trailing spaces in each tune
-    tunes = [tune.strip() for tune in tunes if tune.strip()]
-    return tunes
+    with open(file_path, 'r') as file:
+        # Hold back the lines before the first metadata field; they are only part of the tunes if there is none.
+        header = []
+        for line in file:
+            line = line.rstrip('\n')
+            if line.strip()[:2] in metadata_fields:
+                break
+            header.append(line)
+        else:
+            yield from split_tunes(header)
+            return
+        yield from split_tunes(chain([line], (line.rstrip('\n') for line in file)))
+
+
+# Function to group lines into tunes at blank lines, yielding each tune without leading or trailing whitespace.
+def split_tunes(lines):
+    tune_lines = []
+    for line in lines:
+        if line:
+            tune_lines.append(line)
+            continue
+        tune = '\n'.join(tune_lines).strip()
+        if tune:
+            yield tune
+        tune_lines = []
+    tune = '\n'.join(tune_lines).strip()
+    if tune:
+        yield tune
+
+
+# Function to write the changes the cleaner makes to each tune of an abc file to a CSV file, returning the total number
+# of changes of each kind.
+def write_clean_report(in_file, report_file):
+    totals = dict.fromkeys(CLEAN_CHANGES, 0)
+    with open(report_file, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Tune', 'Title'] + CLEAN_CHANGES)
+
+        def report(tune, changes):
+            if any(changes.values()):
+                title, number = extract_abc_info(tune)
+                writer.writerow([number, title] + [changes[change] for change in CLEAN_CHANGES])
+                for change in CLEAN_CHANGES:
+                    totals[change] += changes[change]
+
+        for tune in iter_abc_file(in_file, clean=True, report=report):
+            pass
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the changes the cleaner makes to each tune of an abc file.")
+    parser.add_argument("-i", "--input", help="Input file", default='ONeills1001.abc')
+    parser.add_argument("-o", "--output", help="CSV file to which to write the changes of each tune", default='clean_report.csv')
+    args = parser.parse_args()
+
+    totals = write_clean_report(args.input, args.output)
+    print(", ".join(f"{change} {count}" for change, count in totals.items()))
@@ -1,4 +1,3 @@
-import subprocess
 import matplotlib.pyplot as plt
 import pandas as pd
 import math
@@ -7,7 +6,15 @@ import json
 import argparse
 import numpy as np
 import csv
-from actual_vs_predicted_counts import compute_cm_values, visualize_confusion_matrix
+from actual_vs_predicted_counts import visualize_confusion_matrix
+from analyse_melodic_structures import main as analyse
+from evaluation import load_ground_truth, evaluate, evaluate_files, result_rows
+from task_pool import WorkerPool
+
+OUTPUT_DIR = 'comparison_Feb2025'
+BEAT_STRENGTH_COEFF = math.pow(10, 0.2)
+FULL_MATCH_THRESHOLD = 5/6
+VARIANT_MATCH_THRESHOLD = 3/6
 
 method_mapping = {
     0: "Basic Method",
@@ -25,47 +32,52 @@ method_mapping = {
 def round_up_to_nearest_10(number):
     return math.ceil(number / 10) * 10
 
-def run_analysis():
-    results = []
+# Function to get the output file of a method, written as an artifact of the comparison.
+def output_file(method):
+    return f"{OUTPUT_DIR}/output{method}.csv"
 
-    for x in [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]:
-        output_filename = f"comparison_Feb2025/output{x}.csv"
-        
-        subprocess.run(["python3", "analyse_melodic_structures.py", "-m", str(x), "-o", output_filename])
-        
-        result = subprocess.run(["python3", "compare_with_doherty.py", "-i", output_filename], 
-                                capture_output=True, text=True)
-        
-        try:
-            agreement = float(result.stdout.strip())
-            results.append((method_mapping[x], agreement))
-        except ValueError:
-            print(f"Could not extract agreement percentage for method {x}. Output: {result.stdout}")
-    
-    return results, output_filename
 
+# Function to analyse the tunes with every method in a single pass over the corpus, in a shared pool of worker
+# processes, and evaluate the rows of each method in memory against the ground truth. The output files are only written
+# as artifacts. A tune on which a method raises an error is only left out of that method's rows and recorded in the
+# errors file of the outputs, so each method is evaluated on the same tunes as a run of that method alone.
+def run_analysis(in_file='ONeills1001.abc', ground_truth_file='Detail1.csv', pool=None):
+    methods = list(method_mapping)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    method_results = analyse(in_file, f"{OUTPUT_DIR}/output{{method}}.csv", methods[0], BEAT_STRENGTH_COEFF,
+                             FULL_MATCH_THRESHOLD, VARIANT_MATCH_THRESHOLD, methods, pool=pool, collect=True)
+    ground_truth = load_ground_truth(ground_truth_file)
+    evaluations = {method: evaluate(result_rows(rows), ground_truth) for method, rows in zip(methods, method_results)}
+    results = [(method_mapping[method], evaluations[method]['agreement']) for method in methods]
+    return results, evaluations
 
-def confusion_matrices():
+
+# Function to evaluate the output files written by an earlier run against the ground truth.
+def load_evaluations(ground_truth_file='Detail1.csv'):
+    evaluations = evaluate_files([output_file(method) for method in method_mapping], load_ground_truth(ground_truth_file))
+    return {method: evaluations[output_file(method)] for method in method_mapping}
+
+
+def confusion_matrices(evaluations):
     f1_data = [['Method', "Full Match", "Variant Match", "No Match", "Weighted Average"]]
     fig, axes = plt.subplots(4, 3, figsize=(15, 20))  # Create a 4x3 grid for better A4 fit
     axes = axes.flatten()  # Flatten the 2D array for easy indexing
     
     for x in range(10):  # Loop over the 10 plots
-        output_filename = f"comparison_Feb2025/output{x}.csv"
-        cm_values, f1 = compute_cm_values(output_filename)
-        visualize_confusion_matrix(cm_values, str(method_mapping[x]).removesuffix(' Method'), axes[x])
+        evaluation = evaluations[x]
+        visualize_confusion_matrix(np.array(evaluation['confusion_matrix']), str(method_mapping[x]).removesuffix(' Method'), axes[x])
         
-        f1_data.append([method_mapping[x]] + f1)
+        f1_data.append([method_mapping[x]] + evaluation['f1'])
     
     # Hide unused subplot
     for i in range(10, 12):  # Hide the last two empty subplots
         fig.delaxes(axes[i])
     
     plt.tight_layout()
-    plt.savefig("comparison_Feb2025/confusion_matrices_grid.png", dpi=300)
-    print("Confusion matrix grid has been saved as 'comparison_Feb2025/confusion_matrices_grid.png'")
+    plt.savefig(f"{OUTPUT_DIR}/confusion_matrices_grid.png", dpi=300)
+    print(f"Confusion matrix grid has been saved as '{OUTPUT_DIR}/confusion_matrices_grid.png'")
     
-    save_results(f1_data, 'CSV', 'comparison_Feb2025/f1_scores.csv')
+    save_results(f1_data, 'CSV', f"{OUTPUT_DIR}/f1_scores.csv")
 
 
 def save_results(results, filetype, filename='comparison_Feb2025/analysis_results.json'):
@@ -122,20 +134,24 @@ def create_chart(data):
 def main():
     parser = argparse.ArgumentParser(description="Analyze melodic structures and create comparison chart.")
     parser.add_argument("-l", "--load", help="Load results from a JSON file instead of running analysis")
+    parser.add_argument("-i", "--input", help="Input file", default='ONeills1001.abc')
+    parser.add_argument("-g", "--ground-truth", help="Ground truth structures", default='Detail1.csv')
     args = parser.parse_args()
 
     if args.load:
         print(f"Loading results from {args.load}")
         results = load_results(args.load)
+        evaluations = load_evaluations(args.ground_truth)
     else:
         print("Running analysis...")
-        results, output_filename = run_analysis()
+        with WorkerPool() as pool:
+            results, evaluations = run_analysis(args.input, args.ground_truth, pool)
         save_results(results, 'JSON')
 
     if results:
         create_chart(results)
-        confusion_matrices()
-        
+        confusion_matrices(evaluations)
+
     else:
         print("Error: No results to create chart.")
 
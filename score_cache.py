@@ -0,0 +1,74 @@
+import hashlib
+import os
+import music21
+from music21 import freezeThaw
+
+CACHE_FILE_EXTENSION = '.m21'
+
+
+# On-disk cache of repeat-expanded music21 scores, keyed by a hash of the cleaned ABC text and the music21 version so
+# that a tune is only parsed again when its ABC or the parser changes. The least recently used scores are evicted once
+# the cache grows beyond max_size_mb.
+class ScoreCache:
+    def __init__(self, cache_dir, max_size_mb=1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Function to compute the cache key of a tune from its cleaned ABC text.
+    def key(self, abc_content):
+        digest = hashlib.sha256()
+        digest.update(music21.VERSION_STR.encode('utf-8'))
+        digest.update(b'\n')
+        digest.update(abc_content.encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_FILE_EXTENSION)
+
+    # Function to return the cached expanded score for a key, or None if it is not cached or cannot be read.
+    def load(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            thawer = freezeThaw.StreamThawer()
+            thawer.openStr(data)
+        except Exception:
+            return None
+        # Mark the entry as recently used.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return thawer.stream
+
+    # Function to store an expanded score. The score is serialised in place, so it must not be used afterwards.
+    def store(self, key, score):
+        freezer = freezeThaw.StreamFreezer(score, fastButUnsafe=True)
+        data = freezer.writeStr(fmt='pickle')
+        path = self.path(key)
+        # Write to a temporary file first so that other workers never read a partially written entry.
+        temp_path = path + '.' + str(os.getpid()) + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    # Function to remove the least recently used entries until the cache is within its size limit.
+    def evict(self):
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(CACHE_FILE_EXTENSION):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
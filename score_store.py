@@ -0,0 +1,259 @@
+import os
+import json
+import argparse
+import numpy as np
+from tqdm import tqdm
+
+# Per-pair columns of the store and their types. The full and partial match scores are kept at full precision, as the
+# structures depend on exact comparisons with the thresholds and between scores; the transposition amounts are whole
+# numbers or infinity.
+SCORE_COLUMNS = {'full': np.float64, 'partial': np.float64, 'transposition': np.float32}
+SCORES_FILE = 'scores.json'
+
+
+# Function to get the file of a score column of a scoring method in a store.
+def column_file(store_dir, column, scoring_method):
+    return os.path.join(store_dir, f"{column}{scoring_method}.npy")
+
+
+# Columnar store of the raw full match, partial match and transposition scores of every pair of bars of every tune in a
+# corpus with one or more scoring methods, from which the structures can be decided again with other thresholds
+# without parsing or scoring the tunes. The pairs of a tune are stored in the order of the score rows of analyse_tune,
+# bar k against bars 0 to k - 1, and the columns are memory-mapped so that worker processes share their pages.
+class ScoreStore:
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, SCORES_FILE), 'r') as file:
+            info = json.load(file)
+        self.methods = info['methods']
+        self.beat_strength_coeff = info['beat_strength_coeff']
+        self.tunes = info['tunes']
+        self.pair_start = np.load(os.path.join(store_dir, 'pair_start.npy'), mmap_mode='r')
+        self.columns = {(column, method): np.load(column_file(store_dir, column, method), mmap_mode='r')
+                        for column in SCORE_COLUMNS for method in self.methods}
+
+    def __len__(self):
+        return len(self.tunes)
+
+    # Function to return the score rows of a stored tune with a scoring method, in the form used by analyse_tune.
+    def score_rows(self, index, scoring_method):
+        tune_info = self.tunes[index]
+        error = tune_info['errors'].get(str(scoring_method))
+        if error is not None:
+            raise ValueError("Tune " + str(tune_info['number']) + " could not be scored: " + error)
+        start, end = self.pair_start[index:index + 2].tolist()
+        num_bars = sum(tune_info['part_lengths'])
+        score_rows = []
+        for column in SCORE_COLUMNS:
+            scores = self.columns[column, scoring_method][start:end].tolist()
+            score_rows.append([scores[k * (k - 1) // 2:k * (k + 1) // 2] for k in range(num_bars)])
+        return score_rows
+
+
+# Opened stores, so that each worker process maps a store only once.
+open_stores = {}
+
+
+def open_score_store(store_dir):
+    if store_dir not in open_stores:
+        open_stores[store_dir] = ScoreStore(store_dir)
+    return open_stores[store_dir]
+
+
+# Function to parse a tune, or read it from a note store, and compute its score rows with each scoring method, sharing
+# the alignment of each pair of bars between the methods. A method that raises an error on the tune gives its error
+# message in place of its scores.
+def score_tune(item, SCORING_METHODS, BEAT_STRENGTH_COEFF, note_store_dir=None, score_cache=None, engine='matrix', native=False, cleaned=False):
+    from analyse_melodic_structures import parse_tune
+    from bar_matches import make_scorer
+    from note_store import open_note_store
+    from structure_analysis import tune_score_rows
+    from task_pool import set_stage
+    if note_store_dir is None:
+        tune_name, tune_number, tune_notes, part_labels, eighth_notes_per_bar = parse_tune(item, score_cache, native, cleaned)
+    else:
+        tune_name, tune_number, tune_notes, part_labels, eighth_notes_per_bar = open_note_store(note_store_dir).tune(item)
+    set_stage('score')
+    alignments = {}
+    method_scores = []
+    for SCORING_METHOD in SCORING_METHODS:
+        try:
+            score_rows = tune_score_rows(tune_notes, [make_scorer(SCORING_METHOD, eighth_notes_per_bar, BEAT_STRENGTH_COEFF)], alignments, engine)[0]
+        except Exception as e:
+            method_scores.append(type(e).__name__ + ": " + str(e))
+            continue
+        method_scores.append([np.array([score for row in rows for score in row], dtype=dtype)
+                              for rows, dtype in zip(score_rows, SCORE_COLUMNS.values())])
+    return tune_name, tune_number, part_labels, eighth_notes_per_bar, [len(part) for part in tune_notes], method_scores
+
+
+# Function to write a score store from an iterable of scored tunes, each either a tuple returned by score_tune or a
+# (tune_number, error message) pair for tunes that could not be parsed.
+def write_score_store(store_dir, SCORING_METHODS, BEAT_STRENGTH_COEFF, scored_tunes):
+    os.makedirs(store_dir, exist_ok=True)
+    columns = {(column, method): [] for column in SCORE_COLUMNS for method in SCORING_METHODS}
+    pair_start = [0]
+    tunes = []
+    for scored_tune in scored_tunes:
+        if len(scored_tune) == 2:
+            tune_number, error = scored_tune
+            tunes.append({'name': None, 'number': tune_number, 'part_labels': [], 'eighth_notes_per_bar': 0,
+                          'part_lengths': [], 'errors': {str(method): error for method in SCORING_METHODS}})
+            pair_start.append(pair_start[-1])
+            continue
+        tune_name, tune_number, part_labels, eighth_notes_per_bar, part_lengths, method_scores = scored_tune
+        num_bars = sum(part_lengths)
+        num_pairs = num_bars * (num_bars - 1) // 2
+        errors = {}
+        for method, scores in zip(SCORING_METHODS, method_scores):
+            if isinstance(scores, str):
+                errors[str(method)] = scores
+                # Keep the pairs of the tune aligned across methods.
+                scores = [np.zeros(num_pairs, dtype=dtype) for dtype in SCORE_COLUMNS.values()]
+            for column, values in zip(SCORE_COLUMNS, scores):
+                columns[column, method].append(values)
+        tunes.append({'name': tune_name, 'number': tune_number, 'part_labels': part_labels,
+                      'eighth_notes_per_bar': eighth_notes_per_bar, 'part_lengths': part_lengths, 'errors': errors})
+        pair_start.append(pair_start[-1] + num_pairs)
+    for (column, method), values in columns.items():
+        dtype = SCORE_COLUMNS[column]
+        np.save(column_file(store_dir, column, method), np.concatenate(values) if values else np.zeros(0, dtype=dtype))
+    np.save(os.path.join(store_dir, 'pair_start.npy'), np.array(pair_start, dtype=np.int64))
+    with open(os.path.join(store_dir, SCORES_FILE), 'w') as file:
+        json.dump({'methods': SCORING_METHODS, 'beat_strength_coeff': BEAT_STRENGTH_COEFF, 'tunes': tunes}, file)
+
+
+# Function to parse and score every tune in an ABC file, or a note store, with each scoring method and write the scores
+# to a score store.
+def save(in_file, store_dir, SCORING_METHODS, BEAT_STRENGTH_COEFF, note_store_dir=None, cache_dir=None, cache_size=1024, engine='matrix', native=False, batch_size=16, max_in_flight=None, timeout=300):
+    from note_store import open_note_store
+    from process_abc import extract_abc_info, iter_abc_file
+    from score_cache import ScoreCache
+    from task_pool import ordered_map, TaskError, WorkerPool
+    score_cache = ScoreCache(cache_dir, cache_size) if cache_dir else None
+    if note_store_dir is None:
+        items = iter_abc_file(in_file, clean=True)
+        tune_number = lambda item: extract_abc_info(item)[1]
+    else:
+        items = range(len(open_note_store(note_store_dir)))
+        tune_number = lambda item: open_note_store(note_store_dir).tunes[item]['number']
+    with WorkerPool() as pool:
+        scored_tunes = ordered_map(pool, score_tune, items, SCORING_METHODS, BEAT_STRENGTH_COEFF, note_store_dir, score_cache, engine, native, True, batch_size=batch_size, max_in_flight=max_in_flight, timeout=timeout)
+        # Tunes that cannot be parsed or time out are stored with their error.
+        scored_tunes = ((tune_number(result.item), result.error) if isinstance(result, TaskError) else result for result in scored_tunes)
+        write_score_store(store_dir, SCORING_METHODS, BEAT_STRENGTH_COEFF, tqdm(scored_tunes, desc='Scoring tunes.'))
+    if score_cache is not None:
+        score_cache.evict()
+
+
+# Function to decide the structures of a stored tune with a scoring method at every pair of full and variant match
+# thresholds, returning the output rows of the tune at each pair, indexed by full and variant threshold.
+def redecide_tune(index, store_dir, SCORING_METHOD, full_thresholds, variant_thresholds):
+    from structure_analysis import analyse_tune
+    store = open_score_store(store_dir)
+    tune_info = store.tunes[index]
+    score_rows = store.score_rows(index, SCORING_METHOD)
+    # The notes of the bars are not needed with the stored scores, only the number of bars in each part.
+    tune_notes = [[None] * part_length for part_length in tune_info['part_lengths']]
+    return [[analyse_tune(tune_notes, tune_info['name'], tune_info['number'], tune_info['eighth_notes_per_bar'], tune_info['part_labels'], SCORING_METHOD, store.beat_strength_coeff, full_match_threshold, variant_match_threshold, score_rows=score_rows)
+             for variant_match_threshold in variant_thresholds]
+            for full_match_threshold in full_thresholds]
+
+
+# Function to decide the structures of every tune in a score store with each stored scoring method at a single pair of
+# thresholds, writing one output file per method as analyse_melodic_structures does.
+def redecide(store_dir, out_file, full_match_threshold, variant_match_threshold, SCORING_METHODS=None, batch_size=64, max_in_flight=None):
+    from analyse_melodic_structures import method_output_file
+    from task_pool import ordered_map, TaskError, WorkerPool
+    store = open_score_store(store_dir)
+    methods = SCORING_METHODS or store.methods
+    with WorkerPool() as pool:
+        for method in methods:
+            with open(method_output_file(out_file, method) if len(methods) > 1 else out_file, 'w') as outputfile:
+                outputfile.write("Tune,Title,Part,Structure" + "\n")
+                results = ordered_map(pool, redecide_tune, range(len(store)), store_dir, method, [full_match_threshold], [variant_match_threshold], batch_size=batch_size, max_in_flight=max_in_flight)
+                for result in tqdm(results, desc=f'Deciding structures with method {method}.'):
+                    # Tunes that could not be scored are left out of the output, as in the original run.
+                    if not isinstance(result, TaskError):
+                        outputfile.write("".join(result[0][0]))
+
+
+# Function to decide the structures of every tune in a score store with each stored scoring method at every pair of
+# thresholds and evaluate each pair against the ground truth, writing a CSV file of the agreement, F1 scores, precision
+# and recall of each method and pair of thresholds.
+def redecide_curves(store_dir, out_file, ground_truth_file, full_thresholds, variant_thresholds, SCORING_METHODS=None, batch_size=64, max_in_flight=None):
+    from analyse_melodic_structures import method_output_file
+    from evaluation import load_ground_truth
+    from sweep import SweepCounts, write_sweep
+    from task_pool import ordered_map, TaskError, WorkerPool
+    store = open_score_store(store_dir)
+    methods = SCORING_METHODS or store.methods
+    ground_truth = load_ground_truth(ground_truth_file)
+    method_counts = {}
+    with WorkerPool() as pool:
+        for method in methods:
+            counts = SweepCounts([store.beat_strength_coeff], full_thresholds, variant_thresholds)
+            results = ordered_map(pool, redecide_tune, range(len(store)), store_dir, method, full_thresholds, variant_thresholds, batch_size=batch_size, max_in_flight=max_in_flight)
+            for result in tqdm(results, desc=f'Deciding structures with method {method}.'):
+                if not isinstance(result, TaskError):
+                    counts.add([result], ground_truth)
+            method_counts[method] = counts
+    for method, counts in method_counts.items():
+        write_sweep(counts, method_output_file(out_file, method) if len(methods) > 1 else out_file)
+    return method_counts
+
+
+if __name__ == "__main__":
+    from analyse_melodic_structures import parse_methods
+    from structure_analysis import ENGINES
+    from sweep import parse_grid
+    import math
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    save_parser = subparsers.add_parser("save", help="Score every pair of bars of every tune in an ABC file and save the raw scores to a score store")
+    save_parser.add_argument("-i", "--input", help="Input file", default='ONeills1001.abc')
+    save_parser.add_argument("-s", "--store", help="Score the tunes in a note store (see note_store.py extract) instead of the input file", default=None)
+    save_parser.add_argument("-o", "--output", help="Score store directory", default='score_store')
+    save_parser.add_argument("-M", "--methods", help="Methods to score, e.g. 0-9 or 0,3,6-8", default='0')
+    save_parser.add_argument("-b", "--bs_coeff", help="Beat strength coefficient", type=float, default=math.pow(10, 0.2))
+    save_parser.add_argument("-e", "--engine", help="Bar scoring engine", choices=ENGINES, default='matrix')
+    save_parser.add_argument("-n", "--native", help="Read the notes of common tunes with the native ABC reader instead of music21",
+                             action="store_true")
+    save_parser.add_argument("-c", "--cache-dir", help="Directory in which to cache parsed, repeat-expanded scores", default=None)
+    save_parser.add_argument("--cache-size", help="Maximum size of the score cache in MB", type=float, default=1024)
+    save_parser.add_argument("--batch-size", help="Number of tunes sent to a worker process at a time", type=int, default=16)
+    save_parser.add_argument("--max-in-flight", help="Maximum number of batches submitted to the worker processes at a time "
+                                                     "(default: 4 per CPU)", type=int, default=None)
+    save_parser.add_argument("-t", "--timeout", help="Seconds after which the scoring of a tune is abandoned and stored "
+                                                     "as an error (0 for no limit)", type=float, default=300)
+    redecide_parser = subparsers.add_parser("redecide", help="Decide the structures of the tunes in a score store with new thresholds")
+    redecide_parser.add_argument("-d", "--store", help="Score store directory", default='score_store')
+    redecide_parser.add_argument("-o", "--output", help="Output file, with {method} replaced by the method if several are "
+                                                        "stored, or with -g the CSV file of the evaluations", default='melodic_structures.csv')
+    redecide_parser.add_argument("-M", "--methods", help="Stored methods to use (default: all)", default=None)
+    redecide_parser.add_argument("-f", "--full_match_thresholds", help="Full match thresholds, as a comma-separated list or start:stop:number",
+                                 default='5/6')
+    redecide_parser.add_argument("-v", "--variant_match_thresholds", help="Variant match thresholds, as a comma-separated list or start:stop:number",
+                                 default='3/6')
+    redecide_parser.add_argument("-g", "--ground-truth", help="Evaluate every pair of thresholds against these ground truth "
+                                                              "structures instead of writing the structures", default=None)
+    redecide_parser.add_argument("--batch-size", help="Number of tunes sent to a worker process at a time", type=int, default=64)
+    redecide_parser.add_argument("--max-in-flight", help="Maximum number of batches submitted to the worker processes at a time "
+                                                         "(default: 4 per CPU)", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "save":
+        save(args.input, args.output, parse_methods(args.methods), args.bs_coeff, args.store, args.cache_dir, args.cache_size,
+             args.engine, args.native, args.batch_size, args.max_in_flight, args.timeout)
+    elif args.command == "redecide":
+        methods = parse_methods(args.methods) if args.methods else None
+        full_thresholds = parse_grid(args.full_match_thresholds)
+        variant_thresholds = parse_grid(args.variant_match_thresholds)
+        if args.ground_truth:
+            redecide_curves(args.store, args.output, args.ground_truth, full_thresholds, variant_thresholds, methods,
+                            args.batch_size, args.max_in_flight)
+        elif len(full_thresholds) > 1 or len(variant_thresholds) > 1:
+            parser.error("several thresholds can only be evaluated against a ground truth (-g)")
+        else:
+            redecide(args.store, args.output, full_thresholds[0], variant_thresholds[0], methods, args.batch_size,
+                     args.max_in_flight)
@@ -1,109 +1,190 @@
-from bar_matches import bar_match_scores
+from bar_matches import make_scorer, BarIndex, COEFF_METHODS
+from bar_matrix import score_matrices, coefficient_score_matrices, bound_matrices
+from bar_candidates import candidate_bars, candidate_stats
+from array import array
+from collections import defaultdict
 import re
 
+# Scoring engines: 'scalar' scores each pair of bars as it is compared, 'matrix' scores all pairs of bars of a tune at
+# once with NumPy and falls back to the scalar engine for tunes it cannot score exactly.
+ENGINES = ['scalar', 'matrix']
+# Score the pairs of bars of the scalar engine through a BarIndex, so that exact repeats and transpositions of earlier
+# pairs are not scored again.
+USE_BAR_INDEX = True
+# Skip the scoring of pairs of bars of the scalar engine whose upper bounds (see bound_matrices) show that they cannot
+# beat the best match found so far for the current bar, or the thresholds.
+USE_PRUNING = True
+# Margin allowed for rounding error between an upper bound and the score it bounds.
+PRUNE_EPSILON = 1E-9
+
+# Counts of the pairs of bars compared by analyse_tune with pruning in this process and of those whose scoring was
+# skipped, by scoring method.
+prune_stats = defaultdict(lambda: {'pairs': 0, 'pruned': 0})
+# Delimiter after each bar of a part, by its position in a group of eight bars.
+DELIMITERS = ["", ", ", "", "; ", "", ", ", "", "."]
+
 
 # Function to generate Doherty melodic structures for each part in a passed tune represented as a nested list
-# of MIDI notes.
-def analyse_tune(tune_notes, tune_name, tune_number, eighth_notes_per_bar, part_labels, SCORING_METHOD, BEAT_STRENGTH_COEFF, full_match_threshold, variant_match_threshold):
-    delimiter_options = {0: "",
-                         1: ", ",
-                         2: "",
-                         3: "; ",
-                         4: "",
-                         5: ", ",
-                         6: "",
-                         7: "."}
-    part_patterns = {}
-    part_num = 0
+# of MIDI notes. Passing the same alignments dict to several calls for one tune reuses the note alignment of each pair
+# of bars across scoring methods. Score rows computed beforehand (see tune_score_rows) can be passed to decide the
+# structures with other thresholds without scoring the bars again. If candidates is set, each bar is only compared with
+# that many of the earlier bars most similar to it (see candidate_bars), an approximation for very long tunes. A pair
+# memo can be passed to share the scores of pairs of bars of the scalar engine across tunes (see pair_memo.PairMemo).
+def analyse_tune(tune_notes, tune_name, tune_number, eighth_notes_per_bar, part_labels, SCORING_METHOD, BEAT_STRENGTH_COEFF, full_match_threshold, variant_match_threshold, alignments=None, engine='scalar', score_rows=None, candidates=None, pair_memo=None):
+    bars = [bar for part in tune_notes for bar in part]
+    scorer = make_scorer(SCORING_METHOD, eighth_notes_per_bar, BEAT_STRENGTH_COEFF)
+    if score_rows is None and engine == 'matrix':
+        score_rows = score_matrices(bars, scorer)
+    prune = score_rows is None and USE_PRUNING
+    if prune:
+        full_bound_rows, partial_bound_rows = bound_matrices(bars, scorer)
+        method_prune_stats = prune_stats[SCORING_METHOD]
+    if score_rows is None and USE_BAR_INDEX:
+        # Score the pairs of bars through an index of the tune's bars, so that repeated pairs are scored once.
+        scorer = BarIndex(scorer, bars, pair_memo)
+    candidate_rows = None
+    if candidates:
+        candidate_rows = candidate_bars(bars, eighth_notes_per_bar, candidates)
+    # The patterns of the bars of the tune, in integer arrays indexed by the bar's index across all parts: the code of
+    # the pattern's letter, its variant number (0 for none), the part whose label prefixes it (-1 for none) and the number
+    # of variants of it found so far. The structure strings are only rendered from them once every bar is assigned.
+    pattern_letters = array('i')
+    variant_numbers = array('i')
+    prefix_parts = array('i')
+    variant_counters = array('i')
+    # The index of the first bar of each part, and the part of each bar.
+    part_starts = []
+    bar_parts = array('i')
     curr_letters = {}
-    for part in tune_notes:
+    # Index of the current bar across all parts, as used by the score matrices.
+    bar_index = 0
+    for part_num, part in enumerate(tune_notes):
         if is_variant(part_labels[part_num]):
             curr_letter = curr_letters.get(strip_variant_number(part_labels[part_num]))
         else:
             curr_letter = 'a'
-        if part_num not in part_patterns:
-            part_patterns[part_num] = {}
-        bar_num = 0
+        part_starts.append(bar_index)
+        # The part whose label prefixes a pattern matched in each earlier part, which is none for the current part and
+        # parts without a label.
+        letter_prefixes = [-1 if prev_part_num == part_num or part_labels[prev_part_num] == "" else prev_part_num
+                           for prev_part_num in range(part_num + 1)]
         for bar in part:
-            delimiter = delimiter_options[bar_num % 8]
-            full_match_pattern = {}
-            partial_match_pattern = {}
             # Reset the best match values to the threshold values.
             best_full_match_score = full_match_threshold
             best_partial_match_score = variant_match_threshold
             best_transposition_amount = float('inf')
             full_match = False
             partial_match = False
-            variant_part = None
+            # The earlier bars of the best full match and the best variant match.
+            full_match_bar = None
             variant_bar = None
-            for prev_part_num in part_patterns:
-                letter_prefix = '' if part_num == prev_part_num else part_labels[prev_part_num]
-                # Loop over the bars in the previous parts and compare for commonality.
-                for prev_bar_num, prev_bar in part_patterns[prev_part_num].items():
-                    full_match_score, partial_match_score, transposition_amount = bar_match_scores(bar, prev_bar['notes'], eighth_notes_per_bar, SCORING_METHOD, BEAT_STRENGTH_COEFF)
-                    # Identical or near-identical to previous pattern.
-                    if full_match_score >= best_full_match_score:
-                        full_match = True
-                        best_full_match_score = full_match_score
-                        if part_patterns[prev_part_num][prev_bar_num]['prefix'] == "":
-                            prefix = letter_prefix
-                        else:
-                            prefix = part_patterns[prev_part_num][prev_bar_num]['prefix']
-                        full_match_pattern = {'notes': bar,
-                                              'letter': part_patterns[prev_part_num][prev_bar_num]['letter'],
-                                              'suffix': part_patterns[prev_part_num][prev_bar_num]['suffix'],
-                                              'delimiter': delimiter,
-                                              'prefix': prefix,
-                                              'variant_counter': 0}
-                    # Variant of a previous pattern.
-                    elif (not full_match and ((partial_match_score > best_partial_match_score) or
-                          (abs(partial_match_score - best_partial_match_score) < 1E-16
-                           and transposition_amount < best_transposition_amount))):
-                        # Exclude matches with other variants.
-                        if part_patterns[prev_part_num][prev_bar_num]['suffix'] == "":
-                            partial_match = True
-                            best_partial_match_score = partial_match_score
-                            best_transposition_amount = transposition_amount
-                            # Determine suffix number with variant counter.
-                            variant_part = prev_part_num
-                            variant_bar = prev_bar_num
-                            partial_match_pattern = {'notes': bar,
-                                                     'letter': part_patterns[prev_part_num][prev_bar_num]['letter'],
-                                                     'suffix': '',
-                                                     'delimiter': delimiter,
-                                                     'prefix': letter_prefix,
-                                                     'variant_counter': 0}
+            if score_rows is not None:
+                full_match_row, partial_match_row, transposition_row = [rows[bar_index] for rows in score_rows]
+            if prune:
+                full_bound_row, partial_bound_row = full_bound_rows[bar_index], partial_bound_rows[bar_index]
+            # Loop over the bars in the previous parts and compare for commonality.
+            for prev_bar_index in range(bar_index):
+                if candidate_rows is not None:
+                    candidate_stats['pairs'] += 1
+                    if prev_bar_index not in candidate_rows[bar_index]:
+                        continue
+                    candidate_stats['candidates'] += 1
+                if prune:
+                    method_prune_stats['pairs'] += 1
+                    # Skip pairs which can neither reach the best full match score, which a later pair with an equal
+                    # score replaces, nor beat or tie the best partial match score while there is no full match.
+                    if (full_bound_row[prev_bar_index] + PRUNE_EPSILON < best_full_match_score and
+                            (full_match or partial_bound_row[prev_bar_index] + PRUNE_EPSILON < best_partial_match_score)):
+                        method_prune_stats['pruned'] += 1
+                        continue
+                if score_rows is None:
+                    full_match_score, partial_match_score, transposition_amount = scorer.match_scores(bar, bars[prev_bar_index], alignments)
+                else:
+                    full_match_score = full_match_row[prev_bar_index]
+                    partial_match_score = partial_match_row[prev_bar_index]
+                    transposition_amount = transposition_row[prev_bar_index]
+                # Identical or near-identical to previous pattern.
+                if full_match_score >= best_full_match_score:
+                    full_match = True
+                    best_full_match_score = full_match_score
+                    full_match_bar = prev_bar_index
+                # Variant of a previous pattern.
+                elif (not full_match and ((partial_match_score > best_partial_match_score) or
+                      (abs(partial_match_score - best_partial_match_score) < 1E-16
+                       and transposition_amount < best_transposition_amount))):
+                    # Exclude matches with other variants.
+                    if variant_numbers[prev_bar_index] == 0:
+                        partial_match = True
+                        best_partial_match_score = partial_match_score
+                        best_transposition_amount = transposition_amount
+                        variant_bar = prev_bar_index
             if full_match:
-                part_patterns[part_num][bar_num] = full_match_pattern
+                pattern_letters.append(pattern_letters[full_match_bar])
+                variant_numbers.append(variant_numbers[full_match_bar])
+                if prefix_parts[full_match_bar] < 0:
+                    prefix_parts.append(letter_prefixes[bar_parts[full_match_bar]])
+                else:
+                    prefix_parts.append(prefix_parts[full_match_bar])
             elif partial_match:
-                part_patterns[part_num][bar_num] = partial_match_pattern
-                part_patterns[variant_part][variant_bar]['variant_counter'] += 1
-                part_patterns[part_num][bar_num]['suffix'] = str(part_patterns[variant_part][variant_bar]['variant_counter'])
+                # Determine suffix number with variant counter.
+                variant_counters[variant_bar] += 1
+                pattern_letters.append(pattern_letters[variant_bar])
+                variant_numbers.append(variant_counters[variant_bar])
+                prefix_parts.append(letter_prefixes[bar_parts[variant_bar]])
             else:
                 # New unique pattern.
-                part_patterns[part_num][bar_num] = {'notes': bar,
-                                                    'letter': curr_letter,
-                                                    'suffix': "",
-                                                    'delimiter': delimiter,
-                                                    'prefix': "",
-                                                    'variant_counter': 0}
+                pattern_letters.append(ord(curr_letter))
+                variant_numbers.append(0)
+                prefix_parts.append(-1)
                 curr_letter = chr(ord(curr_letter) + 1)
-            bar_num += 1
+            variant_counters.append(0)
+            bar_parts.append(part_num)
+            bar_index += 1
             # Store current value of current_letter.
             curr_letters[part_labels[part_num]] = curr_letter
-        part_num += 1
+    part_starts.append(bar_index)
     output = []
-    for part, tune_label in zip(part_patterns.values(), part_labels):
-        structure = ""
-        for bar in part.values():
-            if tune_label[0] == bar['prefix']:
-                structure += bar['letter'] + bar['suffix'] + bar['delimiter']
-            else:
-                structure += bar['prefix'] + bar['letter'] + bar['suffix'] + bar['delimiter']
-        output.append(tune_number + "," + tune_name + "," + tune_label + ",\"" + structure + "\"\n")
+    for part_num, tune_label in zip(range(len(tune_notes)), part_labels):
+        structure = []
+        for bar_num, pattern_index in enumerate(range(part_starts[part_num], part_starts[part_num + 1])):
+            prefix = "" if prefix_parts[pattern_index] < 0 else part_labels[prefix_parts[pattern_index]]
+            if tune_label[0] != prefix:
+                structure.append(prefix)
+            structure.append(chr(pattern_letters[pattern_index]))
+            if variant_numbers[pattern_index]:
+                structure.append(str(variant_numbers[pattern_index]))
+            structure.append(DELIMITERS[bar_num % 8])
+        output.append(tune_number + "," + tune_name + "," + tune_label + ",\"" + "".join(structure) + "\"\n")
     return output
 
 
+# Function to compute the score rows of the bars of a tune with each of several scorers of one scoring method, which
+# differ only in their beat strength coefficient: three lists of rows, where row k holds the full match, partial match
+# and transposition scores of bar k against bars 0 to k - 1, as analyse_tune uses them. Methods whose scores do not
+# depend on the coefficient are scored once and their rows shared.
+def tune_score_rows(tune_notes, scorers, alignments=None, engine='scalar'):
+    bars = [bar for part in tune_notes for bar in part]
+    if engine == 'matrix':
+        score_rows = coefficient_score_matrices(bars, scorers)
+        if score_rows is not None:
+            return score_rows
+    if scorers[0].method not in COEFF_METHODS:
+        scorers = scorers[:1] * len(scorers)
+    if alignments is None:
+        alignments = {}
+    scorer_rows = {}
+    for scorer in scorers:
+        if scorer not in scorer_rows:
+            bar_index = BarIndex(scorer, bars) if USE_BAR_INDEX else scorer
+            score_rows = [[], [], []]
+            for k, bar in enumerate(bars):
+                scores = [bar_index.match_scores(bar, prev_bar, alignments) for prev_bar in bars[:k]]
+                for rows, column in zip(score_rows, zip(*scores) if scores else ((), (), ())):
+                    rows.append(list(column))
+            scorer_rows[scorer] = score_rows
+    return [scorer_rows[scorer] for scorer in scorers]
+
+
 # Return true if the passed part or bar pattern is a variant.
 def is_variant(pattern):
     return any(char.isdigit() for char in pattern)
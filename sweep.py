@@ -0,0 +1,202 @@
+from fractions import Fraction
+from analyse_melodic_structures import parse_tune
+from bar_matches import make_scorer, CUSTOM_BEAT_STRENGTH
+from structure_analysis import analyse_tune, tune_score_rows, ENGINES
+from note_store import open_note_store
+from process_abc import iter_abc_file
+from score_cache import ScoreCache
+from task_pool import ordered_map, set_stage, TaskError, WorkerPool
+from evaluation import load_ground_truth, count_agreement, summarise_agreement, result_rows, MATCH_CLASSES
+from tqdm import tqdm
+import argparse
+import contextlib
+import csv
+import math
+import numpy as np
+
+# Beat strength coefficients compared by beat_strength_coeff_comparison.sh.
+DEFAULT_BS_COEFFS = '0.1,0.5,1.0,2.0,3.0,3.16228,4.0,5.0,7.0,10.0,20.0'
+
+
+# Function to convert a grid such as "0.5,1,2", "5/6,4/6" or "1:20:39" (start:stop:number of values) into a list of
+# values.
+def parse_grid(grid_string):
+    if ':' in grid_string:
+        start, stop, num = grid_string.split(':')
+        return np.linspace(float(Fraction(start)), float(Fraction(stop)), int(num)).tolist()
+    return [float(Fraction(value.strip())) for value in grid_string.split(',')]
+
+
+# Function to analyse a tune with one scoring method at every point of a grid of beat strength coefficients and full
+# and variant match thresholds. The tune is parsed once and its bars scored once per coefficient, all coefficients at
+# once where the matrix engine can, and the structures at each pair of thresholds are decided from the same scores.
+# Returns the output rows of the tune at each point, indexed by coefficient, full and variant threshold.
+def sweep_tune(item, SCORING_METHOD, bs_coeffs, full_thresholds, variant_thresholds, store_dir=None, score_cache=None, engine='matrix', native=False, cleaned=False):
+    if store_dir is None:
+        tune_name, tune_number, tune_notes, part_labels, eighth_notes_per_bar = parse_tune(item, score_cache, native, cleaned)
+    else:
+        tune_name, tune_number, tune_notes, part_labels, eighth_notes_per_bar = open_note_store(store_dir).tune(item)
+    set_stage('score')
+    scorers = [make_scorer(SCORING_METHOD, eighth_notes_per_bar, bs_coeff) for bs_coeff in bs_coeffs]
+    coeff_score_rows = tune_score_rows(tune_notes, scorers, engine=engine)
+    set_stage('analyse')
+    # Coefficients that share their score rows share their structures.
+    outputs = {}
+    results = []
+    for bs_coeff, score_rows in zip(bs_coeffs, coeff_score_rows):
+        if id(score_rows) not in outputs:
+            outputs[id(score_rows)] = [[analyse_tune(tune_notes, tune_name, tune_number, eighth_notes_per_bar, part_labels, SCORING_METHOD, bs_coeff, full_match_threshold, variant_match_threshold, score_rows=score_rows)
+                                        for variant_match_threshold in variant_thresholds]
+                                       for full_match_threshold in full_thresholds]
+        results.append(outputs[id(score_rows)])
+    return results
+
+
+# Agreement counts of every point of a sweep grid, accumulated tune by tune.
+class SweepCounts:
+    def __init__(self, bs_coeffs, full_thresholds, variant_thresholds):
+        self.bs_coeffs = bs_coeffs
+        self.full_thresholds = full_thresholds
+        self.variant_thresholds = variant_thresholds
+        shape = (len(bs_coeffs), len(full_thresholds), len(variant_thresholds))
+        self.same = np.zeros(shape, dtype=np.int64)
+        self.total = np.zeros(shape, dtype=np.int64)
+        self.confusion_matrices = np.zeros(shape + (3, 3), dtype=np.int64)
+
+    # Function to add the evaluation of the output rows of a tune at every grid point. Grid points with the same rows
+    # are evaluated once.
+    def add(self, tune_results, ground_truth):
+        counts = {}
+        for index in np.ndindex(self.same.shape):
+            rows = tune_results[index[0]][index[1]][index[2]]
+            key = tuple(rows)
+            if key not in counts:
+                counts[key] = count_agreement(result_rows([rows]), ground_truth)
+            same, total, confusion_matrix = counts[key]
+            self.same[index] += same
+            self.total[index] += total
+            self.confusion_matrices[index] += confusion_matrix
+
+    # Function to return the evaluation of each grid point, as (bs_coeff, full threshold, variant threshold, evaluation)
+    # tuples.
+    def evaluations(self):
+        return [(self.bs_coeffs[i], self.full_thresholds[j], self.variant_thresholds[k],
+                 summarise_agreement(int(self.same[i, j, k]), int(self.total[i, j, k]), self.confusion_matrices[i, j, k].tolist()))
+                for i, j, k in np.ndindex(self.same.shape)]
+
+    def agreement(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.total > 0, self.same / self.total * 100, 0.0)
+
+
+# Function to analyse a corpus with one scoring method at every point of the grid in a pool of worker processes and
+# evaluate each point against the ground truth. Returns the counts of the grid and the number of tunes that could not
+# be analysed.
+def sweep(in_file, ground_truth_file, SCORING_METHOD, bs_coeffs, full_thresholds, variant_thresholds, store_dir=None, cache_dir=None, cache_size=1024, engine='matrix', native=False, batch_size=16, max_in_flight=None, timeout=300, pool=None):
+    ground_truth = load_ground_truth(ground_truth_file)
+    score_cache = ScoreCache(cache_dir, cache_size) if cache_dir else None
+    counts = SweepCounts(bs_coeffs, full_thresholds, variant_thresholds)
+    if store_dir is None:
+        items = iter_abc_file(in_file, clean=True)
+    else:
+        items = range(len(open_note_store(store_dir)))
+    num_errors = 0
+    with WorkerPool() if pool is None else contextlib.nullcontext(pool) as pool:
+        results = ordered_map(pool, sweep_tune, items, SCORING_METHOD, bs_coeffs, full_thresholds, variant_thresholds, store_dir, score_cache, engine, native, True,
+                              batch_size=batch_size, max_in_flight=max_in_flight, timeout=timeout)
+        for result in tqdm(results, desc='Sweeping tunes.'):
+            if isinstance(result, TaskError):
+                num_errors += 1
+            else:
+                counts.add(result, ground_truth)
+    if score_cache is not None:
+        score_cache.evict()
+    return counts, num_errors
+
+
+# Function to write the evaluation of each grid point to a CSV file.
+def write_sweep(counts, out_file):
+    with open(out_file, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['bs_coeff', 'full_match_threshold', 'variant_match_threshold', 'agreement', 'same', 'total'] +
+                        ['f1_' + match_class.lower() for match_class in MATCH_CLASSES + ['Weighted']] +
+                        [measure + '_' + match_class.lower() for measure in ['precision', 'recall'] for match_class in MATCH_CLASSES])
+        for bs_coeff, full_match_threshold, variant_match_threshold, evaluation in counts.evaluations():
+            writer.writerow([bs_coeff, full_match_threshold, variant_match_threshold, evaluation['agreement'],
+                             evaluation['same'], evaluation['total']] + evaluation['f1'] + evaluation['precision'] + evaluation['recall'])
+
+
+# Function to plot the agreement at each grid point as heatmaps of beat strength coefficient against full match
+# threshold, one per variant match threshold.
+def plot_sweep(counts, plot_file):
+    import matplotlib.pyplot as plt
+    agreement = counts.agreement()
+    num_plots = len(counts.variant_thresholds)
+    num_columns = math.ceil(math.sqrt(num_plots))
+    num_rows = math.ceil(num_plots / num_columns)
+    fig, axes = plt.subplots(num_rows, num_columns, figsize=(6 * num_columns, 5 * num_rows), squeeze=False)
+    axes = axes.flatten()
+    for k, variant_match_threshold in enumerate(counts.variant_thresholds):
+        ax = axes[k]
+        image = ax.imshow(agreement[:, :, k], aspect='auto', origin='lower', cmap='viridis',
+                          vmin=agreement.min(), vmax=agreement.max())
+        ax.set_xticks(range(len(counts.full_thresholds)), [f"{value:.3g}" for value in counts.full_thresholds], rotation=90)
+        ax.set_yticks(range(len(counts.bs_coeffs)), [f"{value:.3g}" for value in counts.bs_coeffs])
+        ax.set_xlabel("Full match threshold")
+        ax.set_ylabel("Beat strength coefficient")
+        ax.set_title(f"Variant match threshold {variant_match_threshold:.3g}")
+        fig.colorbar(image, ax=ax, label="Agreement (%)")
+    for k in range(num_plots, len(axes)):
+        fig.delaxes(axes[k])
+    plt.tight_layout()
+    plt.savefig(plot_file, dpi=150)
+    plt.close(fig)
+
+
+# Function to print the grid points with the highest agreement.
+def print_best(counts, num_best=5):
+    evaluations = sorted(counts.evaluations(), key=lambda point: -point[3]['agreement'])
+    print(f"{'bs_coeff':>10s} {'full':>8s} {'variant':>8s} {'agreement':>10s} {'F1':>8s}")
+    for bs_coeff, full_match_threshold, variant_match_threshold, evaluation in evaluations[:num_best]:
+        print(f"{bs_coeff:10.4g} {full_match_threshold:8.4g} {variant_match_threshold:8.4g} {evaluation['agreement']:10.2f} {evaluation['f1'][-1]:8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a scoring method over a grid of beat strength coefficients and "
+                                                 "full and variant match thresholds, parsing and scoring each tune once.")
+    parser.add_argument("-i", "--input", help="Input file", default='ONeills1001.abc')
+    parser.add_argument("-s", "--store", help="Sweep the tunes in a note store (see note_store.py extract) instead of the input file", default=None)
+    parser.add_argument("-g", "--ground-truth", help="Ground truth structures", default='Detail1.csv')
+    parser.add_argument("-o", "--output", help="CSV file to which to write the evaluation of each grid point", default='sweep.csv')
+    parser.add_argument("-p", "--plot", help="Image file to which to write heatmaps of the agreement", default=None)
+    parser.add_argument("-m", "--method", help="Method", type=int, default=CUSTOM_BEAT_STRENGTH)
+    parser.add_argument("-b", "--bs_coeffs", help="Beat strength coefficients, as a comma-separated list or start:stop:number",
+                        default=DEFAULT_BS_COEFFS)
+    parser.add_argument("-f", "--full_match_thresholds", help="Full match thresholds, as a comma-separated list or start:stop:number",
+                        default='5/6')
+    parser.add_argument("-v", "--variant_match_thresholds", help="Variant match thresholds, as a comma-separated list or start:stop:number",
+                        default='3/6')
+    parser.add_argument("-e", "--engine", help="Bar scoring engine", choices=ENGINES, default='matrix')
+    parser.add_argument("-n", "--native", help="Read the notes of common tunes with the native ABC reader instead of music21",
+                        action="store_true")
+    parser.add_argument("-c", "--cache-dir", help="Directory in which to cache parsed, repeat-expanded scores", default=None)
+    parser.add_argument("--cache-size", help="Maximum size of the score cache in MB", type=float, default=1024)
+    parser.add_argument("--batch-size", help="Number of tunes sent to a worker process at a time", type=int, default=16)
+    parser.add_argument("--max-in-flight", help="Maximum number of batches submitted to the worker processes at a time "
+                                                "(default: 4 per CPU)", type=int, default=None)
+    parser.add_argument("-t", "--timeout", help="Seconds after which the sweep of a tune is abandoned (0 for no limit)",
+                        type=float, default=300)
+    args = parser.parse_args()
+
+    counts, num_errors = sweep(args.input, args.ground_truth, args.method, parse_grid(args.bs_coeffs),
+                               parse_grid(args.full_match_thresholds), parse_grid(args.variant_match_thresholds),
+                               args.store, args.cache_dir, args.cache_size, args.engine, args.native, args.batch_size,
+                               args.max_in_flight, args.timeout)
+    if num_errors:
+        print(f"{num_errors} tunes could not be analysed with method {args.method}")
+    write_sweep(counts, args.output)
+    print(f"Evaluations of {counts.same.size} grid points written to {args.output}")
+    if args.plot:
+        plot_sweep(counts, args.plot)
+        print(f"Heatmaps written to {args.plot}")
+    print_best(counts)
@@ -0,0 +1,344 @@
+import collections
+import cProfile
+import concurrent.futures
+import multiprocessing
+import multiprocessing.connection
+import os
+import pstats
+import signal
+import threading
+import time
+
+# Longest stage name recorded by a worker.
+STAGE_LENGTH = 32
+PROFILE_FILE_EXTENSION = '.prof'
+
+# Stage of the task being run in this process, and the shared buffer through which a worker reports it to the pool.
+current_stage = ''
+stage_buffer = None
+# Wall and CPU time spent in each stage of the task being run, if it is being timed, and when the current stage started.
+stage_times = None
+stage_started = (0.0, 0.0)
+# Functions run by a worker process when the pool stops it, for example to write out state it has accumulated.
+exit_handlers = []
+
+
+# Error recorded instead of the result of an item whose function raised or timed out, with the stage it was in and the
+# time it had run for.
+TaskError = collections.namedtuple('TaskError', ['item', 'stage', 'error', 'elapsed'])
+
+
+# Function to register a function to run when the pool stops this worker process. Workers that are killed, because
+# their task timed out or the pool was cancelled, do not run them.
+def at_worker_exit(handler):
+    if handler not in exit_handlers:
+        exit_handlers.append(handler)
+
+
+# Raised in a task that runs past its timeout. It derives from BaseException, like KeyboardInterrupt, so that the
+# handlers that catch Exception on the task path to fall back or carry on do not swallow it.
+class TaskTimeout(BaseException):
+    pass
+
+
+# Raised for a task whose worker had to be killed because it did not finish in time, or that died while running it.
+class WorkerLost(Exception):
+    def __init__(self, message, stage, elapsed):
+        super().__init__(message)
+        self.stage = stage
+        self.elapsed = elapsed
+
+
+# Function to record the stage of the task being run, so that an error or timeout can be attributed to it, and the time
+# spent in each stage if the task is being timed.
+def set_stage(stage):
+    global current_stage
+    if stage_times is not None:
+        end_stage()
+    current_stage = stage
+    if stage_buffer is not None:
+        stage_buffer.value = stage.encode('utf-8')[:STAGE_LENGTH]
+
+
+# Function to add the wall and CPU time since the current stage started to its times.
+def end_stage():
+    global stage_started
+    now = (time.perf_counter(), time.process_time())
+    if current_stage:
+        times = stage_times.setdefault(current_stage, [0.0, 0.0])
+        times[0] += now[0] - stage_started[0]
+        times[1] += now[1] - stage_started[1]
+    stage_started = now
+
+
+def raise_timeout(signum, frame):
+    raise TaskTimeout(f"timed out in stage '{current_stage}'")
+
+
+# Function to run a function on an item, returning a TaskError instead of raising if it fails or runs for longer than
+# timeout seconds. The timeout interrupts the function with a signal, so the worker survives it. If timings is set, the
+# result is returned with the wall and CPU time spent in each stage of the function.
+def guarded_call(function, item, args, timeout=None, timings=False):
+    global stage_times
+    set_stage('')
+    if timings:
+        stage_times = {}
+        end_stage()
+    start = time.perf_counter()
+    if timeout:
+        previous_handler = signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        result = function(item, *args)
+    except (Exception, TaskTimeout) as e:
+        result = TaskError(None, current_stage, type(e).__name__ + ": " + str(e), time.perf_counter() - start)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    if not timings:
+        return result
+    end_stage()
+    times = stage_times
+    stage_times = None
+    return result, times
+
+
+# Function to split a stream of items into lists of batch_size items.
+def batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Function to run a function over a batch of items in a worker process, returning the list of results.
+def run_batch(batch, function, timeout, timings, *args):
+    return [guarded_call(function, item, args, timeout, timings) for item in batch]
+
+
+# Function to run in each worker process, running the tasks sent by the pool until it is told to stop. If profile_dir
+# is set, the tasks are profiled and the worker writes its profile there when it stops.
+def worker_loop(connection, stage, profile_dir=None):
+    global stage_buffer
+    stage_buffer = stage
+    # Interrupts are handled by the parent, which shuts the pool down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    profiler = cProfile.Profile() if profile_dir else None
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            task = None
+        if task is None:
+            for handler in exit_handlers:
+                try:
+                    handler()
+                except Exception:
+                    pass
+            if profiler is not None:
+                profiler.dump_stats(os.path.join(profile_dir, str(os.getpid()) + PROFILE_FILE_EXTENSION))
+            return
+        function, args = task
+        if profiler is not None:
+            profiler.enable()
+        try:
+            result = (True, function(*args))
+        except (Exception, TaskTimeout) as e:
+            result = (False, e)
+        if profiler is not None:
+            profiler.disable()
+        try:
+            connection.send(result)
+        except Exception as e:
+            connection.send((False, RuntimeError("could not return the result: " + type(e).__name__ + ": " + str(e))))
+
+
+class Worker:
+    def __init__(self, profile_dir=None):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.stage = multiprocessing.Array('c', STAGE_LENGTH, lock=False)
+        self.process = multiprocessing.Process(target=worker_loop, args=(child_connection, self.stage, profile_dir), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+# Process pool with the submit interface of concurrent.futures executors, in which a task can be given a timeout. The
+# worker running a task that exceeds its timeout, or that dies, is killed and replaced without affecting the tasks of
+# the other workers, and the task's future raises WorkerLost. If profile_dir is set, each worker writes a profile of its
+# tasks there when the pool shuts down (see merge_profiles).
+class WorkerPool:
+    def __init__(self, max_workers=None, profile_dir=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.profile_dir = profile_dir
+        self.tasks = collections.deque()
+        self.lock = threading.Lock()
+        self.shutting_down = False
+        self.cancelled = False
+        self.wakeup_reader, self.wakeup_writer = multiprocessing.Pipe(duplex=False)
+        self.workers = [Worker(profile_dir) for i in range(self.max_workers)]
+        # The future, start time and deadline of the task each busy worker is running.
+        self.running = {}
+        self.thread = threading.Thread(target=self.manage, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(cancel=exc_type is not None)
+        return False
+
+    def submit(self, function, *args, timeout=None):
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self.shutting_down:
+                raise RuntimeError("cannot submit tasks after shutdown")
+            self.tasks.append((future, function, args, timeout))
+        self.wakeup_writer.send(None)
+        return future
+
+    # Function to wait for the submitted tasks and stop the workers, or if cancel is set, to cancel the tasks and kill
+    # the workers.
+    def shutdown(self, cancel=False):
+        with self.lock:
+            self.shutting_down = True
+            self.cancelled = cancel
+            if cancel:
+                while self.tasks:
+                    self.tasks.popleft()[0].cancel()
+        self.wakeup_writer.send(None)
+        self.thread.join()
+        if cancel:
+            for worker in self.workers:
+                worker.kill()
+            return
+        for worker in self.workers:
+            try:
+                worker.connection.send(None)
+            except OSError:
+                pass
+        for worker in self.workers:
+            worker.process.join()
+            worker.connection.close()
+
+    # Function to kill a worker and start another in its place.
+    def replace(self, worker):
+        worker.kill()
+        self.workers[self.workers.index(worker)] = Worker(self.profile_dir)
+
+    # Function run by the pool's thread, which sends tasks to idle workers, collects their results and kills the
+    # workers whose tasks exceed their deadline.
+    def manage(self):
+        while True:
+            with self.lock:
+                if self.cancelled or self.shutting_down and not self.tasks and not self.running:
+                    return
+                idle = [worker for worker in self.workers if worker not in self.running]
+                while idle and self.tasks:
+                    future, function, args, timeout = self.tasks.popleft()
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    worker = idle.pop()
+                    try:
+                        worker.connection.send((function, args))
+                    except Exception as e:
+                        future.set_exception(e)
+                        idle.append(worker)
+                        continue
+                    start = time.monotonic()
+                    self.running[worker] = (future, start, start + timeout if timeout else None)
+            deadlines = [deadline for future, start, deadline in self.running.values() if deadline is not None]
+            wait_time = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            connections = {worker.connection: worker for worker in self.running}
+            for connection in multiprocessing.connection.wait([self.wakeup_reader] + list(connections), wait_time):
+                if connection is self.wakeup_reader:
+                    while self.wakeup_reader.poll():
+                        self.wakeup_reader.recv()
+                    continue
+                worker = connections[connection]
+                future, start, deadline = self.running.pop(worker)
+                try:
+                    succeeded, value = connection.recv()
+                except (EOFError, OSError):
+                    stage = worker.stage.value.decode('utf-8')
+                    self.replace(worker)
+                    future.set_exception(WorkerLost("worker died", stage, time.monotonic() - start))
+                    continue
+                if succeeded:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            now = time.monotonic()
+            for worker, (future, start, deadline) in list(self.running.items()):
+                if deadline is not None and now >= deadline:
+                    del self.running[worker]
+                    stage = worker.stage.value.decode('utf-8')
+                    self.replace(worker)
+                    future.set_exception(WorkerLost("timed out, worker killed", stage, now - start))
+
+
+# Function to merge the profiles written by the workers of a pool into a single pstats file.
+def merge_profiles(profile_dir, profile_file):
+    profile_files = [os.path.join(profile_dir, file_name) for file_name in sorted(os.listdir(profile_dir))
+                     if file_name.endswith(PROFILE_FILE_EXTENSION)]
+    if not profile_files:
+        return
+    stats = pstats.Stats(*profile_files)
+    stats.dump_stats(profile_file)
+
+
+# Function to get the results of a batch of items, attaching each item to its errors and passing the stage times of
+# each item to timings if it is set. If the batch failed as a whole, for example because its worker was lost, the
+# items are run again one at a time, so that only the item that caused it fails.
+def batch_results(pool, future, batch, function, timeout, timings, args):
+    try:
+        results = future.result()
+    except (Exception, TaskTimeout) as e:
+        if len(batch) == 1:
+            return [TaskError(batch[0], getattr(e, 'stage', ''), type(e).__name__ + ": " + str(e), getattr(e, 'elapsed', 0.0))]
+        retries = [submit_batch(pool, [item], function, timeout, timings, args) for item in batch]
+        return [batch_results(pool, retry, [item], function, timeout, timings, args)[0] for retry, item in zip(retries, batch)]
+    item_results = []
+    for item, result in zip(batch, results):
+        if timings is not None:
+            result, times = result
+            timings(item, times)
+        item_results.append(result._replace(item=item) if isinstance(result, TaskError) else result)
+    return item_results
+
+
+# Function to submit a batch of items to the pool. A batch is given time for each of its items to time out, after
+# which its worker is killed.
+def submit_batch(pool, batch, function, timeout, timings, args):
+    if timeout:
+        return pool.submit(run_batch, batch, function, timeout, timings is not None, *args, timeout=(len(batch) + 1) * timeout)
+    return pool.submit(run_batch, batch, function, timeout, timings is not None, *args)
+
+
+# Function to run a function over a stream of items in a pool, yielding the results in the order of the items.
+# At most max_in_flight batches are submitted ahead of the next result to be yielded, so the items are read lazily and
+# the results that complete out of order wait in a bounded reorder buffer rather than accumulating for the whole corpus.
+# The items are sent to the workers in batches of batch_size, one task per batch, which cuts the pickling and
+# inter-process overhead of small tasks. An item whose function raises, or runs for longer than timeout seconds, gives
+# a TaskError in place of its result, and the other items are unaffected. If timings is set, it is called with each
+# item and the wall and CPU time its function spent in each stage.
+def ordered_map(pool, function, items, *args, max_in_flight=None, batch_size=1, timeout=None, timings=None):
+    if max_in_flight is None:
+        max_in_flight = 4 * (os.cpu_count() or 1)
+    pending = collections.deque()
+    for batch in batched(items, batch_size):
+        pending.append((submit_batch(pool, batch, function, timeout, timings, args), batch))
+        if len(pending) >= max_in_flight:
+            yield from batch_results(pool, *pending.popleft(), function, timeout, timings, args)
+    while pending:
+        yield from batch_results(pool, *pending.popleft(), function, timeout, timings, args)
@@ -0,0 +1,81 @@
+import csv
+import json
+import os
+import numpy as np
+
+# Stages of the analysis of a tune, in the order in which they run (see set_stage).
+STAGES = ['clean', 'parse', 'expand', 'extract', 'analyse']
+PERCENTILES = [50, 90, 99]
+TUNES_FILE_SUFFIX = '_tunes.csv'
+
+
+# Function to summarise a column of times with its total, mean, percentiles and maximum.
+def summarise_times(values):
+    if len(values) == 0:
+        return {}
+    summary = {'total': float(values.sum()), 'mean': float(values.mean())}
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary['p' + str(percentile)] = float(value)
+    summary['max'] = float(values.max())
+    return summary
+
+
+# Per-tune, per-stage wall and CPU times of a corpus run, written as a JSON report of the aggregate percentiles of each
+# stage and the slowest tunes, and a CSV file of the times of every tune.
+class TimingReport:
+    def __init__(self):
+        self.tune_numbers = []
+        self.times = []
+        self.stages = list(STAGES)
+
+    # Function to add the stage times of a tune, a dict of stage to [wall, cpu] seconds.
+    def add(self, tune_number, stage_times):
+        self.tune_numbers.append(tune_number)
+        self.times.append(stage_times)
+        for stage in stage_times:
+            if stage not in self.stages:
+                self.stages.append(stage)
+
+    # Function to get the times of every tune as an array of tunes x stages x (wall, cpu).
+    def time_array(self):
+        times = np.zeros((len(self.times), len(self.stages), 2))
+        for tune_num, stage_times in enumerate(self.times):
+            for stage_num, stage in enumerate(self.stages):
+                if stage in stage_times:
+                    times[tune_num, stage_num] = stage_times[stage]
+        return times
+
+    # Function to write the JSON report to report_file and the times of every tune to a CSV file beside it, returning
+    # the report.
+    def write(self, report_file, slowest=20):
+        times = self.time_array()
+        totals = times.sum(axis=1)
+        report = {'tunes': len(self.times), 'stages': {}, 'total': {}, 'slowest': []}
+        for stage_num, stage in enumerate(self.stages):
+            report['stages'][stage] = {'wall': summarise_times(times[:, stage_num, 0]), 'cpu': summarise_times(times[:, stage_num, 1])}
+        report['total'] = {'wall': summarise_times(totals[:, 0]), 'cpu': summarise_times(totals[:, 1])}
+        for tune_num in np.argsort(-totals[:, 0], kind='stable')[:slowest]:
+            report['slowest'].append({'tune': self.tune_numbers[tune_num],
+                                      'wall': float(totals[tune_num, 0]),
+                                      'cpu': float(totals[tune_num, 1]),
+                                      'stages': {stage: float(times[tune_num, stage_num, 0]) for stage_num, stage in enumerate(self.stages)}})
+        with open(report_file, 'w') as file:
+            json.dump(report, file, indent=2)
+        with open(os.path.splitext(report_file)[0] + TUNES_FILE_SUFFIX, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Tune'] + [stage + '_' + clock for stage in self.stages for clock in ['wall', 'cpu']] + ['total_wall', 'total_cpu'])
+            for tune_number, tune_times, total in zip(self.tune_numbers, times, totals):
+                writer.writerow([tune_number] + [f"{value:.6f}" for value in tune_times.flatten()] + [f"{total[0]:.6f}", f"{total[1]:.6f}"])
+        return report
+
+
+# Function to print the aggregate wall times of each stage and the slowest tunes of a report.
+def print_timing_report(report, slowest=5):
+    print(f"{'Stage':10s} {'total s':>10s} {'mean ms':>10s} {'p50 ms':>10s} {'p90 ms':>10s} {'p99 ms':>10s} {'max ms':>10s}")
+    for stage, summary in list(report['stages'].items()) + [('total', report['total'])]:
+        wall = summary['wall']
+        if not wall:
+            continue
+        print(f"{stage:10s} {wall['total']:10.2f} " + " ".join(f"{wall[key] * 1E3:10.2f}" for key in ['mean', 'p50', 'p90', 'p99', 'max']))
+    for tune in report['slowest'][:slowest]:
+        print(f"Tune {tune['tune']}: {tune['wall'] * 1E3:.1f} ms")